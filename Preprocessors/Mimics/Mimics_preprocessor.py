@@ -3,17 +3,26 @@
 # File Name: Mimics_preprocessor.py
 # Author: Daniel Strack
 # E-Mail: dast@mpe.au.dk
-# Description: This is part of the Mimics preprocessing pipeline.
-# 
-# License: MIT License Copyright (c) 2024 Daniel Strack 
+# Description: This is part of the Mimics preprocessing pipeline. Translates the Abaqus export of a Mimics
+#              model into the PBMGA input layout: element sets Set_i with a solid section each, material
+#              Mat_i with the i-th highest Youngs modulus, *Density removed. The material and element set
+#              names are collected from a keyword index of the memory mapped file first, the renaming
+#              (zero index shift and ranking by modulus) is computed up front and the output is written
+#              in one pass. Only keyword lines are rewritten, the data blocks are copied unchanged.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
 # (Refer to the LICENSE file for details)
-# 
+#
 # Example Usage:
-# 
-# =============================================================================import re
+#     python Mimics_preprocessor.py (file_name and directory from config.py)
+#     The output for PBMGA ends on translated_reorderd_Set.inp
+# =============================================================================
+import re
 import os
+import mmap
 from config import file_name, directory
 
+COPY_CHUNK_BYTES = 16 * 1024 * 1024
 
 def extract_elset_number(name):
     match = re.search(r'MAT(\d+)', name, re.IGNORECASE)
@@ -23,243 +32,169 @@ def extract_elset_number(name):
     return match.group(1) if match else None
 
 def extract_material_number(name):
- 
+
     match = re.search(r'material(\d+)', name, re.IGNORECASE)
     return match.group(1) if match else None
 
-def extract_number(name):
-    match = re.search(r'(\d+)', name)
-    return match.group(1) if match else None
+def scan_keywords(mm):
+    # Keyword and comment lines with the byte range of the data lines that follow them
+    keywords = []
+    position = 0 if mm[:1] == b'*' else mm.find(b'\n*')
+    position = position + 1 if position > 0 else position
+    header_end = position if position >= 0 else len(mm)
+    while position >= 0:
+        if keywords:
+            keywords[-1][2] = position
+        line_end = mm.find(b'\n', position)
+        line_end = len(mm) if line_end < 0 else line_end
+        keywords.append([mm[position:line_end].decode('latin-1').strip(), min(line_end + 1, len(mm)), len(mm)])
+        next_keyword = mm.find(b'\n*', line_end)
+        position = next_keyword + 1 if next_keyword >= 0 else -1
+    return header_end, keywords
 
-# --- Preprocess the input file ---
-def preprocess_inp(input_file, output_file):
+def first_data_line(mm, start, end):
+    line_end = mm.find(b'\n', start, end)
+    return mm[start:end if line_end < 0 else line_end].decode('latin-1').strip()
+
+def collect_metadata(mm, keywords):
     elset_material_dict = {}
-    with open(input_file, 'r') as infile, open(output_file, 'w+') as outfile:
-        lines = infile.readlines()
-        # First pass: record the elset–material number associations from *SOLID SECTION lines
-        for line in lines:
-            if line.strip().upper().startswith('*SOLID SECTION'):
-                # Extract the ELSET and MATERIAL values
-                elset_match = re.search(r'ELSET=([^,]+)', line, re.IGNORECASE)
-                material_match = re.search(r'MATERIAL=([^,]+)', line, re.IGNORECASE)
-                if elset_match and material_match:
-                    elset_name = elset_match.group(1).strip()
-                    material_name = material_match.group(1).strip()
-                    elset_num = extract_elset_number(elset_name)
-                    material_num = extract_material_number(material_name)
-                    if elset_num is not None and material_num is not None:
-                        elset_material_dict[elset_num] = material_num
-        # Second pass: write out updated lines
-        i = 0
-        j = 0
-        pre_elset_name = None
-        while i < len(lines):
-            line = lines[i].strip()
-            # Process ELSET lines (those beginning with "*ELSET")
-            if line.upper().startswith('*ELSET'):
-                j += 1
-                elset_match = re.search(r'ELSET=([^,]+)', line, re.IGNORECASE)
-                if elset_match:
-                    elset_name = elset_match.group(1).strip()
-                    elset_num = extract_elset_number(elset_name)
-                    if elset_num:
-                        if j > 1 and pre_elset_name is not None:
-                            pre_mat_num = elset_material_dict.get(pre_elset_name)
-                            if pre_mat_num is not None:
-                                # Write the corresponding SOLID SECTION for the previous elset
-                                outfile.write(f"*SOLID SECTION, ELSET=Set_{pre_elset_name}, MATERIAL=tibia_dis_mat_material{pre_mat_num}\n")
-                        new_elset_name = f"Set_{elset_num}"
-                        outfile.write(f"*ELSET, ELSET={new_elset_name}, GENERATE\n")
-                        pre_elset_name = elset_num
-                    else:
-                        outfile.write(line + '\n')
-                else:
-                    outfile.write(line + '\n')
-                # Write out the element numbers until the next '*' line
-                i += 1
-                while i < len(lines) and not lines[i].strip().startswith('*'):
-                    outfile.write(lines[i])
-                    i += 1
-                continue
-            if line.upper().startswith('*END PART'):
-                if pre_elset_name is not None:
-                    pre_mat_num = elset_material_dict.get(pre_elset_name)
-                    if pre_mat_num is not None:
-                        outfile.write(f"*SOLID SECTION, ELSET=Set_{pre_elset_name}, MATERIAL=tibia_dis_mat_material{pre_mat_num}\n")
-                outfile.write(line + '\n')
-                i += 1
-                continue
-            # Process MATERIAL lines (e.g., "*MATERIAL, NAME=tibia_dis_mat_material0")
-            if line.upper().startswith('*MATERIAL'):
-                material_match = re.search(r'NAME=([^,\n]+)', line, re.IGNORECASE)
-                if material_match:
-                    material_name = material_match.group(1).strip()
-                    material_num = extract_material_number(material_name)
-                    if material_num:
-                        new_material_name = f"tibia_dis_mat_material{material_num}"
-                        outfile.write(f"*MATERIAL, NAME={new_material_name}\n")
-                    else:
-                        outfile.write(line + '\n')
-                else:
-                    outfile.write(line + '\n')
-                i += 1
-                continue
-            if line.startswith('** Section') or line.startswith(',') or line.upper().startswith('*SOLID SECTION'):
-                i += 1
-                continue
-            outfile.write(line + '\n')
-            i += 1
+    elset_numbers = []
+    material_numbers = []
+    moduli = {}
+    current_material = None
+    for keyword, start, end in keywords:
+        upper = keyword.upper()
+        if upper.startswith('*SOLID SECTION'):
+            elset_match = re.search(r'ELSET=([^,]+)', keyword, re.IGNORECASE)
+            material_match = re.search(r'MATERIAL=([^,]+)', keyword, re.IGNORECASE)
+            if elset_match and material_match:
+                elset_num = extract_elset_number(elset_match.group(1).strip())
+                material_num = extract_material_number(material_match.group(1).strip())
+                if elset_num is not None and material_num is not None:
+                    elset_material_dict[elset_num] = material_num
+        elif upper.startswith('*ELSET'):
+            elset_match = re.search(r'ELSET=([^,]+)', keyword, re.IGNORECASE)
+            elset_num = extract_elset_number(elset_match.group(1).strip()) if elset_match else None
+            if elset_num:
+                elset_numbers.append(elset_num)
+        elif upper.startswith('*MATERIAL'):
+            name_match = re.search(r'NAME\s*=\s*([^\s,]+)', keyword, re.IGNORECASE)
+            material_num = extract_material_number(name_match.group(1)) if name_match else None
+            current_material = ('number', material_num) if material_num else (('name', name_match.group(1)) if name_match else None)
+            if material_num:
+                material_numbers.append(material_num)
+        elif upper.startswith('*ELASTIC') and current_material:
+            modulus_line = first_data_line(mm, start, end)
+            try:
+                moduli[current_material] = float(modulus_line.split(',')[0].strip())
+            except ValueError:
+                print(f"Warning: could not parse modulus from line: {modulus_line}")
+            current_material = None
+    return elset_material_dict, elset_numbers, material_numbers, moduli
 
-# --- Remove density lines ---
-def remove_density_lines(inp_file_path):
-    with open(inp_file_path, 'r') as file:
-        lines = file.readlines()
-    modified_lines = []
-    skip_next_line = False
-    for i, line in enumerate(lines):
-        if '*DENSITY' in line.upper():
-            skip_next_line = True
-            continue
-        elif skip_next_line:
-            skip_next_line = False
-            continue
-        else:
-            modified_lines.append(line)
-    with open(inp_file_path, 'w') as file:
-        file.writelines(modified_lines)
-    print(f"Processed file saved to {inp_file_path}")
+class NameMapping:
+    # Final set and material names: zero indexed numbering is shifted by one, materials are ranked by
+    # descending modulus to Mat_1...Mat_n and the set of material i gets the number of its rank
+    def __init__(self, elset_material_dict, elset_numbers, material_numbers, moduli):
+        used_material_numbers = material_numbers + [elset_material_dict[number] for number in elset_numbers if number in elset_material_dict]
+        self.shift_materials = any(number.startswith('0') for number in used_material_numbers)
+        self.shift_sets = any(number.startswith('0') for number in elset_numbers)
+        print("Zero indexed materials found, updating materials" if self.shift_materials else "Material numbering remains unchanged")
+        print("Zero indexed sets found, updating sets" if self.shift_sets else "Set numbering remains unchanged")
 
-# --- Update numbering if a “zero‐index” exists ---
-def update_materials_in_line(line):
-    pattern = r'tibia_dis_mat_material(\d+)'
-    def replacement(match):
-        old_number = int(match.group(1))
-        new_number = old_number + 1
-        return f"tibia_dis_mat_material{new_number}"
-    return re.sub(pattern, replacement, line, flags=re.IGNORECASE)
+        ranked = sorted(moduli.items(), key=lambda item: item[1], reverse=True)
+        self.material_rank = {}
+        for rank, ((kind, value), modulus) in enumerate(ranked, start=1):
+            if kind == 'number':
+                self.material_rank[self.shifted(value, self.shift_materials)] = rank
+        self.set_rank = dict(self.material_rank)
+        print(f"Renaming {len(self.material_rank)} materials (and sets) based on descending Young's modulus")
 
-def update_sets_in_line(line):
-    pattern = r'Set_(\d+)'
-    def replacement(match):
-        old_number = int(match.group(1))
-        new_number = old_number + 1
-        return f"Set_{new_number}"
-    return re.sub(pattern, replacement, line)
+    @staticmethod
+    def shifted(number, shift):
+        return str(int(number) + 1) if shift else number
 
-def process_file(input_filename, output_filename):
-    with open(input_filename, 'r') as infile:
-        lines = infile.readlines()
-    update_materials_flag = any("tibia_dis_mat_material0" in line for line in lines)
-    update_sets_flag = any("Set_0" in line for line in lines)
-    if update_materials_flag:
-        print("Found 'tibia_dis_mat_material0' in the file. Updating materials...")
-    else:
-        print("No 'tibia_dis_mat_material0' found in the file. Materials remain unchanged.")
-    if update_sets_flag:
-        print("Found 'Set_0' in the file. Updating sets...")
-    else:
-        print("No 'Set_0' found in the file. Sets remain unchanged.")
-    updated_lines = []
-    for line in lines:
-        if update_materials_flag:
-            line = update_materials_in_line(line)
-        if update_sets_flag:
-            line = update_sets_in_line(line)
-        updated_lines.append(line)
-    with open(output_filename, 'w') as outfile:
-        outfile.writelines(updated_lines)
+    def material(self, number):
+        number = self.shifted(number, self.shift_materials)
+        return f"Mat_{self.material_rank[number]}" if number in self.material_rank else f"tibia_dis_mat_material{number}"
 
-# --- Extract Young's modulus values from *MATERIAL blocks ---
-def extract_material_moduli(filename):
-    materials = {}
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-    current_material = None
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        if stripped.upper().startswith("*MATERIAL"):
-            match = re.search(r'NAME\s*=\s*([^\s,]+)', stripped, re.IGNORECASE)
-            if match:
-                current_material = match.group(1)
-            else:
-                current_material = None
-        elif stripped.upper().startswith("*ELASTIC") and current_material:
-            if i + 1 < len(lines):
-                modulus_line = lines[i + 1].strip()
-                parts = modulus_line.split(',')
-                if parts:
-                    try:
-                        modulus = float(parts[0].strip())
-                        materials[current_material] = modulus
-                    except ValueError:
-                        print(f"Warning: could not parse modulus from line: {modulus_line}")
-            current_material = None
-    return materials, lines
+    def elset(self, number):
+        number = self.shifted(number, self.shift_sets)
+        return f"Set_{self.set_rank[number]}" if number in self.set_rank else f"Set_{number}"
 
-# --- Build new mappings based on descending modulus ---
-def build_mappings(materials):
-    sorted_materials = sorted(materials.items(), key=lambda item: item[1], reverse=True)
-    new_mat_mapping = {}
-    new_set_mapping = {}
-    for rank, (old_mat, modulus) in enumerate(sorted_materials, start=1):
-        new_mat = f"Mat_{rank}"
-        new_mat_mapping[old_mat] = new_mat
-        match = re.search(r'material(\d+)', old_mat, re.IGNORECASE)
-        if match:
-            number = match.group(1)
-            old_set = f"Set_{number}"
-            new_set = f"Set_{rank}"
-            new_set_mapping[old_set] = new_set
-    return new_mat_mapping, new_set_mapping, sorted_materials
+    def rename_line(self, line):
+        line = re.sub(r'tibia_dis_mat_material(\d+)', lambda match: self.material(match.group(1)), line, flags=re.IGNORECASE)
+        return re.sub(r'Set_(\d+)', lambda match: self.elset(match.group(1)), line)
 
-# --- Replace names throughout the file using the new mappings ---
-def replace_materials(line, mapping):
-    def mat_repl(match):
-        number = match.group(1)
-        old_mat = f"tibia_dis_mat_material{number}"
-        if old_mat in mapping:
-            return mapping[old_mat]
-        else:
-            return match.group(0)
-    return re.sub(r'tibia_dis_mat_material(\d+)', mat_repl, line, flags=re.IGNORECASE)
+def copy_range(mm, outfile, start, end):
+    for position in range(start, end, COPY_CHUNK_BYTES):
+        outfile.write(mm[position:min(position + COPY_CHUNK_BYTES, end)])
 
-def replace_sets(line, mapping):
-    def set_repl(match):
-        number = match.group(1)
-        old_set = f"Set_{number}"
-        if old_set in mapping:
-            return mapping[old_set]
-        else:
-            return match.group(0)
-    return re.sub(r'Set_(\d+)', set_repl, line)
-    
-def reorder_Set_and_Youngs(input_filename, output_filename):
-    materials, lines = extract_material_moduli(input_filename)
-    if not materials:
-        print("No material moduli found. Exiting without changes.")
+def copy_data_lines(mm, outfile, start, end, skip_first=False, skip_comma_lines=False):
+    # Small blocks (sections, density) are filtered line wise, all other data is copied as is
+    if not skip_first and not skip_comma_lines:
+        copy_range(mm, outfile, start, end)
         return
-    new_mat_mapping, new_set_mapping, sorted_materials = build_mappings(materials)
-    print("Renaming materials (and sets) based on descending Young's modulus:")
-    for old_mat, modulus in sorted_materials:
-        new_name = new_mat_mapping[old_mat]
-        print(f"  {old_mat} (modulus = {modulus}) -> {new_name}")
-    updated_lines = []
-    for line in lines:
-        line = replace_materials(line, new_mat_mapping)
-        line = replace_sets(line, new_set_mapping)
-        updated_lines.append(line)
-    with open(output_filename, 'w') as f:
-        f.writelines(updated_lines)
-    print(f"Processed file written to '{output_filename}'.")
+    lines = mm[start:end].splitlines(keepends=True)
+    if skip_first:
+        lines = lines[1:]
+    if skip_comma_lines:
+        lines = [line for line in lines if not line.startswith(b',')]
+    outfile.writelines(lines)
+
+def translate_mimics(input_file, output_file):
+    with open(input_file, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_end, keywords = scan_keywords(mm)
+        metadata = collect_metadata(mm, keywords)
+        elset_material_dict = metadata[0]
+        names = NameMapping(*metadata)
+
+        def write_line(line):
+            outfile.write((line + '\n').encode('latin-1'))
+
+        def write_section(elset_num):
+            material_num = elset_material_dict.get(elset_num)
+            if material_num is not None:
+                write_line(f"*SOLID SECTION, ELSET={names.elset(elset_num)}, MATERIAL={names.material(material_num)}")
+
+        with open(output_file, 'wb') as outfile:
+            copy_range(mm, outfile, 0, header_end)
+            pre_elset_name = None
+            for keyword, start, end in keywords:
+                upper = keyword.upper()
+                skip_first = False
+                skip_comma_lines = False
+                if upper.startswith('*ELSET'):
+                    elset_match = re.search(r'ELSET=([^,]+)', keyword, re.IGNORECASE)
+                    elset_num = extract_elset_number(elset_match.group(1).strip()) if elset_match else None
+                    if elset_num:
+                        # The section of the previous set is written in front of the next set
+                        if pre_elset_name is not None:
+                            write_section(pre_elset_name)
+                        write_line(f"*ELSET, ELSET={names.elset(elset_num)}, GENERATE")
+                        pre_elset_name = elset_num
+                    else:
+                        write_line(names.rename_line(keyword))
+                elif upper.startswith('*END PART'):
+                    if pre_elset_name is not None:
+                        write_section(pre_elset_name)
+                    write_line(names.rename_line(keyword))
+                elif upper.startswith('*MATERIAL'):
+                    name_match = re.search(r'NAME=([^,\n]+)', keyword, re.IGNORECASE)
+                    material_num = extract_material_number(name_match.group(1).strip()) if name_match else None
+                    write_line(f"*MATERIAL, NAME={names.material(material_num)}" if material_num else names.rename_line(keyword))
+                elif keyword.startswith('** Section') or upper.startswith('*SOLID SECTION'):
+                    skip_comma_lines = True
+                elif '*DENSITY' in upper:
+                    skip_first = True
+                else:
+                    write_line(names.rename_line(keyword))
+                copy_data_lines(mm, outfile, start, end, skip_first, skip_comma_lines)
+    print(f"Processed file written to '{output_file}'.")
 
 # --- Main processing sequence ---
 if __name__ == "__main__":
     os.chdir(directory)
-    input_file = file_name  
-    output_file = input_file.rstrip(".inp") + "translated.inp"
-    output_file2 = input_file.rstrip(".inp") + "translated_updated_Set.inp"
-    output_file3 = input_file.rstrip(".inp") + "translated_reorderd_Set.inp"
-    preprocess_inp(input_file, output_file)
-    remove_density_lines(output_file)
-    process_file(output_file, output_file2)
-    reorder_Set_and_Youngs(output_file2, output_file3)
+    input_file = file_name
+    output_file = input_file.rstrip(".inp") + "translated_reorderd_Set.inp"
+    translate_mimics(input_file, output_file)
@@ -19,7 +19,7 @@ from config import *
 import subprocess
 Mimics_Abaqus =  'Path to Mimics_Preprocessor_Abaqus.py' #Regular String    
 Mimics_Translate = r'Path to Mimics_preprocessor.py' #Raw String
-command = [abaqus_path, 'cae', 'noGUI=' + Mimics_Abaqus]
+command = ["python", Mimics_Abaqus] # Pure Python, Abaqus/CAE is not needed anymore
 
 
 
@@ -16,7 +16,6 @@
 # =============================================================================
 # Options
 # Directory and file name settings
-abaqus_path = r'C:\SIMULIA\Commands\abaqus.bat' # Might need to be changed depending on the installation path 
 directory = 'Path to the directory of the INP File'
 file_name1 = 'inp file name'
 file_name = file_name1 + '.inp'
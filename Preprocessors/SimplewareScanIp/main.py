@@ -19,7 +19,7 @@ from config import *
 import subprocess
 Simpleware_Abaqus =  'Path to the Simpleware_Preprocessor_Abaqus.py file'  #Regular String
 Simpleware_Translate = r'Path to the Simpleware_inp_translation.py file' #Raw String
-command = [abaqus_path, 'cae', 'noGUI=' + Simpleware_Abaqus]
+command = ["python", Simpleware_Abaqus] # Pure Python, Abaqus/CAE is not needed anymore
 
 
 
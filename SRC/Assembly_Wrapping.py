@@ -0,0 +1,123 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Assembly_Wrapping.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Wraps a flat INP deck (mesh, sets, sections and materials without parts) into the part,
+#              instance and assembly layout that Abaqus/CAE writes with writeInput(), without starting CAE.
+#              The keyword blocks are indexed in the memory mapped file and written in the order
+#              heading, part (mesh, sets, sections), assembly with one instance, materials, remaining
+#              blocks. Data blocks are copied unchanged, optionally contiguous element sets are written
+#              in generate form like CAE does.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Assembly_Wrapping import wrap_in_assembly
+#     usage in code:
+#     wrap_in_assembly(input_file, output_file, part_name='PART-1', generate_sets=True)
+#     input_file and output_file may be the same file
+# =============================================================================
+import os
+import re
+import mmap
+import tempfile
+import numpy as np
+from Inp_Keywords import MATERIAL_OPTIONS, is_keyword, keyword_name, keyword_parameters
+from Parallel_Mesh_Parser import scan_keywords
+
+HEADER_KEYWORDS = ('*HEADING', '*PREPRINT')
+PART_KEYWORDS = ('*NODE', '*ELEMENT', '*NSET', '*ELSET', '*SOLIDSECTION', '*SHELLSECTION', '*MEMBRANESECTION',
+                 '*BEAMSECTION', '*ORIENTATION', '*SURFACE', '*TRANSFORM')
+COPY_CHUNK_BYTES = 16 * 1024 * 1024
+
+def assembly_lines(part_name):
+    return ['**', '**', '** ASSEMBLY', '**', '*Assembly, name=Assembly', '**', f'*Instance, name={part_name}-1, part={part_name}',
+            '*End Instance', '**', '*End Assembly', '**', '** MATERIALS', '**']
+
+def classify_blocks(keywords):
+    # Keyword blocks grouped by their position in the wrapped deck, comment lines are dropped like in CAE
+    blocks = {'header': [], 'part': [], 'material': [], 'other': []}
+    in_material = False
+    for keyword, start, end in keywords:
+        if not is_keyword(keyword):
+            continue
+        name = keyword_name(keyword)
+        if in_material and name.startswith(MATERIAL_OPTIONS):
+            blocks['material'].append((keyword, start, end))
+            continue
+        in_material = name == '*MATERIAL'
+        if in_material:
+            blocks['material'].append((keyword, start, end))
+        elif name in HEADER_KEYWORDS:
+            blocks['header'].append((keyword, start, end))
+        elif name in PART_KEYWORDS:
+            blocks['part'].append((keyword, start, end))
+        else:
+            blocks['other'].append((keyword, start, end))
+    return blocks
+
+def generate_range(data):
+    # start, end, step of an element list that is a contiguous range, None otherwise
+    if re.search(rb'[^0-9,\s]', data):
+        return None
+    ids = np.fromstring(data.replace(b',', b' ').decode('ascii'), sep=' ', dtype=np.int64)
+    if len(ids) == 0:
+        return None
+    step = int(ids[1] - ids[0]) if len(ids) > 1 else 1
+    if step <= 0 or np.any(np.diff(ids) != step):
+        return None
+    return int(ids[0]), int(ids[-1]), step
+
+def write_block(mm, output, keyword, start, end, generate_sets):
+    if generate_sets and keyword_name(keyword) == '*ELSET' and 'generate' not in keyword_parameters(keyword):
+        element_range = generate_range(mm[start:end])
+        if element_range is not None:
+            output.write(f"{keyword}, generate\n{element_range[0]:6d}, {element_range[1]:6d}, {element_range[2]:6d}\n".encode())
+            return
+    output.write((keyword + '\n').encode())
+    for position in range(start, end, COPY_CHUNK_BYTES):
+        output.write(mm[position:min(position + COPY_CHUNK_BYTES, end)])
+    if end > start and mm[end - 1:end] != b'\n':
+        output.write(b'\n')
+
+def wrap_in_assembly(input_file, output_file, part_name='PART-1', generate_sets=False):
+    keywords = scan_keywords(input_file)
+    if any(is_keyword(keyword) and keyword_name(keyword) in ('*PART', '*ASSEMBLY') for keyword, _, _ in keywords):
+        print(f"{input_file} already contains parts or an assembly and is not changed")
+        if os.path.abspath(input_file) != os.path.abspath(output_file):
+            with open(input_file, 'rb') as source, open(output_file, 'wb') as target:
+                target.write(source.read())
+        return
+    blocks = classify_blocks(keywords)
+    job_name = os.path.splitext(os.path.basename(output_file))[0]
+
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, os.fdopen(handle, 'wb') as output:
+            if not blocks['header']:
+                output.write(b'*Heading\n')
+            for keyword, start, end in blocks['header']:
+                write_block(mm, output, keyword, start, end, False)
+                if keyword_name(keyword) == '*HEADING':
+                    output.write(f"** Job name: {job_name} Model name: Model-1\n".encode())
+            if not any(keyword_name(keyword) == '*PREPRINT' for keyword, _, _ in blocks['header']):
+                output.write(b'*Preprint, echo=NO, model=NO, history=NO, contact=NO\n')
+            output.write(f"**\n** PARTS\n**\n*Part, name={part_name}\n".encode())
+            for keyword, start, end in blocks['part']:
+                write_block(mm, output, keyword, start, end, generate_sets)
+            output.write(b'*End Part\n')
+            output.write(('\n'.join(assembly_lines(part_name)) + '\n').encode())
+            for keyword, start, end in blocks['material']:
+                write_block(mm, output, keyword, start, end, False)
+            if blocks['other']:
+                print(f"Warning: {len(blocks['other'])} model or history keyword blocks are written after the materials unchanged")
+            for keyword, start, end in blocks['other']:
+                write_block(mm, output, keyword, start, end, False)
+        os.replace(temp_path, output_file)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    print(f"Wrapped {len(blocks['part'])} part blocks and {len(blocks['material'])} material blocks into {output_file}")
@@ -0,0 +1,190 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: CT_Material_Mapping.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Maps the HU values of a CT volume (NumPy .npy, NRRD or raw) directly onto the elements of the
+#              INP mesh, without the round trip through Bonemat. The CT volume is sampled with trilinear
+#              interpolation at quadrature points inside every tetrahedron and averaged. The voxel axes may be
+#              mirrored or oblique (NRRD space directions), .npy, raw and raw encoded NRRD volumes are memory
+#              mapped and only the sampled voxels are read. The Youngs modulus
+#              follows from the Material_Config calibration and elements are binned into materials of
+#              equal modulus, which are handed to the grouping methods in memory.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from CT_Material_Mapping import process_ct_mapping
+#     usage in code:
+#     df, elset_df = process_ct_mapping(file_name, ct_volume_file, ct_raw_shape, ct_raw_dtype, ct_spacing, ct_origin, ct_samples_per_element, ct_material_gap, Material_Config)
+#     df has the same layout as the output of process_material_data, elset_df the layout of extract_data_from_file
+# =============================================================================
+import gzip
+import os
+import re
+import numpy as np
+import pandas as pd
+from Element_Volumes import read_mesh, build_lookup, lookup_rows
+from Recalculate_HU import recalculate_material_data
+
+# Barycentric coordinates of the sampling points, centroid or 4 point Gauss rule of a tetrahedron
+_a = 0.5854101966249685
+_b = 0.1381966011250105
+# Fraction of sampling points outside the CT volume above which the mesh is considered misregistered
+MAX_OUTSIDE_FRACTION = 0.01
+
+SAMPLING_RULES = {
+    1: np.full((1, 4), 0.25),
+    4: np.array([[_a, _b, _b, _b], [_b, _a, _b, _b], [_b, _b, _a, _b], [_b, _b, _b, _a]]),
+}
+
+NRRD_TYPES = {
+    'signed char': np.int8, 'int8': np.int8, 'int8_t': np.int8, 'char': np.int8,
+    'uchar': np.uint8, 'unsigned char': np.uint8, 'uint8': np.uint8, 'uint8_t': np.uint8,
+    'short': np.int16, 'short int': np.int16, 'signed short': np.int16, 'int16': np.int16, 'int16_t': np.int16,
+    'ushort': np.uint16, 'unsigned short': np.uint16, 'uint16': np.uint16, 'uint16_t': np.uint16,
+    'int': np.int32, 'signed int': np.int32, 'int32': np.int32, 'int32_t': np.int32,
+    'uint': np.uint32, 'unsigned int': np.uint32, 'uint32': np.uint32, 'uint32_t': np.uint32,
+    'float': np.float32, 'double': np.float64,
+}
+
+def nrrd_vectors(value):
+    # '(1,0,0) (0,1,0) (0,0,1)' or '(1, 0, 0) (0, 1, 0) (0, 0, 1)', 'none' entries of non spatial axes are skipped
+    return [[float(number) for number in vector.split(',')] for vector in re.findall(r'\(([^)]*)\)', value)]
+
+def read_nrrd(file_name):
+    with open(file_name, 'rb') as f:
+        if not f.readline().startswith(b'NRRD'):
+            raise ValueError(f"{file_name} is not a NRRD file")
+        header = {}
+        while True:
+            line = f.readline().decode('ascii').strip()
+            if not line:
+                break
+            if line.startswith('#') or ':' not in line:
+                continue
+            key, _, value = line.partition(':')
+            header[key.strip().lower()] = value.lstrip('=').strip()
+        offset = f.tell()
+
+    dtype = np.dtype(NRRD_TYPES[header['type']])
+    if header.get('endian', 'little') == 'big':
+        dtype = dtype.newbyteorder('>')
+    sizes = [int(size) for size in header['sizes'].split()]
+    data_file = file_name
+    if 'data file' in header:
+        data_file = os.path.join(os.path.dirname(file_name), header['data file'])
+        offset = 0
+    # The first NRRD axis is the fastest, the array is returned indexed [x, y, z]
+    if header.get('encoding', 'raw') == 'raw':
+        # Raw data is memory mapped at the end of the header, only the sampled voxels are read
+        volume = np.memmap(data_file, dtype=dtype, mode='r', offset=offset, shape=tuple(sizes[::-1])).transpose()
+    elif header['encoding'] in ('gzip', 'gz'):
+        with open(data_file, 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read())
+        volume = np.frombuffer(data, dtype=dtype, count=int(np.prod(sizes))).reshape(sizes[::-1]).transpose()
+    else:
+        raise ValueError(f"NRRD encoding {header['encoding']} is not supported")
+
+    # Rows of directions are the steps of the x, y and z voxel axes in space, with sign and orientation
+    if 'space directions' in header:
+        directions = np.array(nrrd_vectors(header['space directions']))
+    elif 'spacings' in header:
+        directions = np.diag([float(value) for value in header['spacings'].split()])
+    else:
+        directions = np.eye(3)
+    if 'space origin' in header:
+        origin = np.array(nrrd_vectors(header['space origin'])[0])
+    else:
+        origin = np.zeros(3)
+    return volume, directions, origin
+
+def read_ct_volume(file_name, raw_shape=None, raw_dtype='int16', spacing=(1.0, 1.0, 1.0), origin=(0.0, 0.0, 0.0)):
+    # raw_shape, spacing and origin are given in x, y, z order and are used for .npy and .raw files,
+    # returns the volume indexed [x, y, z], the voxel axis directions (rows) and the origin
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in ('.nrrd', '.nhdr'):
+        return read_nrrd(file_name)
+    if extension == '.npy':
+        volume = np.load(file_name, mmap_mode='r')
+    elif extension == '.raw':
+        if raw_shape is None:
+            raise ValueError("ct_raw_shape must be stated in config.py for raw CT volumes")
+        volume = np.memmap(file_name, dtype=raw_dtype, mode='r', shape=tuple(raw_shape)[::-1]).transpose()
+    else:
+        raise ValueError(f"CT volume format {extension} is not supported, use .npy, .nrrd or .raw")
+    return volume, np.diag(np.asarray(spacing, dtype=float)), np.asarray(origin, dtype=float)
+
+def voxel_index(points, directions, origin):
+    # point = origin + index @ directions, so mirrored and oblique voxel axes are mapped correctly
+    return (points - origin) @ np.linalg.inv(directions)
+
+def outside_points(index, shape, tolerance=1e-6):
+    return ((index < -tolerance) | (index > np.array(shape) - 1 + tolerance)).any(axis=1)
+
+def trilinear_interpolation(volume, index):
+    # index in voxel coordinates, points outside the volume take the values of the edge voxels.
+    # Only the corner voxels are read from a memory mapped volume and converted to float
+    shape = np.array(volume.shape)
+    # Axes with a single voxel (e.g. one slice) use that voxel for both corners
+    lower = np.clip(np.floor(index).astype(np.int64), 0, np.maximum(shape - 2, 0))
+    corners = (lower, np.minimum(lower + 1, shape - 1))
+    t = np.clip(index - lower, 0.0, 1.0)
+    tx, ty, tz = t[:, 0], t[:, 1], t[:, 2]
+    def voxel(di, dj, dk):
+        return np.asarray(volume[corners[di][:, 0], corners[dj][:, 1], corners[dk][:, 2]], dtype=np.float32)
+    c00 = voxel(0, 0, 0) * (1 - tx) + voxel(1, 0, 0) * tx
+    c10 = voxel(0, 1, 0) * (1 - tx) + voxel(1, 1, 0) * tx
+    c01 = voxel(0, 0, 1) * (1 - tx) + voxel(1, 0, 1) * tx
+    c11 = voxel(0, 1, 1) * (1 - tx) + voxel(1, 1, 1) * tx
+    return (c00 * (1 - ty) + c10 * ty) * (1 - tz) + (c01 * (1 - ty) + c11 * ty) * tz
+
+def map_element_HU(volume, directions, origin, node_ids, coordinates, connectivity, samples_per_element=4, chunk_elements=500000):
+    rule = SAMPLING_RULES[samples_per_element]
+    node_rows = lookup_rows(build_lookup(node_ids), connectivity)
+    element_HU = np.empty(len(connectivity))
+    outside = 0
+    for start in range(0, len(connectivity), chunk_elements):
+        corners = coordinates[node_rows[start:start + chunk_elements]]
+        points = np.einsum('sk,nkd->nsd', rule, corners).reshape(-1, 3)
+        index = voxel_index(points, directions, origin)
+        outside += int(outside_points(index, volume.shape).sum())
+        values = trilinear_interpolation(volume, index)
+        element_HU[start:start + chunk_elements] = values.reshape(-1, len(rule)).mean(axis=1)
+    samples = len(connectivity) * len(rule)
+    if outside > MAX_OUTSIDE_FRACTION * samples:
+        raise ValueError(f"{outside} of {samples} sampling points lie outside the CT volume, check the registration of mesh and volume (ct_origin, ct_spacing)")
+    if outside:
+        print(f"Warning: {outside} of {samples} sampling points lie outside the CT volume and take the values of the edge voxels")
+    return element_HU
+
+def calculate_E_from_HU(HU, config):
+    E = config.a_Youngs + config.b_Youngs * ((config.a_Ash + config.b_Ash * (config.a_Qct + config.b_Qct * np.maximum(HU, 0))) ** config.c_Youngs)
+    return np.where(HU > 0.0001, E, 1.0)
+
+def bin_materials(element_ids, element_E, material_gap):
+    # Elements with the same modulus (within material_gap) share one material, Mat_1 has the highest modulus
+    binned_E = np.round(element_E / material_gap) * material_gap if material_gap > 0 else element_E
+    unique_E, material_index = np.unique(-binned_E, return_inverse=True)
+    order = np.argsort(material_index, kind='stable')
+    boundaries = np.searchsorted(material_index[order], np.arange(len(unique_E) + 1))
+    df_materials = pd.DataFrame({'Mat': [f"Mat_{i + 1}" for i in range(len(unique_E))], 'E_z': np.maximum(-unique_E, 1.0)})
+    numbers = [','.join(map(str, element_ids[order[boundaries[i]:boundaries[i + 1]]])) for i in range(len(unique_E))]
+    elset_df = pd.DataFrame({'Elset Information': [f"Set_{i + 1}" for i in range(len(unique_E))], 'Numbers': numbers, 'Solid Section Information': df_materials['Mat']})
+    return df_materials, elset_df
+
+def process_ct_mapping(file_name, ct_volume_file, ct_raw_shape, ct_raw_dtype, ct_spacing, ct_origin, ct_samples_per_element, ct_material_gap, config):
+    volume, directions, origin = read_ct_volume(ct_volume_file, ct_raw_shape, ct_raw_dtype, ct_spacing, ct_origin)
+    print(f"CT volume {volume.shape} with voxel axes {directions.tolist()} and origin {origin}")
+    node_ids, coordinates, element_ids, connectivity = read_mesh(file_name)
+    element_HU = map_element_HU(volume, directions, origin, node_ids, coordinates, connectivity, ct_samples_per_element)
+    element_E = calculate_E_from_HU(element_HU, config)
+    print(f"Mapped {len(element_ids)} elements, HU range {element_HU.min():.1f} to {element_HU.max():.1f}")
+
+    df_materials, elset_df = bin_materials(element_ids, element_E, ct_material_gap)
+    df = recalculate_material_data(df_materials, config)
+    print(f"CT mapping resulted in {len(df)} materials")
+    return df, elset_df
@@ -0,0 +1,149 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Cohort_Grouping.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Shared material library for all models of a study. Phase one streams every INP file of the
+#              cohort in parallel and reduces its materials to a mergeable sketch: an element weighted
+#              histogram of E_z over fine logarithmic bins plus the exact extreme values. The merged sketch
+#              gives the group levels of the chosen grouping method for the whole cohort. Phase two streams
+#              every file again, assigns its materials to the closest level and writes the grouped model,
+#              the material cards are written once to <cohort_name>_materials.inp and included by all models.
+#              Only the sketches and the materials of the files in process are held in memory.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Cohort_Grouping import process_cohort
+#     usage in code:
+#     output_files, df_library = process_cohort(cohort_files, cohort_name, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups,
+#                                               num_quantile_groups, stream_chunk_size_mb, Material_Config, cohort_workers)
+#     Must be called below an if __name__ == "__main__": guard, as the workers are separate processes
+# =============================================================================
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from Recalculate_HU import recalculate_material_data
+from Calculate_Material_Parameters import CalculateMaterial, calculate_HU_series
+from PercentualThresholding import generate_values
+from Equidistant_Histogram import generate_values as generate_equidistant_values
+from Quantile_Grouping import quantile_groups
+from Streaming_Processing import collect_material_aggregates, nearest_level, write_grouped_stream, write_grouping_error_stats
+from Write_Abaqus_Output import write_material_cards
+
+# Logarithmic E_z bins of the sketch between 10^-3 and 10^6 MPa, neighbouring bins differ by about 0.13 %
+SKETCH_BINS = 16384
+SKETCH_LOG_RANGE = (-3.0, 6.0)
+
+class ModulusSketch:
+    # Element weighted histogram of E_z, sketches of several files are merged by adding them
+    def __init__(self):
+        self.weights = np.zeros(SKETCH_BINS)
+        self.moments = np.zeros(SKETCH_BINS)
+        self.max = -np.inf
+        self.min_positive = np.inf
+        self.materials = 0
+
+    def add(self, E_z, weights):
+        E_z = np.asarray(E_z, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        position = (np.log10(np.maximum(E_z, 10 ** SKETCH_LOG_RANGE[0])) - SKETCH_LOG_RANGE[0]) / (SKETCH_LOG_RANGE[1] - SKETCH_LOG_RANGE[0])
+        bins = np.clip((position * SKETCH_BINS).astype(np.int64), 0, SKETCH_BINS - 1)
+        self.weights += np.bincount(bins, weights, SKETCH_BINS)
+        self.moments += np.bincount(bins, E_z * weights, SKETCH_BINS)
+        self.max = max(self.max, E_z.max())
+        self.min_positive = min(self.min_positive, E_z[E_z > 0.001].min())
+        self.materials += len(E_z)
+
+    def merge(self, other):
+        self.weights += other.weights
+        self.moments += other.moments
+        self.max = max(self.max, other.max)
+        self.min_positive = min(self.min_positive, other.min_positive)
+        self.materials += other.materials
+
+    def points(self):
+        # Mean E_z and weight of the occupied bins, in descending E_z order
+        occupied = np.flatnonzero(self.weights)[::-1]
+        return self.moments[occupied] / self.weights[occupied], self.weights[occupied]
+
+def cohort_levels(sketch, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups, config):
+    E_z, weights = sketch.points()
+    if grouping_method == "Percentual_Thresholding":
+        levels = generate_values(sketch.max, sketch.min_positive, threshold_percentage)
+        levels.append(0.001)
+        levels = np.array(levels)
+    elif grouping_method == "Equidistant":
+        max_HU = calculate_HU_series(pd.DataFrame({'E_z': [sketch.max]}), config)['HU'].iloc[0]
+        HU_levels = generate_equidistant_values(max_HU, None, num_equidistant_groups)[::-1]
+        midpoints = (np.array(HU_levels[:-1]) + np.array(HU_levels[1:])) / 2
+        levels = config.a_Youngs + config.b_Youngs * ((config.a_Ash + config.b_Ash * (config.a_Qct + config.b_Qct * midpoints)) ** config.c_Youngs)
+        levels = np.maximum(levels, 1)
+    elif grouping_method == "Kmeans_Clustering":
+        # Clusters of the element weighted modulus distribution, the material sizes are not part of a sketch
+        kmeans = KMeans(n_clusters=min(num_clusters, len(E_z)), random_state=42)
+        levels = kmeans.fit(E_z.reshape(-1, 1), sample_weight=weights).cluster_centers_.ravel()
+    elif grouping_method == "Quantile":
+        _, levels = quantile_groups(E_z, weights, num_quantile_groups)
+    else:
+        raise ValueError(f"Grouping method {grouping_method} is not supported in cohort mode")
+    return np.unique(levels)[::-1]
+
+def read_materials(file_name, config, chunk_bytes):
+    df_materials, set_material = collect_material_aggregates(file_name, chunk_bytes)
+    counts = dict(zip(df_materials['Mat'], df_materials['count_column']))
+    df_materials = df_materials.sort_values(by='E_z', ascending=False).reset_index(drop=True)
+    df_recalculated = recalculate_material_data(df_materials, config)
+    df_recalculated['count_column'] = df_recalculated['Mat'].map(counts)
+    return df_recalculated[df_recalculated['count_column'] > 0], set_material
+
+def sketch_file(file_name, config, chunk_bytes):
+    df_materials, _ = read_materials(file_name, config, chunk_bytes)
+    sketch = ModulusSketch()
+    sketch.add(df_materials['E_z'], df_materials['count_column'])
+    return sketch
+
+def assign_file(file_name, output_file, levels, df_library, material_include, config, chunk_bytes):
+    df_materials, set_material = read_materials(file_name, config, chunk_bytes)
+    labels = nearest_level(df_materials['E_z'].to_numpy(), levels)
+    material_group = dict(zip(df_materials['Mat'], labels))
+    set_group = {set_name: material_group[material] for set_name, material in set_material.items() if material in material_group}
+    errors = np.abs(df_materials['E_z'].to_numpy() - levels[labels])
+    write_grouping_error_stats(os.path.splitext(output_file)[0] + "_grouping_error_stats.txt", errors)
+    write_grouped_stream(file_name, output_file, set_group, df_library, config, chunk_bytes, material_include)
+    return output_file, len(np.unique(labels)), errors.mean()
+
+def process_cohort(cohort_files, cohort_name, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups, stream_chunk_size_mb, config, cohort_workers=0):
+    # cohort_workers = 0 uses all available cores
+    if not cohort_files:
+        raise ValueError("No INP files given for the cohort, check cohort_files in config.py")
+    chunk_bytes = int(stream_chunk_size_mb * 1024 * 1024)
+    workers = min(cohort_workers if cohort_workers > 0 else os.cpu_count(), len(cohort_files))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        sketch = ModulusSketch()
+        for file_sketch in executor.map(sketch_file, cohort_files, [config] * len(cohort_files), [chunk_bytes] * len(cohort_files)):
+            sketch.merge(file_sketch)
+        levels = cohort_levels(sketch, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups, config)
+        print(f"{len(levels)} cohort levels from {sketch.materials} materials of {len(cohort_files)} files")
+
+        df_library = CalculateMaterial(pd.DataFrame({'E_z': levels}), config)
+        material_include = cohort_name + '_materials.inp'
+        with open(material_include, 'w') as file:
+            write_material_cards(file, df_library, config)
+        E_z, weights = sketch.points()
+        df_levels = df_library[['Mat', 'E_z']].copy()
+        df_levels['Elements'] = np.bincount(nearest_level(E_z, levels), weights, len(levels)).astype(np.int64)
+        df_levels.to_csv(cohort_name + '_CohortLevels.csv', index=False)
+        print('Material library written to ', material_include)
+
+        output_files = [os.path.splitext(file_name)[0] + '_' + cohort_name + '.inp' for file_name in cohort_files]
+        futures = [executor.submit(assign_file, file_name, output_file, levels, df_library, material_include, config, chunk_bytes)
+                   for file_name, output_file in zip(cohort_files, output_files)]
+        for future in futures:
+            output_file, groups, mean_error = future.result()
+            print(f"{output_file}: {groups} of {len(levels)} cohort materials used, mean grouping error {mean_error:.4f}")
+    return output_files, df_library
@@ -0,0 +1,224 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Deck_Check.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Consistency check of a written INP deck before it is given to the solver. The keyword blocks
+#              are indexed in the memory mapped file (included files are followed), the element and element set
+#              blocks are converted in bulk to ID arrays. The section assignments are counted per element on
+#              arrays over the element IDs, so every element must be assigned to exactly one section, every
+#              section must reference an existing element set and material, and every material must have
+#              finite positive elastic constants and density and a plastic table starting at strain 0 with
+#              increasing plastic strains. Parts are checked separately, element IDs are unique per part.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Deck_Check import check_deck
+#     usage in code:
+#     problems = check_deck(output_file)  (list of the found problems, empty for a consistent deck)
+# =============================================================================
+import os
+import re
+import mmap
+import numpy as np
+from Inp_Keywords import MATERIAL_OPTIONS, is_keyword, keyword_name, keyword_parameters
+from Parallel_Mesh_Parser import scan_keywords
+from Element_Volumes import TET_NODES
+
+# Problems reported per check, the counts are always complete
+MAX_REPORTED = 10
+
+def parse_ids(data):
+    # Integer IDs of a data block, names of other sets are returned separately
+    if re.search(rb'[A-Za-z_]', data) is None:
+        return np.fromstring(data.replace(b',', b' ').decode('ascii'), sep=' ', dtype=np.int64), []
+    tokens = [token.strip() for token in data.decode('ascii', 'ignore').replace('\n', ',').split(',') if token.strip()]
+    numbers = [int(token) for token in tokens if token.lstrip('-').isdigit()]
+    names = [token.upper() for token in tokens if not token.lstrip('-').isdigit()]
+    return np.array(numbers, dtype=np.int64), names
+
+def parse_values(data):
+    return np.fromstring(data.replace(b',', b' ').decode('ascii', 'ignore'), sep=' ')
+
+def element_ids(data, element_type):
+    # First value of every element, elements of unknown types may continue on the next line after a trailing comma
+    if element_type in TET_NODES:
+        return parse_ids(data)[0].reshape(-1, TET_NODES[element_type] + 1)[:, 0]
+    ids = []
+    continued = False
+    for line in data.decode('ascii', 'ignore').splitlines():
+        line = line.strip()
+        if not line or line.startswith('**'):
+            continue
+        if not continued:
+            ids.append(int(line.split(',')[0]))
+        continued = line.endswith(',')
+    return np.array(ids, dtype=np.int64)
+
+def generate_ids(data):
+    ids = []
+    for line in data.decode('ascii', 'ignore').splitlines():
+        values = [int(value) for value in line.strip().rstrip(',').split(',')] if line.strip() else []
+        if values:
+            ids.append(np.arange(values[0], values[1] + 1, values[2] if len(values) > 2 else 1))
+    return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+def deck_blocks(file_name):
+    # Keyword line and data bytes of every keyword block, comment lines inside a data block and *Include files are resolved
+    blocks = []
+    with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for keyword, start, end in scan_keywords(file_name):
+            data = mm[start:end]
+            if not is_keyword(keyword):
+                if blocks:
+                    blocks[-1][1] += data
+                continue
+            if keyword_name(keyword) == '*INCLUDE':
+                include = os.path.join(os.path.dirname(file_name), keyword_parameters(keyword).get('input', ''))
+                if os.path.exists(include):
+                    blocks.extend(deck_blocks(include))
+                else:
+                    blocks.append(['*MISSINGINCLUDE, input=' + include, b''])
+                continue
+            blocks.append([keyword, data])
+    return blocks
+
+def read_deck(file_name):
+    # Elements, element sets and sections per part (None for the deck level) and the materials
+    parts = {None: {'elements': [], 'elsets': {}, 'sections': []}}
+    materials = {}
+    problems = []
+    part = None
+    material = None
+    for keyword, data in deck_blocks(file_name):
+        name = keyword_name(keyword)
+        parameters = keyword_parameters(keyword)
+        if name == '*MISSINGINCLUDE':
+            problems.append(f"Included file {parameters['input']} does not exist")
+            continue
+        if material is not None and name.startswith(MATERIAL_OPTIONS):
+            materials[material][name] = (parameters, data)
+            continue
+        material = None
+        if name == '*PART':
+            part = parameters.get('name', '').upper()
+            parts[part] = {'elements': [], 'elsets': {}, 'sections': []}
+        elif name == '*ENDPART':
+            part = None
+        elif name == '*MATERIAL':
+            material = parameters.get('name', '').upper()
+            if material in materials:
+                problems.append(f"Material {material} is defined more than once")
+            materials[material] = {}
+        elif name == '*ELEMENT':
+            ids = element_ids(data, parameters.get('type', '').upper())
+            parts[part]['elements'].append(ids)
+            if 'elset' in parameters:
+                parts[part]['elsets'].setdefault(parameters['elset'].upper(), []).append(ids)
+        elif name == '*ELSET' and 'instance' not in parameters:
+            if 'generate' in parameters:
+                ids, names = generate_ids(data), []
+            else:
+                ids, names = parse_ids(data)
+            elsets = parts[part]['elsets']
+            elsets.setdefault(parameters.get('elset', '').upper(), []).append(ids)
+            for set_name in names:
+                elsets[parameters.get('elset', '').upper()].extend(elsets.get(set_name, []))
+        elif name == '*SOLIDSECTION':
+            parts[part]['sections'].append((parameters.get('elset', '').upper(), parameters.get('material', '').upper()))
+    return parts, materials, problems
+
+def report(problems, message, items):
+    if len(items):
+        shown = ', '.join(str(item) for item in list(items[:MAX_REPORTED]))
+        problems.append(f"{message} ({len(items)}): {shown}" + (', ...' if len(items) > MAX_REPORTED else ''))
+
+def check_assignments(part, content, materials, problems):
+    label = '' if part is None else f"Part {part}: "
+    elements = np.concatenate(content['elements']) if content['elements'] else np.empty(0, dtype=np.int64)
+    if not content['sections']:
+        return 0
+    unique_elements, counts = np.unique(elements, return_counts=True)
+    report(problems, label + "Elements defined more than once", unique_elements[counts > 1])
+    # Number of sections per element, the element IDs index a dense array
+    size = int(max(elements.max() if len(elements) else 0, 0)) + 1
+    section_ids = []
+    for elset, material in content['sections']:
+        if elset not in content['elsets']:
+            problems.append(f"{label}Section references the undefined element set {elset}")
+            continue
+        if material not in materials:
+            problems.append(f"{label}Section of {elset} references the undefined material {material}")
+        section_ids.append(np.unique(np.concatenate(content['elsets'][elset])))
+    ids = np.concatenate(section_ids) if section_ids else np.empty(0, dtype=np.int64)
+    outside = (ids < 0) | (ids >= size)
+    assigned = np.bincount(ids[~outside], minlength=size)
+    defined = np.zeros(size, dtype=bool)
+    defined[elements] = True
+    report(problems, label + "Elements without section", np.flatnonzero(defined & (assigned == 0)))
+    report(problems, label + "Elements in more than one section", np.flatnonzero(defined & (assigned > 1)))
+    report(problems, label + "Elements in sections but not defined", np.concatenate([np.flatnonzero(~defined & (assigned > 0)), np.unique(ids[outside])]))
+    return len(unique_elements)
+
+def stacked_values(materials, names, option, rows=False):
+    # Values of one option of all materials, stacked per shape for a vectorized check: {shape: (names, array)}
+    stacks = {}
+    for name in names:
+        parameters, data = materials[name][option]
+        values = parse_values(data)
+        shape = (parameters.get('type', '').upper().replace(' ', ''), len(values))
+        if rows:
+            lines = sum(1 for line in data.split(b'\n') if line.strip())
+            shape = (lines, len(values) // lines if lines and len(values) % lines == 0 else 0)
+        stacks.setdefault(shape, ([], []))
+        stacks[shape][0].append(name)
+        stacks[shape][1].append(values)
+    for shape, (group_names, values) in stacks.items():
+        if rows and shape[1] == 0:
+            stacks[shape] = (np.array(group_names), None)
+        else:
+            stacks[shape] = (np.array(group_names), np.array(values).reshape((len(group_names),) + (shape if rows else (shape[1],))))
+    return stacks
+
+def check_materials(materials, names, problems):
+    report(problems, "Materials without *Elastic", sorted(name for name in names if '*ELASTIC' not in materials[name]))
+    for (elastic_type, length), (group_names, values) in stacked_values(materials, [name for name in names if '*ELASTIC' in materials[name]], '*ELASTIC').items():
+        # Moduli of engineering constants (E1, E2, E3, G12, G13, G23) or of isotropic elasticity (E)
+        moduli = [0, 1, 2, 6, 7, 8] if elastic_type == 'ENGINEERINGCONSTANTS' else [0]
+        if length < (9 if elastic_type == 'ENGINEERINGCONSTANTS' else 2):
+            report(problems, "Materials with incomplete elastic constants", group_names)
+            continue
+        invalid = ~np.isfinite(values).all(axis=1) | (values[:, moduli] <= 0).any(axis=1)
+        report(problems, "Materials with invalid elastic constants", group_names[invalid])
+    for (_, length), (group_names, values) in stacked_values(materials, [name for name in names if '*DENSITY' in materials[name]], '*DENSITY').items():
+        invalid = np.ones(len(group_names), dtype=bool) if length == 0 else ~np.isfinite(values).all(axis=1) | (values[:, 0] <= 0)
+        report(problems, "Materials with invalid density", group_names[invalid])
+    for (lines, columns), (group_names, tables) in stacked_values(materials, [name for name in names if '*PLASTIC' in materials[name]], '*PLASTIC', rows=True).items():
+        if tables is None or columns < 2:
+            report(problems, "Materials with empty or incomplete plastic tables", group_names)
+            continue
+        stress, strain = tables[:, :, 0], tables[:, :, 1]
+        invalid = ~np.isfinite(tables).all(axis=(1, 2)) | (stress <= 0).any(axis=1)
+        report(problems, "Materials with invalid yield stresses", group_names[invalid])
+        # Abaqus needs the plastic strains of a table to start at 0 and to increase
+        not_increasing = ~invalid & ((strain[:, 0] != 0) | (np.diff(strain, axis=1) <= 0).any(axis=1))
+        report(problems, "Materials with plastic strains not increasing from 0", group_names[not_increasing])
+
+def check_deck(file_name):
+    parts, materials, problems = read_deck(file_name)
+    elements = sum(check_assignments(part, content, materials, problems) for part, content in parts.items())
+    used = {material for content in parts.values() for _, material in content['sections']}
+    check_materials(materials, sorted(used & set(materials)), problems)
+    unused = sorted(set(materials) - used)
+    if unused:
+        print(f"Note: {len(unused)} materials are not used by a section")
+    if problems:
+        print(f"Deck check of {file_name} found {len(problems)} problems:")
+        for problem in problems:
+            print("   ", problem)
+    else:
+        print(f"Deck check of {file_name} passed: {elements} elements, {len(used)} materials")
+    return problems
@@ -0,0 +1,133 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Deck_Diff.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Semantic comparison of two grouped INP decks, e.g. of two grouping methods or code versions.
+#              Both decks are read with the keyword index of Deck_Check.py into per element arrays of the
+#              assigned material and its card values (density, elastic constants, plastic table). The elements
+#              are joined on their IDs with dense lookup arrays, the cards are compared once per pair of
+#              materials. Reported are the elements with changed cards, the E_z differences (histogram,
+#              maximum, RMSE) and the materials with the same name but different cards. Material names are
+#              not compared, Mat_1 of a KMeans deck and Mat_1 of an equidistant deck are different materials.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Deck_Diff import diff_decks
+#     usage in code:
+#     summary = diff_decks('L3_Bonemat3_0MPa_50C.inp', 'L3_Bonemat3_0MPa_10EqiGroups.inp')
+#     diff_decks(file_a, file_b, output_file='50C_vs_10Eqi.npz')  (element IDs, E_z of both decks, changed cards)
+# =============================================================================
+import numpy as np
+from Deck_Check import read_deck, parse_values
+
+# Material options of the compared card values, in this order
+CARD_OPTIONS = ('*DENSITY', '*ELASTIC', '*PLASTIC', '*POTENTIAL')
+
+def material_cards(materials):
+    # Names, E_z and card values (NaN padded to one length) of all materials of a deck
+    names = sorted(materials)
+    moduli = np.full(len(names), np.nan)
+    cards = []
+    for index, name in enumerate(names):
+        options = materials[name]
+        if '*ELASTIC' in options:
+            parameters, data = options['*ELASTIC']
+            elastic = parse_values(data)
+            # E_z is the third modulus of the engineering constants, isotropic materials have one modulus
+            position = 2 if parameters.get('type', '').upper().replace(' ', '') == 'ENGINEERINGCONSTANTS' else 0
+            moduli[index] = elastic[position] if len(elastic) > position else np.nan
+        cards.append(np.concatenate([parse_values(options[option][1]) if option in options else np.empty(0) for option in CARD_OPTIONS]))
+    table = np.full((len(names), max((len(card) for card in cards), default=0)), np.nan)
+    for index, card in enumerate(cards):
+        table[index, :len(card)] = card
+    return names, moduli, table
+
+def element_materials(content, material_index):
+    # Element IDs of the sections and the index of their material, elements of several sections keep the first
+    ids = []
+    materials = []
+    for elset, material in content['sections']:
+        if elset in content['elsets'] and material in material_index:
+            set_ids = np.unique(np.concatenate(content['elsets'][elset]))
+            ids.append(set_ids)
+            materials.append(np.full(len(set_ids), material_index[material], dtype=np.int64))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ids, first = np.unique(np.concatenate(ids), return_index=True)
+    return ids, np.concatenate(materials)[first]
+
+def read_deck_arrays(file_name):
+    parts, materials, _ = read_deck(file_name)
+    names, moduli, cards = material_cards(materials)
+    material_index = {name: index for index, name in enumerate(names)}
+    elements = {part: element_materials(content, material_index) for part, content in parts.items() if content['sections']}
+    return elements, names, moduli, cards
+
+def join_elements(ids_a, ids_b):
+    # Row of every element of deck a in deck b, -1 for elements that are not in deck b
+    size = int(max(ids_a.max() if len(ids_a) else 0, ids_b.max() if len(ids_b) else 0)) + 1
+    lookup = np.full(size, -1, dtype=np.int64)
+    lookup[ids_b] = np.arange(len(ids_b))
+    return lookup[ids_a]
+
+def compare_cards(cards_a, cards_b, rtol):
+    width = max(cards_a.shape[1], cards_b.shape[1])
+    cards_a = np.pad(cards_a, ((0, 0), (0, width - cards_a.shape[1])), constant_values=np.nan)
+    cards_b = np.pad(cards_b, ((0, 0), (0, width - cards_b.shape[1])), constant_values=np.nan)
+    return ~np.isclose(cards_a, cards_b, rtol=rtol, atol=0, equal_nan=True).all(axis=1)
+
+def print_histogram(deltas, bins):
+    counts, edges = np.histogram(deltas, bins=bins)
+    for count, lower, upper in zip(counts, edges[:-1], edges[1:]):
+        print(f"      {lower:12.4f} .. {upper:12.4f}: {count}")
+
+def diff_decks(file_a, file_b, histogram_bins=10, rtol=1e-9, output_file=None):
+    elements_a, names_a, moduli_a, cards_a = read_deck_arrays(file_a)
+    elements_b, names_b, moduli_b, cards_b = read_deck_arrays(file_b)
+    ids, E_a, E_b, changed = [], [], [], []
+    only_a = only_b = 0
+    for part in elements_a.keys() | elements_b.keys():
+        ids_a, material_a = elements_a.get(part, (np.empty(0, dtype=np.int64),) * 2)
+        ids_b, material_b = elements_b.get(part, (np.empty(0, dtype=np.int64),) * 2)
+        rows = join_elements(ids_a, ids_b)
+        common = rows >= 0
+        only_a += int((~common).sum())
+        only_b += len(ids_b) - int(common.sum())
+        pair_a, pair_b = material_a[common], material_b[rows[common]]
+        # The cards are compared once per pair of materials and mapped back to the elements
+        pairs, inverse = np.unique(pair_a * len(names_b) + pair_b, return_inverse=True)
+        pair_changed = compare_cards(cards_a[pairs // len(names_b)], cards_b[pairs % len(names_b)], rtol) if len(pairs) else np.empty(0, dtype=bool)
+        ids.append(ids_a[common])
+        E_a.append(moduli_a[pair_a])
+        E_b.append(moduli_b[pair_b])
+        changed.append(pair_changed[inverse.ravel()])
+    ids, E_a, E_b, changed = (np.concatenate(values) if values else np.empty(0) for values in (ids, E_a, E_b, changed))
+    deltas = E_b - E_a
+
+    shared = sorted(set(names_a) & set(names_b))
+    index_a = {name: index for index, name in enumerate(names_a)}
+    index_b = {name: index for index, name in enumerate(names_b)}
+    shared_changed = compare_cards(cards_a[[index_a[name] for name in shared]], cards_b[[index_b[name] for name in shared]], rtol) if shared else np.empty(0, dtype=bool)
+    summary = {'elements': len(ids), 'only_a': only_a, 'only_b': only_b, 'changed_cards': int(changed.sum()),
+               'changed_E_z': int((~np.isclose(E_a, E_b, rtol=rtol, atol=0)).sum()), 'max_delta': float(np.abs(deltas).max()) if len(deltas) else 0.0,
+               'rmse': float(np.sqrt(np.mean(deltas ** 2))) if len(deltas) else 0.0, 'materials_a': len(names_a), 'materials_b': len(names_b),
+               'changed_materials': [name for name, differs in zip(shared, shared_changed) if differs]}
+
+    print(f"Deck diff {file_a} -> {file_b}")
+    print(f"   Elements: {summary['elements']} compared, {only_a} only in the first deck, {only_b} only in the second deck")
+    if len(ids):
+        print(f"   Elements with changed material cards: {summary['changed_cards']} ({100 * summary['changed_cards'] / len(ids):.2f} %)")
+        print(f"   Elements with changed E_z: {summary['changed_E_z']}")
+        largest = np.argmax(np.abs(deltas))
+        print(f"   E_z delta [MPa]: max {summary['max_delta']:.4f} (element {ids[largest]}), RMSE {summary['rmse']:.4f}, mean {deltas.mean():.4f}")
+        print("   Histogram of the E_z delta [MPa]:")
+        print_histogram(deltas, histogram_bins)
+    print(f"   Materials: {len(names_a)} and {len(names_b)}, {len(shared)} names in both decks of which {len(summary['changed_materials'])} have different cards")
+    if output_file:
+        np.savez(output_file, element_ids=ids, E_z_a=E_a, E_z_b=E_b, changed_cards=changed)
+        print('Element differences written to ', output_file)
+    return summary
@@ -0,0 +1,72 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Element_Export.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Export of the final material properties per element for post-processing scripts. The element
+#              sets and sections of the written deck give the material of every element (after a renumbering
+#              with the new IDs), the columns of CalculateMaterial are taken from the material table and written
+#              as one .npy file per column, aligned with element_ids.npy. The files can be opened with
+#              np.load(path, mmap_mode='r') without parsing the deck. The material table itself is written to
+#              materials.npy (structured array of Material_Core), element_properties.json lists the files.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Element_Export import export_element_properties
+#     usage in code:
+#     export_element_properties(output_file, df_materials_aniso)  (writes <output>_ElementProperties/)
+#     in post-processing:
+#     E_z = np.load('L3_Bonemat3_0MPa_50C_ElementProperties/E_z.npy', mmap_mode='r')
+# =============================================================================
+import os
+import re
+import json
+import numpy as np
+from Deck_Check import read_deck
+from Deck_Diff import element_materials
+from Material_Core import MATERIAL_COLUMNS, material_table
+
+def column_file(column):
+    # 'Rho_app [kg/m^3]' -> 'Rho_app_kg_m_3.npy'
+    return re.sub(r'[^A-Za-z0-9_]+', '_', column).strip('_') + '.npy'
+
+def export_element_properties(deck_file, df_materials_aniso, export_directory=None):
+    export_directory = export_directory or os.path.splitext(deck_file)[0] + '_ElementProperties'
+    columns = {column: df_materials_aniso[column].to_numpy() for column in MATERIAL_COLUMNS if column in df_materials_aniso}
+    table = material_table(columns)
+    material_index = {name.upper(): index for index, name in enumerate(df_materials_aniso['Mat'].astype(str))}
+
+    parts, _, _ = read_deck(deck_file)
+    element_ids, group_index, part_index = [], [], []
+    part_names = [part for part, content in parts.items() if content['sections']]
+    for number, part in enumerate(part_names):
+        ids, rows = element_materials(parts[part], material_index)
+        element_ids.append(ids)
+        group_index.append(rows)
+        part_index.append(np.full(len(ids), number, dtype=np.int16))
+    element_ids = np.concatenate(element_ids) if element_ids else np.empty(0, dtype=np.int64)
+    group_index = np.concatenate(group_index) if group_index else np.empty(0, dtype=np.int64)
+
+    os.makedirs(export_directory, exist_ok=True)
+    files = {'element_ids': 'element_ids.npy', 'group_ids': 'group_ids.npy'}
+    np.save(os.path.join(export_directory, 'element_ids.npy'), element_ids)
+    # Group ID = number of the material in materials.npy (field Mat), in the order of the material table
+    np.save(os.path.join(export_directory, 'group_ids.npy'), table['Mat'][group_index])
+    if len(part_names) > 1:
+        # Element IDs are unique per part only
+        np.save(os.path.join(export_directory, 'part_ids.npy'), np.concatenate(part_index))
+        files['part_ids'] = 'part_ids.npy'
+    for column in columns:
+        np.save(os.path.join(export_directory, column_file(column)), table[column][group_index])
+        files[column] = column_file(column)
+    np.save(os.path.join(export_directory, 'materials.npy'), table)
+    description = {'deck': os.path.basename(deck_file), 'elements': len(element_ids), 'materials': len(table),
+                   'parts': [part or '' for part in part_names], 'files': files,
+                   'material_names': df_materials_aniso['Mat'].astype(str).tolist()}
+    with open(os.path.join(export_directory, 'element_properties.json'), 'w') as f:
+        json.dump(description, f, indent=2)
+    print(f"Properties of {len(element_ids)} elements written to {export_directory}")
+    return export_directory
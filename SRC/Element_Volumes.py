@@ -0,0 +1,128 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Element_Volumes.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Reads the *Node and *Element blocks of the Abaqus INP file into NumPy arrays and
+#              calculates the tetrahedral element volumes (C3D4/C3D10). The volumes can be used as
+#              weight of a material during grouping instead of the number of elements.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in the grouping methods:
+#     from Element_Volumes import add_volume_column, weighted_error_stats
+#     usage in code:
+#     merged_df = add_volume_column(merged_df, file_name)
+# =============================================================================
+import re
+import numpy as np
+import pandas as pd
+
+# Number of nodes per element for the supported tetrahedral element types, only the
+# four corner nodes are used for the volume (straight edged C3D10 elements)
+TET_NODES = {'C3D4': 4, 'C3D4H': 4, 'C3D10': 10, 'C3D10H': 10, 'C3D10M': 10, 'C3D10MH': 10}
+
+def parse_numbers(text, dtype=np.float64):
+    # Bulk conversion of comma/whitespace separated data lines
+    return np.fromstring(text.replace(',', ' '), sep=' ', dtype=dtype)
+
+def read_mesh(file_name):
+    with open(file_name, 'r') as f:
+        text = f.read()
+
+    keywords = [(match.start(), match.end(), match.group().strip()) for match in re.finditer(r'^\*.*$', text, re.M)]
+    keywords.append((len(text), len(text), ''))
+
+    node_blocks = []
+    element_blocks = []
+    for (start, end, keyword), (next_start, _, _) in zip(keywords[:-1], keywords[1:]):
+        keyword_upper = keyword.upper().replace(' ', '')
+        if keyword_upper.startswith('**'):
+            continue
+        if keyword_upper == '*NODE' or keyword_upper.startswith('*NODE,'):
+            node_blocks.append(text[end:next_start])
+        elif keyword_upper.startswith('*ELEMENT,'):
+            type_match = re.search(r'TYPE=([^,\s]+)', keyword_upper)
+            element_type = type_match.group(1) if type_match else None
+            if element_type in TET_NODES:
+                element_blocks.append((element_type, text[end:next_start]))
+            else:
+                print(f"Warning: element type {element_type} is not supported for volume calculation and is skipped")
+
+    node_data = parse_numbers(' '.join(node_blocks)).reshape(-1, 4)
+    node_ids = node_data[:, 0].astype(np.int64)
+    coordinates = node_data[:, 1:]
+
+    element_ids = []
+    connectivity = []
+    for element_type, block in element_blocks:
+        element_data = parse_numbers(block, dtype=np.int64).reshape(-1, TET_NODES[element_type] + 1)
+        element_ids.append(element_data[:, 0])
+        connectivity.append(element_data[:, 1:5])
+    element_ids = np.concatenate(element_ids) if element_ids else np.empty(0, dtype=np.int64)
+    connectivity = np.concatenate(connectivity) if connectivity else np.empty((0, 4), dtype=np.int64)
+    return node_ids, coordinates, element_ids, connectivity
+
+def build_lookup(ids):
+    # Dense array mapping an Abaqus ID to its row in the parsed arrays, -1 for unknown IDs
+    lookup = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    return lookup
+
+def lookup_rows(lookup, ids, kind='nodes'):
+    # Rows of the IDs in a lookup of build_lookup, unknown IDs would index the last row with -1
+    valid = (ids >= 0) & (ids < len(lookup))
+    rows = np.full(ids.shape, -1, dtype=np.int64)
+    rows[valid] = lookup[ids[valid]]
+    if np.any(rows < 0):
+        missing = np.unique(ids[rows < 0])
+        raise ValueError(f"Elements reference {len(missing)} undefined {kind}, e.g. {missing[:10].tolist()}")
+    return rows
+
+def calculate_tet_volumes(node_ids, coordinates, connectivity):
+    corners = coordinates[lookup_rows(build_lookup(node_ids), connectivity)]
+    a = corners[:, 1] - corners[:, 0]
+    b = corners[:, 2] - corners[:, 0]
+    c = corners[:, 3] - corners[:, 0]
+    return np.abs(np.einsum('ij,ij->i', a, np.cross(b, c))) / 6.0
+
+def calculate_element_volumes(file_name, parse_workers=1):
+    if parse_workers == 1:
+        node_ids, coordinates, element_ids, connectivity = read_mesh(file_name)
+    else:
+        from Parallel_Mesh_Parser import read_mesh_parallel
+        node_ids, coordinates, element_ids, connectivity = read_mesh_parallel(file_name, parse_workers)
+    volumes = calculate_tet_volumes(node_ids, coordinates, connectivity)
+    print(f"Calculated volumes of {len(element_ids)} elements, total volume: {volumes.sum():.4f}")
+    return element_ids, volumes
+
+def calculate_set_volumes(numbers, element_ids, volumes):
+    # The IDs of all sets are parsed at once and summed per set with one bincount, IDs without volume count 0
+    volume_lookup = np.zeros(int(element_ids.max()) + 1 if len(element_ids) else 1)
+    volume_lookup[element_ids] = volumes
+    numbers = pd.Series(numbers)
+    is_text = numbers.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    texts = numbers[is_text]
+    counts = texts.str.count(r'\d+').to_numpy(dtype=np.int64)
+    ids = parse_numbers(' '.join(texts.str.replace(',', ' ', regex=False)), dtype=np.int64)
+    if len(ids) != counts.sum():
+        raise ValueError("Element sets contain entries that are not element IDs")
+    set_index = np.repeat(np.arange(len(texts)), counts)
+    inside = ids < len(volume_lookup)
+    set_volumes = np.full(len(numbers), np.nan)
+    set_volumes[is_text] = np.bincount(set_index[inside], weights=volume_lookup[ids[inside]], minlength=len(texts))
+    return set_volumes
+
+def add_volume_column(merged_df, file_name, parse_workers=1):
+    element_ids, volumes = calculate_element_volumes(file_name, parse_workers)
+    merged_df['volume_column'] = calculate_set_volumes(merged_df['Numbers'], element_ids, volumes)
+    return merged_df
+
+def weighted_error_stats(errors, weights):
+    errors = np.abs(np.asarray(errors, dtype=float))
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    mean_error = np.sum(weights * errors) / np.sum(weights)
+    rmse = np.sqrt(np.sum(weights * errors ** 2) / np.sum(weights))
+    return rmse, mean_error
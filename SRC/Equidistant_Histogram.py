@@ -18,7 +18,9 @@
 import re
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from Plotting import render_plot
+from Material_Statistics import write_material_statistics
+from Element_Volumes import add_volume_column, weighted_error_stats
 
 def extract_material_name(line):
     # Define the regular expression pattern to match "Mat_x"
@@ -79,9 +81,21 @@ def find_closest_row(row, df):
 def join_list_elements(lst):
     return [', '.join(lst)]
 
-def process_data_equidistant(file_name, df_materials_inp, num_equidistant_groups,plot_equidistant_histogram_on,config):
-    df = extract_data_from_file(file_name)
+def draw_equidistant_histogram(figure, HU, values_list):
+    ax = figure.add_subplot()
+    ax.hist(HU[~np.isnan(HU)], bins=20, edgecolor='black')
+    for boundary in values_list:
+        ax.axvline(x=boundary, color='red', linestyle='--', linewidth=1.5)
+    ax.set_xlabel('Values')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Histogram (HU)')
+
+def process_data_equidistant(file_name, df_materials_inp, num_equidistant_groups,plot_equidistant_histogram_on,config, weight_column="count_column", parse_workers=1, elset_df=None, statistics_format="npz", statistics_csv_on=False):
+    # elset_df holds the element sets (and volumes) of materials that are already in memory, e.g. after CT mapping
+    df = extract_data_from_file(file_name) if elset_df is None else elset_df.copy()
     df['count_column'] = df['Numbers'].apply(count_numbers_in_row)
+    if weight_column == "volume_column" and 'volume_column' not in df:
+        df = add_volume_column(df, file_name, parse_workers)
     merged_df = pd.concat([df_materials_inp.set_index('Mat'), df.set_index('Solid Section Information')], axis=1)
     merged_df.drop(columns=['Elset Information'], inplace=True)
     #print(merged_df)
@@ -112,14 +126,20 @@ def process_data_equidistant(file_name, df_materials_inp, num_equidistant_groups
     #print(threshold_grouping_df)
     #print(merged_df)
     threshold_grouping_df["count_column"] = 0
+    if weight_column == "volume_column":
+        threshold_grouping_df["volume_column"] = 0.0
     threshold_grouping_df["Numbers"] = [[] for _ in range(len(E_z_list))]
     squared_errors = []
     error_list = []
+    group_list = []
     for _, row in merged_df.iterrows():
         closest_row = find_closest_row(row, threshold_grouping_df)
         # update your grouping counts as before
         threshold_grouping_df.at[closest_row.name, 'count_column'] += row['count_column']
+        if weight_column == "volume_column":
+            threshold_grouping_df.at[closest_row.name, 'volume_column'] += row['volume_column']
         threshold_grouping_df.at[closest_row.name, 'Numbers'].append(row['Numbers'])
+        group_list.append(closest_row.name)
         
         # compute the raw error
         error = threshold_grouping_df.at[closest_row.name, 'E_z'] - row['E_z']
@@ -139,14 +159,8 @@ def process_data_equidistant(file_name, df_materials_inp, num_equidistant_groups
     
     
     if plot_equidistant_histogram_on == True:
-        plt.figure(figsize=(8, 6))
-        plt.hist(merged_df['HU'], bins=20, edgecolor='black')
-        for boundary in values_list:
-            plt.axvline(x=boundary, color='red', linestyle='--', linewidth=1.5)
-        plt.xlabel('Values')
-        plt.ylabel('Frequency')
-        plt.title('Histogram (HU)')
-        plt.show()
+        render_plot('equidistant_histogram', draw_equidistant_histogram, file_name.rstrip('.inp')+'_' +str(num_equidistant_groups)+'EquiGroups' + "_histogram.png",
+                    merged_df['HU'].to_numpy(dtype=float), list(values_list))
 
     # plt.figure(figsize=(8, 6))
     # plt.hist(error_list, bins=50, edgecolor='black')
@@ -166,25 +180,20 @@ def process_data_equidistant(file_name, df_materials_inp, num_equidistant_groups
     #print('Mean Grouping Error', mean_error)
     #print('Max Grouping Error', max_error)
     threshold_grouping_df2 = threshold_grouping_df.reset_index(drop=True)
-    merged_df =merged_df.reset_index(drop=True)
-    
-    report_df2 = pd.DataFrame()
-    report_df2['E_z'] = merged_df['E_z']
-    #report_df2['New E_z'] = threshold_grouping_df['E_z']
-    report_df2['Grouping_error'] = error_list
-    report_df2['Element_ID'] = merged_df['Numbers']
-    report_df2['E_z after Grouping'] = threshold_grouping_df2['E_z']
-    report_df2['Amount of Elements in Group'] = threshold_grouping_df2['count_column']
+    material_df = merged_df.rename_axis('Mat').reset_index()
+    material_df['Group'] = threshold_grouping_df.index.get_indexer(group_list)
     print('Threshold grouping df: \n ', threshold_grouping_df2)
-    print(report_df2)
     print(threshold_grouping_df['count_column'])
-    csv_name = file_name.rstrip('.inp')+'_' +str(num_equidistant_groups)+'EquiGroups' +"_MaterialStatistics.csv"
-    report_df2.to_csv(csv_name, index=False)
+    write_material_statistics(file_name.rstrip('.inp')+'_' +str(num_equidistant_groups)+'EquiGroups', material_df, threshold_grouping_df2, statistics_format, statistics_csv_on)
     # Write the statistics into a text file
     with open(file_name.rstrip('.inp')+'_' +str(num_equidistant_groups)+'EquiGroups' + "_grouping_error_stats.txt", "w") as file:
         file.write(f"RMSE: {rmse}\n")
         file.write(f"Mean Grouping Error: {mean_error}\n")
         file.write(f"Max Grouping Error: {max_error}\n")
+        if weight_column == "volume_column":
+            weighted_rmse, weighted_mean_error = weighted_error_stats(error_list, merged_df[weight_column])
+            file.write(f"Volume Weighted RMSE: {weighted_rmse}\n")
+            file.write(f"Volume Weighted Mean Grouping Error: {weighted_mean_error}\n")
         
     return threshold_grouping_df
 
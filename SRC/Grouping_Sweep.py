@@ -0,0 +1,141 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Grouping_Sweep.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Evaluates many grouping configurations (KMeans cluster counts, percentual thresholds,
+#              equidistant and quantile group counts) in parallel worker processes and summarizes the grouping errors
+#              in <file_name1>_GroupingSweep.csv. The material arrays (E_z, HU, weights, element IDs as
+#              ids/offsets) are parsed once and shared with the workers as memory mapped files, the workers
+#              only receive the file paths and the configuration to evaluate. The groups are formed like in
+#              the grouping methods, no INP or statistics files are written for the sweep points.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Grouping_Sweep import sweep_configurations, run_grouping_sweep
+#     usage in code:
+#     configurations = sweep_configurations(sweep_num_clusters, sweep_threshold_percentages, sweep_num_equidistant_groups, sweep_num_quantile_groups)
+#     run_grouping_sweep(file_name, file_name1, df, elset_df, configurations, Material_Config, grouping_weight, mesh_parse_workers, sweep_workers)
+#     Must be called below an if __name__ == "__main__": guard, as the workers are separate processes
+# =============================================================================
+import os
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from Equidistant_Histogram import extract_data_from_file, count_numbers_in_row
+from Element_Volumes import add_volume_column
+from Material_Statistics import element_id_arrays
+from PercentualThresholding import generate_values as threshold_values
+from Equidistant_Histogram import generate_values as equidistant_values
+from Quantile_Grouping import quantile_groups
+from KMeans_Fitting import fit_kmeans
+from Shared_Arrays import share_arrays, attach_arrays, release_arrays
+from Stage_Cache import HU_PARAMETERS
+
+_arrays = {}
+_config = {}
+_kmeans = {}
+
+def sweep_configurations(num_clusters_list, threshold_percentages, num_equidistant_groups_list, num_quantile_groups_list=()):
+    return ([("Kmeans_Clustering", value) for value in num_clusters_list] +
+            [("Percentual_Thresholding", value) for value in threshold_percentages] +
+            [("Equidistant", value) for value in num_equidistant_groups_list] +
+            [("Quantile", value) for value in num_quantile_groups_list])
+
+def material_arrays(df_materials, elset_df):
+    # One row per material with elements, in the order of the material table
+    merged_df = df_materials.merge(elset_df.rename(columns={'Solid Section Information': 'Mat'}), on='Mat')
+    counts = merged_df['Numbers'].apply(count_numbers_in_row).to_numpy(dtype=np.int64)
+    element_ids, element_offsets = element_id_arrays(merged_df['Numbers'], counts)
+    arrays = {'E_z': merged_df['E_z'].to_numpy(dtype=float), 'HU': merged_df['HU'].to_numpy(dtype=float),
+              'element_ids': element_ids, 'element_offsets': element_offsets}
+    if 'volume_column' in merged_df:
+        arrays['volume'] = merged_df['volume_column'].to_numpy(dtype=float)
+    return arrays
+
+def _attach(descriptor, hu_parameters, kmeans_settings, limit_threads):
+    _arrays.update(attach_arrays(descriptor))
+    _config.update(hu_parameters)
+    _kmeans.update(kmeans_settings)
+    if limit_threads:
+        # One thread per worker process, the parallelism comes from the processes
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+
+def closest_level(E_z, levels, chunk_rows=100000):
+    # Index of the closest level for every material, the first one on ties like idxmin
+    assignment = np.empty(len(E_z), dtype=np.int64)
+    for start in range(0, len(E_z), chunk_rows):
+        distances = np.abs(levels[None, :] - E_z[start:start + chunk_rows, None])
+        assignment[start:start + chunk_rows] = np.where(np.isnan(distances), np.inf, distances).argmin(axis=1)
+    return assignment
+
+def equidistant_levels(HU, num_equidistant_groups):
+    values_list = equidistant_values(HU[0], None, num_equidistant_groups)[::-1]
+    midpoints = np.array([(values_list[i] + values_list[i + 1]) / 2 for i in range(len(values_list) - 1)])
+    c = _config
+    with np.errstate(invalid='ignore'):
+        E_z = c['a_Youngs'] + c['b_Youngs'] * np.power(c['a_Ash'] + c['b_Ash'] * (c['a_Qct'] + c['b_Qct'] * midpoints), c['c_Youngs'])
+    return np.where(E_z < 1, 1, E_z)
+
+def group_materials(method, parameter, E_z, HU, weights, weight_column):
+    # Group of every material and the modulus of the groups
+    if method == "Kmeans_Clustering":
+        assignment, _ = fit_kmeans(np.column_stack([weights, E_z]), parameter, **_kmeans)
+        if weight_column == "volume_column":
+            group_E_z = np.bincount(assignment, E_z * weights) / np.bincount(assignment, weights)
+        else:
+            group_E_z = np.bincount(assignment, E_z) / np.bincount(assignment)
+        return assignment, group_E_z
+    if method == "Quantile":
+        return quantile_groups(E_z, weights, parameter)
+    if method == "Percentual_Thresholding":
+        group_E_z = np.array(threshold_values(E_z[0], E_z[E_z > 0.001].min(), parameter) + [0.001])
+    elif method == "Equidistant":
+        group_E_z = equidistant_levels(HU, parameter)
+    else:
+        raise ValueError(f"Grouping method {method} is not supported in the sweep")
+    return closest_level(E_z, group_E_z), group_E_z
+
+def evaluate_configuration(configuration, weight_column="count_column"):
+    method, parameter = configuration
+    E_z = np.asarray(_arrays['E_z'])
+    HU = np.asarray(_arrays['HU'])
+    counts = np.diff(_arrays['element_offsets'])
+    volumes = np.asarray(_arrays['volume']) if 'volume' in _arrays else None
+    weights = volumes if weight_column == "volume_column" else counts
+    assignment, group_E_z = group_materials(method, parameter, E_z, HU, weights, weight_column)
+    errors = np.abs(group_E_z[assignment] - E_z)
+    result = {'Grouping_Method': method, 'Parameter': parameter, 'Groups': len(np.unique(assignment)),
+              'RMSE': np.sqrt(np.mean(errors ** 2)), 'Mean Grouping Error': errors.mean(), 'Max Grouping Error': errors.max(),
+              'Element Weighted Mean Grouping Error': np.sum(errors * counts) / counts.sum()}
+    if volumes is not None:
+        result['Volume Weighted RMSE'] = np.sqrt(np.sum(volumes * errors ** 2) / volumes.sum())
+        result['Volume Weighted Mean Grouping Error'] = np.sum(volumes * errors) / volumes.sum()
+    return result
+
+def run_grouping_sweep(file_name, file_name1, df, elset_df, configurations, config, weight_column="count_column", parse_workers=1, sweep_workers=0,
+                       n_init="auto", tol=1e-4, centroid_directory=None, binned_above=0):
+    # sweep_workers = 0 uses all available cores, with a centroid_directory the KMeans fits start from stored centroids
+    elset_df = extract_data_from_file(file_name) if elset_df is None else elset_df.copy()
+    if weight_column == "volume_column" and 'volume_column' not in elset_df:
+        elset_df = add_volume_column(elset_df, file_name, parse_workers)
+    workers = min(sweep_workers if sweep_workers > 0 else os.cpu_count(), len(configurations))
+    hu_parameters = {name: getattr(config, name) for name in HU_PARAMETERS}
+    kmeans_settings = {'n_init': n_init, 'tol': tol, 'centroid_directory': centroid_directory, 'binned_above': binned_above}
+    descriptor = share_arrays(material_arrays(df, elset_df))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(descriptor, hu_parameters, kmeans_settings, workers > 1)) as executor:
+            results = list(executor.map(evaluate_configuration, configurations, repeat(weight_column)))
+    finally:
+        release_arrays(descriptor)
+    sweep_df = pd.DataFrame(results)
+    sweep_df['Parameter'] = pd.Series([result['Parameter'] for result in results], dtype=object)
+    sweep_df.to_csv(file_name1 + '_GroupingSweep.csv', index=False)
+    print(sweep_df)
+    print(f"Evaluated {len(configurations)} grouping configurations with {workers} workers")
+    return sweep_df
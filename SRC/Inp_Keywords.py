@@ -0,0 +1,52 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Inp_Keywords.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Helper functions to read Abaqus keyword lines and to iterate through INP files in chunks
+#              of bounded size. Used by the streaming mode and the keyword driven writers.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     from Inp_Keywords import iter_line_chunks, is_keyword, keyword_name, keyword_parameters
+#     for lines in iter_line_chunks(file_name, chunk_bytes):
+#         for line in lines:
+#             if is_keyword(line) and keyword_name(line) == '*ELSET':
+#                 set_name = keyword_parameters(line).get('elset')
+# =============================================================================
+
+# Keywords that belong to a *Material block and are removed together with it
+MATERIAL_OPTIONS = ('*DENSITY', '*ELASTIC', '*PLASTIC', '*POTENTIAL', '*DEPVAR', '*USERMATERIAL', '*EXPANSION', '*DAMPING')
+
+def iter_line_chunks(file_name, chunk_bytes):
+    # readlines with a size hint never holds more than about chunk_bytes of the file
+    with open(file_name, 'r') as f:
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            yield lines
+
+def keyword_parameters(line):
+    parameters = {}
+    for item in line.strip().split(',')[1:]:
+        key, _, value = item.partition('=')
+        parameters[key.strip().lower()] = value.strip()
+    return parameters
+
+def is_keyword(line):
+    return line.startswith('*') and not line.startswith('**')
+
+def keyword_name(line):
+    return line.split(',')[0].strip().upper().replace(' ', '')
+
+def section_elsets(file_name, chunk_bytes=64 * 1024 * 1024):
+    # Element sets that are referenced by a *Solid Section, i.e. the material sets
+    elsets = set()
+    for lines in iter_line_chunks(file_name, chunk_bytes):
+        for line in lines:
+            if is_keyword(line) and keyword_name(line) == '*SOLIDSECTION':
+                elsets.add(keyword_parameters(line).get('elset'))
+    return elsets
@@ -0,0 +1,118 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Input_Translation.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Front end for the material mapped exports of Mimics, Simpleware ScanIP and Bonemat V4.
+#              The source tool is detected from the keyword lines (material names tibia_dis_mat_material*
+#              or Mat0, *Density lines). Bonemat files are read directly by process_material_data, the
+#              exports of the other tools are translated in memory into the material and
+#              element set tables of the grouping pipeline: materials Mat_i sorted by descending modulus,
+#              element sets Set_i with the element IDs of material i. No intermediate INP files are
+#              written, the export itself serves as template for the output deck.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Input_Translation import detect_input_format, translate_input
+#     usage in code:
+#     input_source = detect_input_format(file_name)
+#     df, elset_df = translate_input(file_name, Material_Config)
+#     df has the same layout as the output of process_material_data, elset_df the layout of extract_data_from_file
+# =============================================================================
+import re
+import numpy as np
+import pandas as pd
+from Inp_Keywords import MATERIAL_OPTIONS, iter_line_chunks, keyword_parameters, is_keyword, keyword_name
+from Parallel_Mesh_Parser import scan_keywords
+from Recalculate_HU import recalculate_material_data
+
+INPUT_FORMATS = ("Auto", "Bonemat3", "Bonemat4", "Mimics", "Simpleware")
+
+def detect_input_format(file_name):
+    has_density = False
+    material_names = []
+    for keyword, _, _ in scan_keywords(file_name):
+        if not is_keyword(keyword):
+            continue
+        name = keyword_name(keyword)
+        if name == '*MATERIAL':
+            material_names.append(keyword_parameters(keyword).get('name', ''))
+        elif name == '*DENSITY':
+            has_density = True
+    if any('tibia_dis_mat_material' in material.lower() for material in material_names):
+        return "Mimics"
+    if any(re.fullmatch(r'Mat\d+', material, re.IGNORECASE) or re.fullmatch(r'Mat_0+', material) for material in material_names):
+        return "Simpleware"
+    if has_density:
+        return "Bonemat4"
+    return "Bonemat3"
+
+def expand_generate(text):
+    values = [int(value) for value in text.replace(',', ' ').split()]
+    ids = [np.arange(values[i], values[i + 1] + 1, values[i + 2] if i + 2 < len(values) else 1) for i in range(0, len(values), 3)]
+    return ','.join(map(str, np.concatenate(ids))) if ids else ''
+
+def collect_sets_and_materials(file_name, chunk_bytes=64 * 1024 * 1024):
+    set_lines = {}
+    set_generate = {}
+    set_material = {}
+    material_E = {}
+    current_set = None
+    current_material = None
+    read_elastic = False
+    for lines in iter_line_chunks(file_name, chunk_bytes):
+        for line in lines:
+            if is_keyword(line):
+                keyword = keyword_name(line)
+                parameters = keyword_parameters(line)
+                current_set = None
+                read_elastic = False
+                if keyword == '*ELSET':
+                    current_set = parameters.get('elset', '').upper()
+                    set_generate[current_set] = 'generate' in parameters
+                    set_lines.setdefault(current_set, [])
+                elif keyword == '*SOLIDSECTION':
+                    set_material[parameters.get('elset', '').upper()] = parameters.get('material')
+                elif keyword == '*MATERIAL':
+                    current_material = parameters.get('name')
+                elif keyword == '*ELASTIC' and current_material is not None:
+                    read_elastic = True
+                elif not keyword.startswith(MATERIAL_OPTIONS):
+                    current_material = None
+            elif line.startswith('**'):
+                continue
+            elif read_elastic:
+                material_E[current_material] = float(line.split(',')[0])
+                read_elastic = False
+            elif current_set is not None and line.strip():
+                set_lines[current_set].append(line.strip().rstrip(','))
+    return set_lines, set_generate, set_material, material_E
+
+def translate_input(file_name, config, chunk_bytes=64 * 1024 * 1024):
+    set_lines, set_generate, set_material, material_E = collect_sets_and_materials(file_name, chunk_bytes)
+
+    # Elements of all sets that share a material are merged, materials without elements are dropped
+    material_numbers = {}
+    for set_name, material in set_material.items():
+        if set_name not in set_lines:
+            print(f"Warning: element set {set_name} of material {material} is not defined and is skipped")
+            continue
+        text = ','.join(set_lines[set_name])
+        numbers = expand_generate(text) if set_generate[set_name] else ','.join(part.strip() for part in text.split(',') if part.strip())
+        if numbers:
+            material_numbers.setdefault(material, []).append(numbers)
+    missing = [material for material in material_numbers if material not in material_E]
+    if missing:
+        raise ValueError(f"No *Elastic definition found for the materials {missing[:5]}")
+
+    materials = sorted(material_numbers, key=lambda material: material_E[material], reverse=True)
+    new_names = [f"Mat_{rank}" for rank in range(1, len(materials) + 1)]
+    df_materials = pd.DataFrame({'Mat': new_names, 'E_z': [material_E[material] for material in materials]})
+    elset_df = pd.DataFrame({'Elset Information': [f"Set_{rank}" for rank in range(1, len(materials) + 1)],
+                             'Numbers': [','.join(material_numbers[material]) for material in materials],
+                             'Solid Section Information': new_names})
+    print(f"Translated {len(materials)} materials with element sets")
+    return recalculate_material_data(df_materials, config), elset_df
@@ -0,0 +1,257 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Job_Server.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Local job server for the interactive tuning of a grouping. The mesh is read and mapped once,
+#              the material table and the element sets (with element volumes) stay in memory. Requests to
+#              regroup, to recalculate the materials with a changed Material_Config or to write the INP
+#              are answered over localhost HTTP with JSON. The requests are handled with asyncio, the
+#              computations run in a thread pool. Interactive requests (group, materials) are started
+#              before queued batch exports (write). The workers compute on a snapshot of the shared grouping and
+#              materials and hold a lock only to read or replace them, INP exports are written one at a time.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Job_Server import run_job_server
+#     usage in code:
+#     run_job_server(map_materials, file_name, file_name1, settings, Material_Config, server_port, server_workers)
+#     requests:
+#     curl -d '{"Grouping_Method": "Kmeans_Clustering", "num_clusters": 40}' localhost:8765/group
+#     curl -d '{"Material_Config": {"Scale_G_xy": 0.2}}' localhost:8765/materials
+#     curl -d '{}' localhost:8765/write
+#     curl localhost:8765/status
+#     curl -d '{}' localhost:8765/shutdown
+# =============================================================================
+import json
+import time
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Equidistant_Histogram import extract_data_from_file
+from Element_Volumes import add_volume_column
+from PercentualThresholding import process_data
+from KMeans_Clustering import process_clustering
+from Equidistant_Histogram import process_data_equidistant
+from Quantile_Grouping import process_quantile_grouping
+from Calculate_Material_Parameters import CalculateMaterial
+from Write_Abaqus_Output import process_aniso_material_file, write_model_deck, output_name
+from Material_Statistics import statistics_name, error_summary
+from Plotting import configure_plotting, wait_for_plots
+from Stage_Cache import config_hash, HU_PARAMETERS
+
+GROUPING_SETTINGS = ('Grouping_Method', 'num_clusters', 'threshold_percentage', 'num_equidistant_groups', 'num_quantile_groups', 'grouping_weight')
+INTERACTIVE_PRIORITY = 0
+BATCH_PRIORITY = 1
+
+class JobServer:
+    def __init__(self, map_function, file_name, file_name1, settings, config, workers=2):
+        self.map_function = map_function
+        self.file_name = file_name
+        self.file_name1 = file_name1
+        self.settings = dict(settings)
+        self.base_config = config
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.sequence = itertools.count()
+        # The lock guards the shared state only, the computations run outside of it on a snapshot of the state
+        self.lock = threading.Lock()
+        # Mappings after a HU change are loaded one at a time
+        self.load_lock = threading.Lock()
+        # process_aniso_material_file writes mapped_aniso_material.inp in the working directory
+        self.write_lock = threading.Lock()
+        self.queue = None
+        self.mapping = None
+        self.group_elset_df = None
+        self.grouping = None
+        self.materials = None
+        self.load(config)
+
+    def load(self, config):
+        # Material table and element sets of the mesh, the element sets are parsed only once
+        key = config_hash(config, HU_PARAMETERS)
+        with self.load_lock:
+            if self.mapping is not None and self.mapping[0] == key:
+                return
+            start = time.time()
+            df, elset_df = self.map_function(config)
+            group_elset_df = self.group_elset_df
+            if group_elset_df is None:
+                group_elset_df = extract_data_from_file(self.file_name) if elset_df is None else elset_df.copy()
+                if self.settings['grouping_weight'] == "volume_column":
+                    group_elset_df = add_volume_column(group_elset_df, self.file_name, self.settings['mesh_parse_workers'])
+            with self.lock:
+                self.mapping = (key, df, elset_df)
+                self.group_elset_df = group_elset_df
+            print(f"Mesh {self.file_name} loaded in {time.time() - start:.2f} s")
+
+    def material_config(self, overrides):
+        return type('Material_Config', (self.base_config,), overrides) if overrides else self.base_config
+
+    def snapshot(self):
+        with self.lock:
+            return self.mapping, self.group_elset_df, self.grouping, self.materials
+
+    def group(self, request):
+        settings = dict(self.settings)
+        settings.update({name: request[name] for name in GROUPING_SETTINGS if name in request})
+        mapping, elset_df, grouping, _ = self.snapshot()
+        if settings['grouping_weight'] == "volume_column" and 'volume_column' not in elset_df:
+            elset_df = add_volume_column(elset_df.copy(), self.file_name, settings['mesh_parse_workers'])
+            with self.lock:
+                self.group_elset_df = elset_df
+        config = grouping[2] if grouping else self.base_config
+        grouping_df = self.run_grouping(settings, config, mapping, elset_df)
+        with self.lock:
+            if self.mapping is not mapping:
+                raise RuntimeError("The HU calibration was changed during the grouping, repeat the request")
+            self.grouping = (settings, grouping_df, config)
+            self.materials = None
+        result = {name: settings[name] for name in GROUPING_SETTINGS}
+        if settings['Grouping_Method'] != "None":
+            result.update(error_summary(statistics_name(self.file_name, settings['Grouping_Method'], settings['num_clusters'],
+                                                        settings['threshold_percentage'], settings['num_equidistant_groups'], settings['num_quantile_groups'])))
+        return result
+
+    def run_grouping(self, settings, config, mapping, elset_df):
+        _, df, _ = mapping
+        method = settings['Grouping_Method']
+        weight = settings['grouping_weight']
+        workers = settings['mesh_parse_workers']
+        if method == "None":
+            return df.merge(elset_df[['Solid Section Information', 'Numbers']].rename(columns={'Solid Section Information': 'Mat'}), on='Mat')
+        if method == "Percentual_Thresholding":
+            return process_data(self.file_name, df.copy(), settings['threshold_percentage'], weight, workers, elset_df, "npz", False)
+        if method == "Equidistant":
+            return process_data_equidistant(self.file_name, df.copy(), settings['num_equidistant_groups'], settings['plot_equidistant_histogram_on'],
+                                            config, weight, workers, elset_df, "npz", False)
+        if method == "Kmeans_Clustering":
+            return process_clustering(self.file_name, df.copy(), settings['num_clusters'], settings['plot_cluster_on'],
+                                      settings['plot_percentual_diff_on'], weight, workers, elset_df, "npz", False,
+                                      settings['kmeans_n_init'], settings['kmeans_tol'], settings['kmeans_centroid_directory'], settings['kmeans_binned_above'])
+        if method == "Quantile":
+            return process_quantile_grouping(self.file_name, df.copy(), settings['num_quantile_groups'], weight, workers, elset_df, "npz", False)
+        raise ValueError(f"Grouping method {method} is not supported")
+
+    def calculate_materials(self, request):
+        config = self.material_config(request.get('Material_Config', {}))
+        mapping, _, previous, _ = self.snapshot()
+        grouping = previous
+        # Settings of the last grouping, the startup settings before the first /group request
+        settings = grouping[0] if grouping else self.settings
+        if config_hash(config, HU_PARAMETERS) != mapping[0]:
+            # The HU calibration changed, the mapping and the grouping are recalculated
+            self.load(config)
+            grouping = None
+        if grouping is None:
+            mapping, elset_df, _, _ = self.snapshot()
+            grouping = (settings, self.run_grouping(settings, config, mapping, elset_df), config)
+        settings, grouping_df, _ = grouping
+        df_materials_aniso = CalculateMaterial(grouping_df.copy(), config)
+        with self.lock:
+            if self.grouping is not previous:
+                raise RuntimeError("The grouping was changed during the material calculation, repeat the request")
+            self.grouping = grouping
+            self.materials = (settings, config, df_materials_aniso)
+        table = df_materials_aniso.drop(columns=['Numbers'], errors='ignore')
+        return {'materials': json.loads(table.to_json(orient='records'))}
+
+    def write(self, request):
+        mapping, _, _, materials = self.snapshot()
+        if materials is None:
+            self.calculate_materials({})
+            mapping, _, _, materials = self.snapshot()
+        settings, config, df_materials_aniso = materials
+        output_file = output_name(self.file_name1, settings['Grouping_Method'], settings['num_clusters'],
+                                  settings['threshold_percentage'], settings['num_equidistant_groups'], settings['num_quantile_groups']) + '.inp'
+        with self.write_lock:
+            # The writers change the Numbers column, the shared material table is not passed
+            if mapping[2] is None and settings['Grouping_Method'] != "Quantile":
+                process_aniso_material_file(df_materials_aniso.copy(), self.file_name, settings['Grouping_Method'], self.file_name1, settings['num_clusters'],
+                                            settings['threshold_percentage'], settings['num_equidistant_groups'], config)
+            else:
+                write_model_deck(df_materials_aniso.copy(), self.file_name, output_file, config)
+        wait_for_plots()
+        return {'output_file': output_file}
+
+    def status(self, request):
+        _, df, _ = self.mapping
+        return {'file_name': self.file_name, 'materials': len(df), 'queued': self.queue.qsize(),
+                'grouping': {name: self.grouping[0][name] for name in GROUPING_SETTINGS} if self.grouping else None}
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, function, request, future = await self.queue.get()
+            start = time.time()
+            try:
+                result = await loop.run_in_executor(self.executor, function, request)
+                result['seconds'] = round(time.time() - start, 4)
+                future.set_result((200, result))
+            except Exception as error:
+                future.set_result((400, {'error': f"{type(error).__name__}: {error}"}))
+
+    async def submit(self, priority, function, request):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((priority, next(self.sequence), function, request, future))
+        return await future
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            path = request_line[1] if len(request_line) > 1 else '/'
+            request = json.loads(body) if body.strip() else {}
+            routes = {'/group': (INTERACTIVE_PRIORITY, self.group), '/materials': (INTERACTIVE_PRIORITY, self.calculate_materials),
+                      '/write': (BATCH_PRIORITY, self.write)}
+            if path == '/status':
+                status, result = 200, self.status(request)
+            elif path == '/shutdown':
+                status, result = 200, {'shutdown': True}
+                self.stop.set()
+            elif path in routes:
+                status, result = await self.submit(routes[path][0], routes[path][1], request)
+            else:
+                status, result = 404, {'error': f"Unknown request {path}, use /group, /materials, /write, /status or /shutdown"}
+        except (ValueError, IndexError) as error:
+            status, result = 400, {'error': str(error)}
+        except Exception as error:
+            status, result = 500, {'error': f"{type(error).__name__}: {error}"}
+        payload = json.dumps(result).encode()
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    async def serve(self, port):
+        self.queue = asyncio.PriorityQueue()
+        self.stop = asyncio.Event()
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.handle, '127.0.0.1', port)
+        print(f"Job server listening on http://127.0.0.1:{port}")
+        async with server:
+            await self.stop.wait()
+        for task in workers:
+            task.cancel()
+        self.executor.shutdown(wait=True)
+
+def run_job_server(map_function, file_name, file_name1, settings, config, server_port=8765, server_workers=2):
+    # Plots of the grouping methods are saved as PNG, windows can not be opened from the worker threads
+    configure_plotting("file", settings.get('plot_max_points', 200000))
+    server = JobServer(map_function, file_name, file_name1, settings, config, server_workers)
+    try:
+        asyncio.run(server.serve(server_port))
+    except KeyboardInterrupt:
+        pass
+    print("Job server stopped")
@@ -13,14 +13,17 @@
 #     from KMeans_Clustering import process_clustering
 #     usage in code:
 #     Kmeans_clustering_df = process_clustering(file_name, df, num_clusters, plot_cluster_on, plot_percentual_diff_on)
+#     optional: ..., kmeans_n_init, kmeans_tol, centroid_directory, kmeans_binned_above) for the KMeans fit, see KMeans_Fitting.py
 #     the input df to the clustering algorithm is the one obtained after running the recalculate HU script
 # =============================================================================
 import re
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-import matplotlib.pyplot as plt
+from KMeans_Fitting import fit_kmeans
 from matplotlib import rcParams
+from Plotting import render_plot, scatter_points
+from Material_Statistics import write_material_statistics
+from Element_Volumes import add_volume_column, weighted_error_stats
 
 def extract_material_name(line):
     pattern = r"Mat_\d{1,6}"
@@ -57,18 +60,22 @@ def extract_data_from_file(file_path):
 def count_numbers_in_row(row):
     return len(row.split(','))
 
-def perform_clustering(df_materials_aniso, num_clusters):
-    columns_for_clustering = ['count_column', 'E_z']
+def perform_clustering(df_materials_aniso, num_clusters, weight_column="count_column", n_init="auto", tol=1e-4, centroid_directory=None, binned_above=0):
+    columns_for_clustering = [weight_column, 'E_z']
     df_materials_aniso.dropna(inplace=True)
 
-    X = df_materials_aniso[columns_for_clustering]
+    X = df_materials_aniso[columns_for_clustering].to_numpy()
 
-    kmeans = KMeans(n_clusters=num_clusters, random_state=42)
-    df_materials_aniso['New_Grouping'] = kmeans.fit_predict(X)
+    # Group 0 is the cluster with the highest E_z, centroid_directory enables the warm start from stored centroids
+    df_materials_aniso['New_Grouping'], _ = fit_kmeans(X, num_clusters, n_init, tol, centroid_directory, binned_above)
     return df_materials_aniso
 
-def calculate_cluster_means(df_materials_aniso):
-    cluster_means = df_materials_aniso.groupby('New_Grouping')['E_z'].mean()
+def calculate_cluster_means(df_materials_aniso, weight_column="count_column"):
+    if weight_column == "volume_column":
+        weighted_E_z = (df_materials_aniso['E_z'] * df_materials_aniso[weight_column]).groupby(df_materials_aniso['New_Grouping']).sum()
+        cluster_means = weighted_E_z / df_materials_aniso.groupby('New_Grouping')[weight_column].sum()
+    else:
+        cluster_means = df_materials_aniso.groupby('New_Grouping')['E_z'].mean()
     cluster_means_df = cluster_means.reset_index()
     cluster_means_df.columns = ['New_Grouping', 'mean_E_z']
     return cluster_means_df
@@ -77,19 +84,21 @@ def merge_cluster_means(df_materials_aniso, cluster_means_df):
     result_df = pd.merge(df_materials_aniso, cluster_means_df, on='New_Grouping')
     return result_df
 
-def plot_clustering(df_materials_aniso, plot_cluster_on):
+def draw_clustering(figure, E_z, count, groups):
+    ax = figure.add_subplot()
+    scatter_points(ax, E_z, count, groups, 'rainbow')
+    ax.set_xlabel('E_z')
+    ax.set_ylabel('count_column')
+    ax.set_title('KMeans Clustering Visualization')
+
+def plot_clustering(df_materials_aniso, plot_cluster_on, plot_name=None):
     if plot_cluster_on:
-        plt.scatter(df_materials_aniso['E_z'], df_materials_aniso['count_column'], c=df_materials_aniso['New_Grouping'], cmap='rainbow')
-        plt.xlabel('E_z')
-        plt.ylabel('count_column')
-        plt.title('KMeans Clustering Visualization')
-        plt.show()
+        render_plot('clustering', draw_clustering, str(plot_name) + '_clustering.png',
+                    df_materials_aniso['E_z'].to_numpy(), df_materials_aniso['count_column'].to_numpy(), df_materials_aniso['New_Grouping'].to_numpy())
 
-def regroup_data(result_df,file_name,num_clusters):
+def regroup_data(result_df,file_name,num_clusters, weight_column="count_column", statistics_format="npz", statistics_csv_on=False):
     print('Min youngs: ', min(result_df['E_z']))
 
-    Grouping_error = (abs(result_df['E_z'] - result_df['mean_E_z'])).tolist()
-
     errors = result_df['E_z'] - result_df['mean_E_z']
     abs_errors = errors.abs()
     squared_errors = errors ** 2
@@ -101,6 +110,10 @@ def regroup_data(result_df,file_name,num_clusters):
     print(f"MAE: {mean_error:.4f}")
     print(f"Max AE: {max_error:.4f}")
     print(f"RMSE: {rmse:.4f}")
+    if weight_column == "volume_column":
+        weighted_rmse, weighted_mean_error = weighted_error_stats(errors, result_df[weight_column])
+        print(f"Volume weighted MAE: {weighted_mean_error:.4f}")
+        print(f"Volume weighted RMSE: {weighted_rmse:.4f}")
     # Print the statistics to the console
     #print('Mean Grouping Error', mean_error)
     #print('Max Grouping Error', max_error)
@@ -110,29 +123,29 @@ def regroup_data(result_df,file_name,num_clusters):
         file.write(f"RMSE: {rmse}\n")
         file.write(f"Mean Grouping Error: {mean_error}\n")
         file.write(f"Max Grouping Error: {max_error}\n")
+        if weight_column == "volume_column":
+            file.write(f"Volume Weighted RMSE: {weighted_rmse}\n")
+            file.write(f"Volume Weighted Mean Grouping Error: {weighted_mean_error}\n")
     #print('Result DF ', result_df)
-    regrouping_df = result_df[['New_Grouping', 'mean_E_z', 'Numbers', 'count_column']]
+    regrouping_columns = ['New_Grouping', 'mean_E_z', 'Numbers', 'count_column']
+    aggregation = {'mean_E_z': 'mean', 'count_column': 'sum', 'Numbers': list}
+    if weight_column == "volume_column":
+        regrouping_columns.append('volume_column')
+        aggregation['volume_column'] = 'sum'
+    regrouping_df = result_df[regrouping_columns]
     #print('Regrouping DF: ',regrouping_df)
-    report_df2 = pd.DataFrame()
-    report_df2['E_z'] = result_df['E_z']
-    report_df2['New E_z'] = result_df['mean_E_z']
-    report_df2['Grouping_error'] = Grouping_error
-    report_df2['Element_ID'] = result_df['Numbers']
     
     
-    regrouping_df = regrouping_df.groupby('New_Grouping', as_index=False).agg({'mean_E_z': 'mean', 'count_column': 'sum', 'Numbers': list})
+    regrouping_df = regrouping_df.groupby('New_Grouping', as_index=False).agg(aggregation)
     regrouping_df['Numbers'] = regrouping_df['Numbers'].apply(lambda x: ', '.join(x))
     regrouping_df = regrouping_df.rename(columns={'New_Grouping': 'Group', 'mean_E_z': 'E_z'})
     regrouping_df = regrouping_df.sort_values(by='E_z', ascending=False).reset_index(drop=True)
     regrouping_df['Percentual_diff'] = abs(regrouping_df['E_z'].pct_change() * 100)
-    report_df2['E_z after Grouping'] = regrouping_df['E_z']
-    report_df2['Amount of Elements in Group'] = regrouping_df['count_column']
     print(regrouping_df)
     print(file_name)
-    #print('Regrouping DF: ',regrouping_df)
-    print('Report df: \n ', report_df2)
-    csv_name = file_name.rstrip('.inp')+'_' +str(num_clusters)+'C' +"_MaterialStatistics.csv"
-    report_df2.to_csv(csv_name, index=False)
+    material_df = result_df.rename(columns={'index': 'Mat'})
+    material_df['Group'] = material_df['New_Grouping'].map(dict(zip(regrouping_df['Group'], regrouping_df.index)))
+    write_material_statistics(file_name.rstrip('.inp')+'_' +str(num_clusters)+'C', material_df, regrouping_df, statistics_format, statistics_csv_on)
     # plt.figure(figsize=(8, 6))
     # plt.hist(Grouping_error, bins=50, edgecolor='black')
     # plt.xlabel('Values')
@@ -145,38 +158,44 @@ def regroup_data(result_df,file_name,num_clusters):
     #print('Max Grouping Error', max(Grouping_error))
     return regrouping_df
 
-def plot_percentual_diff(df_materials_aniso, plot_df, plot_percentual_diff_on):
+def draw_percentual_diff(figure, E_z, count, groups, group_E_z, percentual_diff):
+    rcParams['font.family'] = 'sans-serif'
+    rcParams['font.sans-serif'] = ['Arial']
+    ax1 = figure.add_subplot()
+    scatter_points(ax1, E_z, count, groups, 'rainbow')
+    ax1.set_xlabel('Young Modulus [MPa]', fontsize=20)
+    ax1.set_ylabel('Frequency of Modulus in Elements', fontsize=20)
+    ax1.tick_params(labelcolor='Black', labelsize=16)
+
+    ax2 = ax1.twinx()
+    ax2.plot(group_E_z, percentual_diff, color='Black', linewidth=3)
+    ax2.set_ylabel('Percentual diff', color='Black', fontsize=20)
+    ax2.tick_params(axis='y', labelcolor='Black', labelsize=16)
+
+def plot_percentual_diff(df_materials_aniso, plot_df, plot_percentual_diff_on, plot_name=None):
     if plot_percentual_diff_on:
-        fig, ax1 = plt.subplots()
-        rcParams['font.family'] = 'sans-serif'
-        rcParams['font.sans-serif'] = ['Arial']
-        ax1.scatter(plot_df['E_z'], plot_df['count_column'], c=plot_df['New_Grouping'], cmap='rainbow')
-        ax1.set_xlabel('Young Modulus [MPa]', fontsize=20)
-        ax1.set_ylabel('Frequency of Modulus in Elements', fontsize=20)
-        ax1.tick_params(labelcolor='Black', labelsize=16)
-        ax1.legend(loc='upper left')
-
-        ax2 = ax1.twinx()
-        ax2.plot(df_materials_aniso["E_z"], df_materials_aniso['Percentual_diff'], color='Black', linewidth=3)
-        ax2.set_ylabel('Percentual diff', color='Black', fontsize=20)
-        ax2.tick_params(axis='y', labelcolor='Black', labelsize=16)
-        ax2.legend(loc='upper right')
-
-        plt.show()
-
-def process_clustering(file_name, df_materials_inp, num_clusters, plot_cluster_on, plot_percentual_diff_on):
-    df = extract_data_from_file(file_name)
+        render_plot('percentual_diff', draw_percentual_diff, str(plot_name) + '_percentual_diff.png',
+                    plot_df['E_z'].to_numpy(), plot_df['count_column'].to_numpy(), plot_df['New_Grouping'].to_numpy(),
+                    df_materials_aniso['E_z'].to_numpy(), df_materials_aniso['Percentual_diff'].to_numpy())
+
+def process_clustering(file_name, df_materials_inp, num_clusters, plot_cluster_on, plot_percentual_diff_on, weight_column="count_column", parse_workers=1, elset_df=None, statistics_format="npz", statistics_csv_on=False,
+                       n_init="auto", tol=1e-4, centroid_directory=None, binned_above=0):
+    # elset_df holds the element sets (and volumes) of materials that are already in memory, e.g. after CT mapping
+    df = extract_data_from_file(file_name) if elset_df is None else elset_df.copy()
     df['count_column'] = df['Numbers'].apply(count_numbers_in_row)
+    if weight_column == "volume_column" and 'volume_column' not in df:
+        df = add_volume_column(df, file_name, parse_workers)
     merged_df = pd.concat([df_materials_inp.set_index('Mat'), df.set_index('Solid Section Information')], axis=1).reset_index()
     merged_df.drop(columns=['Elset Information'], inplace=True)
 
-    df_materials_aniso = perform_clustering(merged_df, num_clusters)
-    cluster_means_df = calculate_cluster_means(df_materials_aniso)
+    df_materials_aniso = perform_clustering(merged_df, num_clusters, weight_column, n_init, tol, centroid_directory, binned_above)
+    cluster_means_df = calculate_cluster_means(df_materials_aniso, weight_column)
     result_df = merge_cluster_means(df_materials_aniso, cluster_means_df)
 
-    plot_clustering(df_materials_aniso, plot_cluster_on)
+    plot_name = file_name.rstrip('.inp')+'_' +str(num_clusters)+'C'
+    plot_clustering(df_materials_aniso, plot_cluster_on, plot_name)
 
-    regrouping_df = regroup_data(result_df,file_name,num_clusters)
-    plot_percentual_diff(regrouping_df, df_materials_aniso, plot_percentual_diff_on)
+    regrouping_df = regroup_data(result_df,file_name,num_clusters, weight_column, statistics_format, statistics_csv_on)
+    plot_percentual_diff(regrouping_df, df_materials_aniso, plot_percentual_diff_on, plot_name)
 
     return regrouping_df
\ No newline at end of file
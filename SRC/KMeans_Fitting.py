@@ -0,0 +1,153 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: KMeans_Fitting.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Reproducible KMeans fits for the grouping. The clusters are numbered by descending E_z of
+#              their centroids, so the group numbering does not depend on the initialisation. With a centroid
+#              directory the fitted centroids are stored per material data (hash of the clustered columns and
+#              of the fit settings) and cluster count. A later fit of the same data starts from the stored
+#              centroids of the same cluster count (same result without iterations) or of the closest stored
+#              cluster count, which is adapted by merging the closest centroids or adding the worst represented
+#              materials.
+#              For very large material counts (e.g. one material per element) the materials are pre-aggregated
+#              in a fine 2D histogram, the bin means are clustered with the number of materials as weight and
+#              every material gets the closest of the fitted centroids.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from KMeans_Fitting import fit_kmeans
+#     usage in code:
+#     labels, centroids = fit_kmeans(X, num_clusters, kmeans_n_init, kmeans_tol, centroid_directory, kmeans_binned_above)
+#     X holds the clustered columns, E_z last, centroid_directory = None fits without stored centroids,
+#     kmeans_binned_above = 0 clusters all materials
+# =============================================================================
+import glob
+import hashlib
+import io
+import os
+import re
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import pairwise_distances_argmin, pairwise_distances_argmin_min
+from Stage_Cache import atomic_write
+
+# Equidistant and quantile bins per clustered column of the histogram for large material counts
+HISTOGRAM_BINS = 1024
+
+def data_key(X, settings=()):
+    # Independent of the row order, e.g. of the material table and of the sweep arrays. The fit settings are part
+    # of the key, stored centroids of another n_init, tol or histogram binning are not reused
+    sha = hashlib.sha256(repr((X.shape, settings)).encode())
+    sha.update(np.ascontiguousarray(X[np.lexsort(X.T[::-1])]).tobytes())
+    return sha.hexdigest()[:32]
+
+def centroid_path(centroid_directory, key, num_clusters):
+    return os.path.join(centroid_directory, f"{key}_{num_clusters}.npy")
+
+def stored_cluster_counts(centroid_directory, key):
+    counts = []
+    for path in glob.glob(os.path.join(centroid_directory, key + '_*.npy')):
+        match = re.search(r'_(\d+)\.npy$', path)
+        if match:
+            counts.append(int(match.group(1)))
+    return counts
+
+def save_centroids(centroid_directory, key, centroids):
+    os.makedirs(centroid_directory, exist_ok=True)
+    buffer = io.BytesIO()
+    np.save(buffer, centroids)
+    atomic_write(centroid_path(centroid_directory, key, len(centroids)), buffer.getvalue())
+
+def adapt_centroids(centroids, X, num_clusters):
+    # Start centroids for another cluster count: the two clusters whose merge adds the least squared error
+    # are merged (Ward), or the cluster with the largest squared error is split at its centroid E_z,
+    # until the cluster count matches
+    centroids = [row for row in centroids]
+    if len(centroids) > num_clusters:
+        sizes = list(np.bincount(pairwise_distances_argmin(X, np.array(centroids)), minlength=len(centroids)).astype(float))
+    while len(centroids) > num_clusters:
+        array = np.array(centroids)
+        size = np.array(sizes)
+        cost = size[:, None] * size[None, :] / np.maximum(size[:, None] + size[None, :], 1) * ((array[:, None, :] - array[None, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(cost, np.inf)
+        i, j = np.unravel_index(np.argmin(cost), cost.shape)
+        total = max(sizes[i] + sizes[j], 1)
+        centroids[i] = (sizes[i] * array[i] + sizes[j] * array[j]) / total
+        sizes[i] = sizes[i] + sizes[j]
+        del centroids[j], sizes[j]
+    if len(centroids) < num_clusters:
+        labels, distances = pairwise_distances_argmin_min(X, np.array(centroids))
+    while len(centroids) < num_clusters:
+        worst = np.argmax(np.bincount(labels, distances ** 2, len(centroids)))
+        members = labels == worst
+        upper = members & (X[:, -1] > centroids[worst][-1])
+        lower = members & ~upper
+        if not upper.any() or not lower.any():
+            # Clusters of identical E_z, the material farthest from its centroid starts the new cluster
+            centroids.append(X[np.argmax(distances)].copy())
+        else:
+            centroids[worst] = X[lower].mean(axis=0)
+            centroids.append(X[upper].mean(axis=0))
+        labels[members], distances[members] = pairwise_distances_argmin_min(X[members], np.array(centroids))
+    return np.array(centroids)
+
+def start_centroids(centroid_directory, key, X, num_clusters):
+    # Stored centroids of the same or the closest cluster count and whether the count matches, None without stored centroids
+    counts = stored_cluster_counts(centroid_directory, key)
+    if not counts:
+        return None, False
+    closest = min(counts, key=lambda count: (abs(count - num_clusters), count))
+    centroids = np.load(centroid_path(centroid_directory, key, closest))
+    print(f"KMeans warm start from the stored centroids of {closest} clusters")
+    if closest == num_clusters:
+        return centroids, True
+    return adapt_centroids(centroids, X, num_clusters), False
+
+def binned_points(X, bins=HISTOGRAM_BINS):
+    # Mean and number of the materials of every occupied bin. The bin edges are equidistant edges (for the
+    # long tail of E_z) together with quantiles of the column (fine bins where most materials are)
+    index = np.zeros(len(X), dtype=np.int64)
+    for column in X.T:
+        edges = np.unique(np.concatenate([np.linspace(column.min(), column.max(), bins + 1)[1:-1],
+                                          np.quantile(column, np.linspace(0, 1, bins + 1)[1:-1])]))
+        index = index * (len(edges) + 1) + np.searchsorted(edges, column, side='right')
+    _, bin_of_material = np.unique(index, return_inverse=True)
+    weights = np.bincount(bin_of_material)
+    points = np.column_stack([np.bincount(bin_of_material, column) / weights for column in X.T])
+    return points, weights
+
+def sort_clusters(labels, centroids):
+    # Cluster 0 has the highest E_z (last column), ties keep the order of the fit
+    order = np.argsort(-centroids[:, -1], kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[labels], centroids[order]
+
+def fit_kmeans(X, num_clusters, n_init="auto", tol=1e-4, centroid_directory=None, binned_above=0):
+    X = np.asarray(X, dtype=float)
+    num_clusters = min(num_clusters, len(X))
+    binned = bool(binned_above) and len(X) > binned_above
+    key = data_key(X, (n_init, tol, HISTOGRAM_BINS if binned else 0)) if centroid_directory else None
+    init, exact = start_centroids(centroid_directory, key, X, num_clusters) if centroid_directory else (None, False)
+    if exact:
+        # The stored fit of this data, its labels are the closest centroids as after the final step of a fit
+        return pairwise_distances_argmin(X, init), init
+    if init is None:
+        kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=n_init, tol=tol)
+    else:
+        kmeans = KMeans(n_clusters=num_clusters, random_state=42, init=init, n_init=1, tol=tol)
+    points, weights = binned_points(X) if binned else (None, None)
+    if points is not None and len(points) >= num_clusters:
+        kmeans.fit(points, sample_weight=weights)
+        print(f"KMeans on {len(points)} histogram bins of {len(X)} materials")
+        labels = pairwise_distances_argmin(X, kmeans.cluster_centers_)
+    else:
+        labels = kmeans.fit_predict(X)
+    labels, centroids = sort_clusters(labels, kmeans.cluster_centers_)
+    if centroid_directory:
+        save_centroids(centroid_directory, key, centroids)
+    return labels, centroids
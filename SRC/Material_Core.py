@@ -0,0 +1,144 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Material_Core.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: NumPy core of the material calculations. The HU recalculation and all material parameters
+#              (densities, anisotropic elastic constants, plastic stresses and strains) are computed on whole
+#              arrays instead of row by row, the material table is a structured array with integer material
+#              numbers and compact dtypes. Material and set names are only created for the output, the
+#              DataFrames of Recalculate_HU.py and Calculate_Material_Parameters.py are views of this core.
+#              The values written into the material cards stay float64, so the outputs do not change.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Material_Core import recalculate_arrays, material_arrays, material_table, material_names
+#     usage in code:
+#     columns = recalculate_arrays(E_z, Material_Config)  (HU, densities and recalculated E_z)
+#     columns = material_arrays(E_z, Material_Config)  (all columns of CalculateMaterial)
+#     table = material_table(columns)  (structured array, material numbers from 1)
+#     names = material_names(table['Mat'])  ('Mat_1', ...)
+# =============================================================================
+import math
+import numpy as np
+
+# Columns of CalculateMaterial in their order, the names are added as Mat and Set_Name after HU
+MATERIAL_COLUMNS = ['HU', 'Rho_app [kg/m^3]', 'Rho_ash [g/cm^3]', 'Density [ton/mm^3]', 'E_x', 'E_y', 'E_z',
+                    'G_xy', 'G_xz', 'G_yz', 'V_xy', 'V_xz', 'V_yz', 'Sigma_min', 'E_p', 'Epsilon_ab', 'Sigma',
+                    'Epsilon_a', 'Epsilon_c', 'Yield Stress 1', 'Plastic strain 1', 'Yield Stress 2',
+                    'Plastic strain 2', 'Yield Stress 3', 'Plastic strain 3']
+# Columns that only describe the derivation of the card values, stored as float32 in the material table
+DERIVATION_COLUMNS = ('Rho_app [kg/m^3]', 'Rho_ash [g/cm^3]', 'Sigma_min', 'E_p', 'Epsilon_ab', 'Sigma', 'Epsilon_a', 'Epsilon_c')
+
+def power(base, exponent):
+    # float_power is not SIMD dispatched like np.power and gives the last digit of the former calculation,
+    # negative bases give NaN as the power of the float64 values of a DataFrame did
+    with np.errstate(invalid='ignore'):
+        return np.float_power(np.asarray(base, dtype=float), exponent)
+
+def hu_from_modulus(E_z, config):
+    rho_ash = power((np.asarray(E_z, dtype=float) - config.a_Youngs) / config.b_Youngs, 1 / config.c_Youngs)
+    rho_app = (rho_ash - config.a_Ash) / config.b_Ash
+    return (rho_app - config.a_Qct) / config.b_Qct
+
+def densities(HU, config):
+    # Apparent density [kg/m^3] and ash density [g/cm^3], HU below 0 get the density of HU 0
+    rho_app = np.where(HU <= 0, float(config.a_Qct), config.a_Qct + config.b_Qct * HU)
+    return rho_app, config.c_Ash * rho_app
+
+def recalculate_arrays(E_z, config):
+    # HU of the Bonemat moduli and the moduli recalculated from HU with the Material_Config calibration
+    HU = hu_from_modulus(E_z, config)
+    rho_app, rho_ash = densities(HU, config)
+    recalculated = np.ones(len(HU))
+    valid = HU > 0.0001
+    recalculated[valid] = config.a_Youngs + config.b_Youngs * power(config.a_Ash + config.b_Ash * (config.a_Qct + config.b_Qct * HU[valid]), config.c_Youngs)
+    return {'Rho_app [kg/m^3]': rho_app, 'Rho_ash [g/cm^3]': rho_ash, 'HU': HU, 'E_z': recalculated}
+
+def plastic_log_strain(x, scalar_log=False):
+    # scalar_log uses math.log per value like the former calculation of the second plastic strain
+    valid = x > 0
+    strain = np.full(len(x), np.nan)
+    strain[valid] = [math.log(value) for value in x[valid].tolist()] if scalar_log else np.log(x[valid])
+    return strain
+
+def material_arrays(E_z, config):
+    E_z = np.asarray(E_z, dtype=float)
+    columns = {'HU': hu_from_modulus(E_z, config)}
+    rho_app, rho_ash = densities(columns['HU'], config)
+    columns['Rho_app [kg/m^3]'] = rho_app
+    columns['Rho_ash [g/cm^3]'] = rho_ash
+    columns['Density [ton/mm^3]'] = rho_app * 0.000000000001
+
+    columns['E_x'] = config.Scale_E_x * E_z
+    columns['E_y'] = config.Scale_E_y * E_z
+    columns['E_z'] = E_z
+    columns['G_xy'] = config.Scale_G_xy * E_z
+    columns['G_xz'] = config.Scale_G_xz * E_z
+    columns['G_yz'] = config.Scale_G_yz * E_z
+    columns['V_xy'] = np.full(len(E_z), config.Ass_V_xy)
+    columns['V_xz'] = np.full(len(E_z), config.Ass_V_xz)
+    columns['V_yz'] = np.full(len(E_z), config.Ass_V_yz)
+
+    sigma_min = config.a_Min_Stress * power(rho_ash, config.b_Min_Stress)
+    E_p = config.a_Plastic_E * power(rho_ash, config.b_Plastic_E)
+    epsilon_ab = np.where(rho_ash >= config.threshold_Plastic_Strain, config.a_Plastic_Strain + config.b_Plastic_Strain * rho_ash, 0.0)
+    low_density = rho_ash <= config.threshold_Plastic_Stress
+    sigma = np.empty(len(E_z))
+    sigma[low_density] = config.a_Plastic_Stress * power(rho_ash[low_density], config.b_Plastic_Stress)
+    sigma[~low_density] = config.c_Plastic_Stress * power(rho_ash[~low_density], config.d_Plastic_Stress)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        epsilon_a = sigma / E_z
+        epsilon_c = ((sigma_min - sigma) / E_p) + (epsilon_a + epsilon_ab)
+    columns.update({'Sigma_min': sigma_min, 'E_p': E_p, 'Epsilon_ab': epsilon_ab, 'Sigma': sigma,
+                    'Epsilon_a': epsilon_a, 'Epsilon_c': epsilon_c})
+
+    columns['Yield Stress 1'] = (epsilon_a + 1) * sigma
+    columns['Plastic strain 1'] = np.zeros(len(E_z), dtype=np.int64)
+    columns['Yield Stress 2'] = (epsilon_a + epsilon_ab + 1) * sigma
+    columns['Plastic strain 2'] = plastic_log_strain((-epsilon_a + (epsilon_ab + epsilon_a)) + 1, scalar_log=True)
+    columns['Yield Stress 3'] = (epsilon_c + 1) * sigma_min
+    columns['Plastic strain 3'] = plastic_log_strain((epsilon_c - epsilon_a) + 1)
+    return columns
+
+def validate_yield_stresses(columns, labels):
+    # Reports non increasing yield stresses and shifts non increasing plastic strains by 1E-3,
+    # labels are the material labels of the messages (the index of the material table)
+    yield_1, yield_2, yield_3 = columns['Yield Stress 1'], columns['Yield Stress 2'], columns['Yield Stress 3']
+    for index in np.flatnonzero((yield_1 >= yield_2) | (yield_2 <= yield_3)):
+        if yield_1[index] >= yield_2[index]:
+            print("Warning in ", labels[index], " yield 1 > yield 2")
+            print(yield_1[index], yield_2[index])
+        if yield_2[index] <= yield_3[index]:
+            print("Warning in ", labels[index], " yield 2 > yield 3")
+            print(yield_2[index], yield_3[index])
+    strain_1, strain_2, strain_3 = columns['Plastic strain 1'], columns['Plastic strain 2'].copy(), columns['Plastic strain 3'].copy()
+    low_strain_2 = strain_1 >= strain_2
+    low_strain_3 = strain_2 >= strain_3
+    for index in np.flatnonzero(low_strain_2 | low_strain_3):
+        if low_strain_2[index]:
+            print("Warning in", labels[index], "Strain 1 > Strain 2")
+            print(float(strain_1[index]), strain_2[index])
+        if low_strain_3[index]:
+            print("Warning in ", labels[index], "Strain 2 > Strain 3")
+            print(strain_2[index], strain_3[index])
+    columns['Plastic strain 2'] = np.where(low_strain_2, strain_2 + 1E-3, strain_2)
+    columns['Plastic strain 3'] = np.where(low_strain_3, strain_3 + 1E-3, strain_3)
+    return columns
+
+def material_table(columns, numbers=None):
+    # Structured array of the material columns, Mat holds the material numbers (1, 2, ... by default)
+    length = len(columns['E_z'])
+    dtype = [('Mat', np.int32)] + [(name, np.float32 if name in DERIVATION_COLUMNS else columns[name].dtype) for name in MATERIAL_COLUMNS if name in columns]
+    table = np.empty(length, dtype=dtype)
+    table['Mat'] = np.arange(1, length + 1) if numbers is None else numbers
+    for name in MATERIAL_COLUMNS:
+        if name in columns:
+            table[name] = columns[name]
+    return table
+
+def material_names(numbers, prefix='Mat_'):
+    return [prefix + str(number) for number in np.asarray(numbers).tolist()]
@@ -0,0 +1,114 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Material_Statistics.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Writes the material statistics of a grouping as columnar tables. One table holds the values
+#              per material (modulus, assigned group, grouping errors), one the values per group. The element
+#              IDs of the materials are stored as one integer array with offsets instead of text.
+#              Formats: .npz (NumPy only), .parquet or .feather (require pyarrow). A CSV summary without
+#              element IDs can be written additionally.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Material_Statistics import write_material_statistics
+#     usage in code:
+#     write_material_statistics(base_name, material_df, group_df, statistics_format, statistics_csv_on)
+#     material_df: Mat, E_z, Group (row of group_df), count_column, Numbers
+#     group_df: E_z, count_column
+#     Reading the .npz file:
+#     data = np.load(base_name + '_MaterialStatistics.npz')
+#     ids of material i: data['element_ids'][data['element_offsets'][i]:data['element_offsets'][i+1]]
+#     error_summary(statistics_name(file_name, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups))
+# =============================================================================
+import importlib.util
+import numpy as np
+import pandas as pd
+from Element_Volumes import parse_numbers
+
+STATISTICS_FORMATS = ('npz', 'parquet', 'feather')
+
+def element_id_arrays(numbers, counts):
+    # Element IDs of all materials in one array, the IDs of material i are ids[offsets[i]:offsets[i+1]]
+    text = ','.join(entry if isinstance(entry, str) else ','.join(entry) for entry in numbers)
+    ids = parse_numbers(text, np.int64)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if offsets[-1] != len(ids):
+        raise ValueError(f"Element count mismatch, {len(ids)} element IDs for {offsets[-1]} counted elements")
+    return ids, offsets
+
+def material_table(material_df, group_df):
+    group = material_df['Group'].to_numpy(dtype=np.int64)
+    E_z = material_df['E_z'].to_numpy(dtype=float)
+    group_E_z = group_df['E_z'].to_numpy(dtype=float)[group]
+    table = pd.DataFrame({'Mat': material_df['Mat'].astype(str).to_numpy(), 'E_z': E_z, 'Group': group,
+                          'E_z after Grouping': group_E_z,
+                          'Grouping_error': np.abs(group_E_z - E_z),
+                          'Relative_Grouping_error': np.abs(group_E_z - E_z) / np.where(E_z != 0, np.abs(E_z), 1.0),
+                          'count_column': material_df['count_column'].to_numpy(dtype=np.int64)})
+    if 'volume_column' in material_df:
+        table['volume_column'] = material_df['volume_column'].to_numpy(dtype=float)
+    return table
+
+def group_table(group_df):
+    table = pd.DataFrame({'Group': np.arange(len(group_df)), 'E_z': group_df['E_z'].to_numpy(dtype=float),
+                          'count_column': group_df['count_column'].to_numpy(dtype=np.int64)})
+    if 'volume_column' in group_df:
+        table['volume_column'] = group_df['volume_column'].to_numpy(dtype=float)
+    return table
+
+def write_material_statistics(base_name, material_df, group_df, statistics_format="npz", statistics_csv_on=False):
+    if statistics_format not in STATISTICS_FORMATS:
+        raise ValueError(f"Statistics format {statistics_format} is not supported, use one of {STATISTICS_FORMATS}")
+    materials = material_table(material_df, group_df)
+    groups = group_table(group_df)
+    ids, offsets = element_id_arrays(material_df['Numbers'], materials['count_column'].to_numpy())
+
+    if statistics_format == "npz":
+        # Text columns are stored as fixed width strings, so the file loads without pickle
+        arrays = {'material_' + column: materials[column].to_numpy(dtype=str if materials[column].dtype == object else None) for column in materials.columns}
+        arrays.update({'group_' + column: groups[column].to_numpy() for column in groups.columns})
+        np.savez(base_name + "_MaterialStatistics.npz", element_ids=ids, element_offsets=offsets, **arrays)
+    else:
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError(f"statistics_format = '{statistics_format}' requires pyarrow, install it or use 'npz'")
+        materials['Element_ID'] = np.split(ids, offsets[1:-1])
+        if statistics_format == "parquet":
+            materials.to_parquet(base_name + "_MaterialStatistics.parquet", index=False)
+            groups.to_parquet(base_name + "_GroupStatistics.parquet", index=False)
+        else:
+            materials.to_feather(base_name + "_MaterialStatistics.feather")
+            groups.to_feather(base_name + "_GroupStatistics.feather")
+        materials = materials.drop(columns=['Element_ID'])
+
+    if statistics_csv_on:
+        materials.to_csv(base_name + "_MaterialStatistics.csv", index=False)
+        groups.to_csv(base_name + "_GroupStatistics.csv", index=False)
+    print(f"Material statistics written as {statistics_format}" + (" and csv summary" if statistics_csv_on else ""))
+
+def statistics_name(file_name, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups=None):
+    # Base name of the statistics files as written by the grouping methods
+    if grouping_method == "Percentual_Thresholding":
+        return file_name.rstrip('.inp') + '_' + str(threshold_percentage * 100) + 'Per'
+    if grouping_method == "Equidistant":
+        return file_name.rstrip('.inp') + '_' + str(num_equidistant_groups) + 'EquiGroups'
+    if grouping_method == "Quantile":
+        return file_name.rstrip('.inp') + '_' + str(num_quantile_groups) + 'Q'
+    return file_name.rstrip('.inp') + '_' + str(num_clusters) + 'C'
+
+def error_summary(base_name):
+    # Grouping error statistics of a written .npz statistics file
+    data = np.load(base_name + "_MaterialStatistics.npz")
+    errors = data['material_Grouping_error']
+    counts = data['material_count_column']
+    summary = {'materials': len(errors), 'groups': len(data['group_E_z']), 'elements': int(counts.sum()),
+               'MAE': float(errors.mean()), 'RMSE': float(np.sqrt(np.mean(errors ** 2))), 'Max AE': float(errors.max()),
+               'Element weighted MAE': float(np.sum(errors * counts) / counts.sum())}
+    if 'material_volume_column' in data:
+        volumes = np.nan_to_num(data['material_volume_column'])
+        summary['Volume weighted MAE'] = float(np.sum(errors * volumes) / volumes.sum())
+    return summary
@@ -0,0 +1,201 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Mesh_Renumbering.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Renumbering of the nodes and elements of a written deck for a smaller bandwidth of the solver
+#              matrices. The node graph of the mesh (nodes sharing an element) is built as sparse matrix and
+#              ordered with the reverse Cuthill-McKee algorithm of SciPy, the elements are numbered in the order
+#              of their lowest new node number. Node, element, node set and element set blocks are rewritten
+#              with the new IDs, all other blocks are copied unchanged. Parts are renumbered separately, sets of
+#              the assembly are renumbered with the part of their instance. Decks with keywords that may
+#              reference node or element IDs in other ways (e.g. steps, surfaces, boundary conditions) or that
+#              include files with more than material cards are left unchanged. The old IDs in the new order are saved to <output>_Renumbering.npz.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Mesh_Renumbering import renumber_deck
+#     usage in code:
+#     renumber_deck(input_file, output_file)
+#     input_file and output_file may be the same file
+# =============================================================================
+import os
+import re
+import mmap
+import tempfile
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+from Inp_Keywords import MATERIAL_OPTIONS, is_keyword, keyword_name, keyword_parameters
+from Parallel_Mesh_Parser import scan_keywords
+from Element_Volumes import TET_NODES, build_lookup
+from Deck_Check import parse_ids, generate_ids
+
+# Keywords that do not reference node or element IDs apart from the renumbered blocks
+RENUMBER_KEYWORDS = ('*HEADING', '*PREPRINT', '*NODE', '*ELEMENT', '*NSET', '*ELSET', '*SOLIDSECTION', '*MATERIAL',
+                     '*PART', '*ENDPART', '*ASSEMBLY', '*ENDASSEMBLY', '*INSTANCE', '*ENDINSTANCE')
+
+def material_include(file_name):
+    # Included files are not renumbered, only files with material cards alone (e.g. a cohort material library) have no IDs
+    if not os.path.exists(file_name):
+        return False
+    names = [keyword_name(keyword) for keyword, _, _ in scan_keywords(file_name) if is_keyword(keyword)]
+    return all(name == '*MATERIAL' or name.startswith(MATERIAL_OPTIONS) for name in names)
+
+def index_blocks(keywords, directory=''):
+    # Keyword blocks with their part (None for decks without parts), data after comment lines belongs to the block before
+    blocks = []
+    instances = {}
+    part = None
+    in_material = False
+    unsupported = set()
+    for keyword, start, end in keywords:
+        if not is_keyword(keyword):
+            if blocks and end > start and blocks[-1][0] is not None:
+                # Comment line inside a data block, the line is dropped
+                blocks[-1][3].append((start, end))
+            else:
+                blocks.append((None, keyword, part, [(start, end)]))
+            continue
+        name = keyword_name(keyword)
+        parameters = keyword_parameters(keyword)
+        if in_material and name.startswith(MATERIAL_OPTIONS):
+            blocks.append((name, keyword, part, [(start, end)]))
+            continue
+        in_material = name == '*MATERIAL'
+        if name == '*PART':
+            part = parameters.get('name', '').upper()
+        elif name == '*ENDPART':
+            part = None
+        elif name == '*INSTANCE':
+            instances[parameters.get('name', '').upper()] = parameters.get('part', '').upper()
+        elif name == '*INCLUDE':
+            if not material_include(os.path.join(directory, parameters.get('input', ''))):
+                unsupported.add(keyword.strip())
+        elif name not in RENUMBER_KEYWORDS:
+            unsupported.add(name)
+        elif name == '*ELEMENT' and parameters.get('type', '').upper() not in TET_NODES:
+            unsupported.add(keyword.strip())
+        scope = instances.get(parameters.get('instance', '').upper(), part) if name in ('*NSET', '*ELSET') else part
+        blocks.append((name, keyword, scope, [(start, end)]))
+    return blocks, unsupported
+
+def block_data(mm, ranges):
+    return b''.join(mm[start:end] for start, end in ranges)
+
+def node_lines(data):
+    return [line for line in data.split(b'\n') if line.strip()]
+
+def renumber_scope(mm, blocks, scope):
+    # New node and element IDs of one part as dense arrays over the old IDs, and the bandwidths before and after
+    node_ids = np.concatenate([np.array([int(line.split(b',')[0]) for line in node_lines(block_data(mm, ranges))], dtype=np.int64)
+                               for name, _, part, ranges in blocks if name == '*NODE' and part == scope])
+    elements = [parse_ids(block_data(mm, ranges))[0].reshape(-1, TET_NODES[keyword_parameters(keyword)['type'].upper()] + 1)
+                for name, keyword, part, ranges in blocks if name == '*ELEMENT' and part == scope]
+    element_ids = np.concatenate([block[:, 0] for block in elements])
+    node_lookup = build_lookup(node_ids)
+    rows, connectivity = [], []
+    offset = 0
+    for block in elements:
+        if block[:, 1:].max() >= len(node_lookup) or np.any(node_lookup[block[:, 1:]] < 0):
+            raise ValueError(f"Elements of part {scope} reference undefined nodes")
+        connectivity.append(node_lookup[block[:, 1:]])
+        rows.append(np.repeat(np.arange(offset, offset + len(block)), block.shape[1] - 1))
+        offset += len(block)
+    # Node graph: nodes are adjacent if they share an element
+    rows, columns = np.concatenate(rows), np.concatenate([block.ravel() for block in connectivity])
+    incidence = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, columns)), shape=(len(element_ids), len(node_ids))).tocsr()
+    graph = (incidence.T @ incidence).tocsr()
+    order = reverse_cuthill_mckee(graph, symmetric_mode=True)
+    new_node = np.empty(len(node_ids), dtype=np.int64)
+    new_node[order] = np.arange(1, len(node_ids) + 1)
+    # Position of the nodes in the order of the old IDs, for the bandwidth before the renumbering
+    old_rank = np.empty(len(node_ids), dtype=np.int64)
+    old_rank[np.argsort(node_ids)] = np.arange(len(node_ids))
+    lowest = np.concatenate([new_node[block].min(axis=1) for block in connectivity])
+    old_bandwidth = max(int((old_rank[block].max(axis=1) - old_rank[block].min(axis=1)).max()) for block in connectivity)
+    new_bandwidth = max(int((new_node[block].max(axis=1) - new_node[block].min(axis=1)).max()) for block in connectivity)
+
+    # Elements in the order of their lowest new node, ties in the order of the old IDs
+    element_order = np.lexsort((element_ids, lowest))
+    new_element = np.empty(len(element_ids), dtype=np.int64)
+    new_element[element_order] = np.arange(1, len(element_ids) + 1)
+
+    node_map = np.full(len(node_lookup), -1, dtype=np.int64)
+    node_map[node_ids] = new_node
+    element_map = np.full(int(element_ids.max()) + 1, -1, dtype=np.int64)
+    element_map[element_ids] = new_element
+    return node_map, element_map, node_ids[order], element_ids[element_order], (old_bandwidth, new_bandwidth)
+
+def map_ids(ids, id_map, kind, scope):
+    if len(ids) and (ids.min() < 0 or ids.max() >= len(id_map) or np.any(id_map[ids] < 0)):
+        raise ValueError(f"A set of part {scope} references undefined {kind}")
+    return id_map[ids]
+
+def set_lines(ids, names):
+    lines = [','.join(map(str, ids[i:i + 16].tolist())) + '\n' for i in range(0, len(ids), 16)]
+    return ''.join(lines + [', '.join(names) + '\n' if names else '']).encode()
+
+def write_renumbered(mm, output, block, maps):
+    name, keyword, scope, ranges = block
+    data = block_data(mm, ranges)
+    if name is None or scope not in maps or name not in ('*NODE', '*ELEMENT', '*NSET', '*ELSET'):
+        output.write((keyword + '\n').encode())
+        output.write(data)
+        if data and not data.endswith(b'\n'):
+            output.write(b'\n')
+        return
+    node_map, element_map = maps[scope][:2]
+    if name == '*NODE':
+        lines = node_lines(data)
+        new_ids = map_ids(np.array([int(line.split(b',')[0]) for line in lines], dtype=np.int64), node_map, 'nodes', scope)
+        text = b''.join(str(new_ids[i]).encode() + lines[i][lines[i].index(b','):].rstrip(b'\r') + b'\n' for i in np.argsort(new_ids).tolist())
+        output.write((keyword + '\n').encode() + text)
+    elif name == '*ELEMENT':
+        element_data = parse_ids(data)[0].reshape(-1, TET_NODES[keyword_parameters(keyword)['type'].upper()] + 1)
+        element_data = np.column_stack([map_ids(element_data[:, 0], element_map, 'elements', scope),
+                                        map_ids(element_data[:, 1:], node_map, 'nodes', scope)])
+        element_data = element_data[np.argsort(element_data[:, 0])]
+        template = ', '.join(['%d'] * element_data.shape[1]) + '\n'
+        output.write((keyword + '\n').encode() + ''.join(template % tuple(row) for row in element_data.tolist()).encode())
+    else:
+        parameters = keyword_parameters(keyword)
+        ids, names = (generate_ids(data), []) if 'generate' in parameters else parse_ids(data)
+        ids = np.sort(map_ids(ids, node_map if name == '*NSET' else element_map, 'nodes' if name == '*NSET' else 'elements', scope))
+        # Renumbered sets are no contiguous ranges, generate sets are written as lists
+        keyword = re.sub(r',\s*generate\s*', '', keyword, flags=re.I)
+        output.write((keyword + '\n').encode() + set_lines(ids, names))
+
+def renumber_deck(input_file, output_file):
+    keywords = scan_keywords(input_file)
+    blocks, unsupported = index_blocks(keywords, os.path.dirname(input_file))
+    if unsupported:
+        print(f"{input_file} is not renumbered, the keywords {', '.join(sorted(unsupported))} are not supported")
+        if os.path.abspath(input_file) != os.path.abspath(output_file):
+            with open(input_file, 'rb') as source, open(output_file, 'wb') as target:
+                target.write(source.read())
+        return None
+    scopes = [scope for scope in dict.fromkeys(part for name, _, part, _ in blocks if name == '*ELEMENT')]
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, os.fdopen(handle, 'wb') as output:
+            maps = {scope: renumber_scope(mm, blocks, scope) for scope in scopes}
+            for block in blocks:
+                write_renumbered(mm, output, block, maps)
+        os.replace(temp_path, output_file)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    renumbering = {}
+    for scope, (_, _, old_nodes, old_elements, bandwidths) in maps.items():
+        prefix = '' if scope is None else scope + '_'
+        renumbering[prefix + 'node_ids'] = old_nodes
+        renumbering[prefix + 'element_ids'] = old_elements
+        print(f"{'Mesh' if scope is None else 'Part ' + scope}: {len(old_nodes)} nodes and {len(old_elements)} elements renumbered, "
+              f"node bandwidth of the elements {bandwidths[0]} -> {bandwidths[1]}")
+    # Old IDs of the new IDs 1, 2, ...
+    np.savez(os.path.splitext(output_file)[0] + '_Renumbering.npz', **renumbering)
+    return renumbering
@@ -0,0 +1,169 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Multi_Part.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Support for decks with several material mapped parts (e.g. vertebra and disc, pelvis and
+#              femur). Every *Part with solid sections gets its own material mapping and grouping: the part
+#              (mesh, sets, sections and the materials it uses) is extracted into a temporary flat deck,
+#              translated, grouped and its element sets and material cards are rendered by a worker process.
+#              The results are merged into one deck, the sets and materials of a part are namespaced with
+#              the part name (<part>_Set_i, <part>_Mat_i). All other blocks are copied unchanged.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Multi_Part import material_parts, process_multi_part
+#     usage in code:
+#     if len(material_parts(file_name)) > 1:
+#         df_materials_aniso = process_multi_part(file_name, file_name1, output_file, multi_part_workers)
+#     Must be called below an if __name__ == "__main__": guard, as the workers are separate processes
+# =============================================================================
+import io
+import os
+import re
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from Inp_Keywords import MATERIAL_OPTIONS, is_keyword, keyword_name, keyword_parameters
+from Parallel_Mesh_Parser import scan_keywords
+from Input_Translation import translate_input
+from Calculate_Material_Parameters import CalculateMaterial
+from Write_Abaqus_Output import write_element_sets, write_material_cards
+
+COPY_CHUNK_BYTES = 16 * 1024 * 1024
+
+def part_label(part_name):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', part_name)
+
+def index_deck(keywords):
+    # Keyword blocks of every part and of every material, the section materials of every part
+    parts = {}
+    materials = {}
+    current_part = None
+    current_material = None
+    for keyword, start, end in keywords:
+        if not is_keyword(keyword):
+            if current_part is not None:
+                parts[current_part]['blocks'].append((keyword, start, end))
+            continue
+        name = keyword_name(keyword)
+        parameters = keyword_parameters(keyword)
+        if current_material is not None and name.startswith(MATERIAL_OPTIONS):
+            materials[current_material].append((keyword, start, end))
+            continue
+        current_material = None
+        if name == '*PART':
+            current_part = parameters.get('name', '')
+            parts[current_part] = {'blocks': [], 'elsets': set(), 'materials': set()}
+        elif name == '*ENDPART':
+            current_part = None
+        elif name == '*MATERIAL':
+            current_material = parameters.get('name', '').upper()
+            materials[current_material] = [(keyword, start, end)]
+        elif current_part is not None:
+            parts[current_part]['blocks'].append((keyword, start, end))
+            if name == '*SOLIDSECTION' and 'material' in parameters:
+                parts[current_part]['elsets'].add(parameters.get('elset', '').upper())
+                parts[current_part]['materials'].add(parameters['material'].upper())
+    return parts, materials
+
+def material_parts(file_name):
+    parts, _ = index_deck(scan_keywords(file_name))
+    return [part for part in parts if parts[part]['materials']]
+
+def copy_block(mm, output, keyword, start, end):
+    output.write((keyword + '\n').encode())
+    for position in range(start, end, COPY_CHUNK_BYTES):
+        output.write(mm[position:min(position + COPY_CHUNK_BYTES, end)])
+    if end > start and mm[end - 1:end] != b'\n':
+        output.write(b'\n')
+
+def write_part_deck(file_name, part_file, blocks):
+    with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, open(part_file, 'wb') as output:
+        for keyword, start, end in blocks:
+            copy_block(mm, output, keyword, start, end)
+
+def process_part(file_name, file_name1, part_name, blocks):
+    # Runs in a worker process, the grouping settings are the ones of main
+    import main as pbmga
+    label = part_label(part_name)
+    part_file = f"{file_name1}_{label}.inp"
+    write_part_deck(file_name, part_file, blocks)
+    try:
+        pbmga.file_name = part_file
+        df, elset_df = translate_input(part_file, pbmga.Material_Config)
+        grouping_df = pbmga.group_materials(df, elset_df)
+        df_materials_aniso = CalculateMaterial(grouping_df, pbmga.Material_Config)
+    finally:
+        os.remove(part_file)
+    df_materials_aniso['Mat'] = label + '_' + df_materials_aniso['Mat']
+    df_materials_aniso['Set_Name'] = label + '_' + df_materials_aniso['Set_Name']
+    sets = io.StringIO()
+    write_element_sets(sets, df_materials_aniso)
+    cards = io.StringIO()
+    write_material_cards(cards, df_materials_aniso, pbmga.Material_Config)
+    print(f"Part {part_name}: {len(df)} materials grouped into {len(df_materials_aniso)} materials")
+    return part_name, sets.getvalue(), cards.getvalue(), df_materials_aniso.drop(columns=['Numbers'], errors='ignore')
+
+def merge_parts(file_name, output_file, keywords, parts, results):
+    # Copies the deck, the material sets and sections of the processed parts and the materials they used
+    # are replaced by the rendered sets (before *End Part) and material cards (at the first replaced material)
+    replaced_materials = set().union(*(parts[part]['materials'] for part in results))
+    material_cards = ''.join(results[part][1] for part in results)
+    materials_written = False
+    current_part = None
+    skip_material = False
+    with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, open(output_file, 'wb') as output:
+        for keyword, start, end in keywords:
+            if is_keyword(keyword):
+                name = keyword_name(keyword)
+                parameters = keyword_parameters(keyword)
+                if skip_material and name.startswith(MATERIAL_OPTIONS):
+                    continue
+                skip_material = name == '*MATERIAL' and parameters.get('name', '').upper() in replaced_materials
+                if (skip_material or name == '*STEP') and not materials_written:
+                    output.write(material_cards.encode())
+                    materials_written = True
+                if skip_material:
+                    continue
+                if name == '*PART':
+                    current_part = parameters.get('name', '')
+                elif name == '*ENDPART':
+                    if current_part in results:
+                        output.write(results[current_part][0].encode())
+                    current_part = None
+                elif current_part in results and name in ('*ELSET', '*SOLIDSECTION') and parameters.get('elset', '').upper() in parts[current_part]['elsets']:
+                    continue
+            copy_block(mm, output, keyword, start, end)
+        if not materials_written:
+            output.write(material_cards.encode())
+    print('Output written to ', output_file)
+
+def process_multi_part(file_name, file_name1, output_file, multi_part_workers=0):
+    # multi_part_workers = 0 uses one worker per part, limited to the available cores
+    keywords = scan_keywords(file_name)
+    parts, materials = index_deck(keywords)
+    names = [part for part in parts if parts[part]['materials']]
+    workers = min(multi_part_workers if multi_part_workers > 0 else os.cpu_count(), len(names))
+    print(f"{len(names)} material mapped parts found: {', '.join(names)}")
+    jobs = []
+    for part in names:
+        missing = [material for material in parts[part]['materials'] if material not in materials]
+        if missing:
+            raise ValueError(f"Part {part} uses the undefined materials {missing[:5]}")
+        blocks = parts[part]['blocks'] + [block for material in sorted(parts[part]['materials']) for block in materials[material]]
+        jobs.append((part, blocks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_part, file_name, file_name1, part, blocks) for part, blocks in jobs]
+        results = {}
+        part_materials = []
+        for future in futures:
+            part, sets, cards, df_part = future.result()
+            results[part] = (sets, cards)
+            part_materials.append(df_part)
+    merge_parts(file_name, output_file, keywords, parts, results)
+    # Material tables of all parts, the material names carry the part label
+    return pd.concat(part_materials, ignore_index=True)
@@ -0,0 +1,104 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Parallel_Mesh_Parser.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Parallel reader for large *Node and *Element blocks. The blocks are located with a keyword
+#              scan of the memory mapped file, split at line boundaries into byte chunks and the chunks
+#              are converted by worker processes with NumPy bulk conversion. The results are concatenated
+#              into contiguous arrays in the same layout as Element_Volumes.read_mesh.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Parallel_Mesh_Parser import read_mesh_parallel
+#     usage in code:
+#     node_ids, coordinates, element_ids, connectivity = read_mesh_parallel(file_name, parse_workers)
+#     Must be called below an if __name__ == "__main__": guard, as the workers are separate processes
+# =============================================================================
+import os
+import re
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Element_Volumes import TET_NODES
+
+def scan_keywords(file_name):
+    # Keyword lines with the byte range of the data lines that follow them
+    keywords = []
+    with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = 0 if mm[:1] == b'*' else mm.find(b'\n*')
+        position = position + 1 if position > 0 else position
+        while position >= 0:
+            if keywords:
+                keywords[-1][2] = position
+            line_end = mm.find(b'\n', position)
+            line_end = len(mm) if line_end < 0 else line_end
+            keywords.append([mm[position:line_end].decode('ascii', 'ignore').strip(), line_end + 1, len(mm)])
+            next_keyword = mm.find(b'\n*', line_end)
+            position = next_keyword + 1 if next_keyword >= 0 else -1
+    return keywords
+
+def index_mesh_blocks(file_name):
+    # Byte ranges of the data lines of all *Node and supported *Element blocks
+    node_ranges = []
+    element_ranges = []
+    for keyword, start, end in scan_keywords(file_name):
+        keyword_upper = keyword.upper().replace(' ', '')
+        if keyword_upper == '*NODE' or keyword_upper.startswith('*NODE,'):
+            node_ranges.append((start, end))
+        elif keyword_upper.startswith('*ELEMENT,'):
+            type_match = re.search(r'TYPE=([^,\s]+)', keyword_upper)
+            element_type = type_match.group(1) if type_match else None
+            if element_type in TET_NODES:
+                element_ranges.append((element_type, (start, end)))
+            else:
+                print(f"Warning: element type {element_type} is not supported and is skipped")
+    return node_ranges, element_ranges
+
+def split_range(file_name, start, end, chunk_bytes):
+    chunks = []
+    with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while start < end:
+            stop = min(start + chunk_bytes, end)
+            if stop < end:
+                newline = mm.find(b'\n', stop, end)
+                stop = end if newline < 0 else newline + 1
+            chunks.append((start, stop))
+            start = stop
+    return chunks
+
+def parse_chunk(file_name, start, stop, dtype):
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    return np.fromstring(data.replace(b',', b' ').decode('ascii'), sep=' ', dtype=dtype)
+
+def parse_ranges(executor, file_name, ranges, chunk_bytes, dtype):
+    chunks = [chunk for start, end in ranges for chunk in split_range(file_name, start, end, chunk_bytes)]
+    if not chunks:
+        return np.empty(0, dtype=dtype)
+    parts = executor.map(parse_chunk, [file_name] * len(chunks), [start for start, _ in chunks], [stop for _, stop in chunks], [dtype] * len(chunks))
+    return np.concatenate(list(parts))
+
+def read_mesh_parallel(file_name, parse_workers=0, chunk_mb=16):
+    # parse_workers = 0 uses all available cores
+    workers = parse_workers if parse_workers > 0 else os.cpu_count()
+    chunk_bytes = int(chunk_mb * 1024 * 1024)
+    node_ranges, element_ranges = index_mesh_blocks(file_name)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        node_data = parse_ranges(executor, file_name, node_ranges, chunk_bytes, np.float64).reshape(-1, 4)
+        element_ids = []
+        connectivity = []
+        for element_type, element_range in element_ranges:
+            element_data = parse_ranges(executor, file_name, [element_range], chunk_bytes, np.int64).reshape(-1, TET_NODES[element_type] + 1)
+            element_ids.append(element_data[:, 0])
+            connectivity.append(element_data[:, 1:5])
+    node_ids = node_data[:, 0].astype(np.int64)
+    coordinates = np.ascontiguousarray(node_data[:, 1:])
+    element_ids = np.concatenate(element_ids) if element_ids else np.empty(0, dtype=np.int64)
+    connectivity = np.concatenate(connectivity) if connectivity else np.empty((0, 4), dtype=np.int64)
+    print(f"Parsed {len(node_ids)} nodes and {len(element_ids)} elements with {workers} workers")
+    return node_ids, coordinates, element_ids, connectivity
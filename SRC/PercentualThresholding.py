@@ -18,6 +18,8 @@
 import re
 import pandas as pd
 import numpy as np
+from Material_Statistics import write_material_statistics
+from Element_Volumes import add_volume_column, weighted_error_stats
 
 def extract_material_name(line):
     # Define the regular expression pattern to match "Mat_x"
@@ -81,9 +83,12 @@ def find_closest_row(row, df):
 def join_list_elements(lst):
     return [', '.join(lst)]
 
-def process_data(file_name, df_materials_inp, threshold_percentage):
-    df = extract_data_from_file(file_name)
+def process_data(file_name, df_materials_inp, threshold_percentage, weight_column="count_column", parse_workers=1, elset_df=None, statistics_format="npz", statistics_csv_on=False):
+    # elset_df holds the element sets (and volumes) of materials that are already in memory, e.g. after CT mapping
+    df = extract_data_from_file(file_name) if elset_df is None else elset_df.copy()
     df['count_column'] = df['Numbers'].apply(count_numbers_in_row)
+    if weight_column == "volume_column" and 'volume_column' not in df:
+        df = add_volume_column(df, file_name, parse_workers)
     merged_df = pd.concat([df_materials_inp.set_index('Mat'), df.set_index('Solid Section Information')], axis=1)
     merged_df.drop(columns=['Elset Information'], inplace=True)
 
@@ -98,13 +103,19 @@ def process_data(file_name, df_materials_inp, threshold_percentage):
     threshold_grouping_df = pd.DataFrame(threshold_grouping)
 
     threshold_grouping_df["count_column"] = 0
+    if weight_column == "volume_column":
+        threshold_grouping_df["volume_column"] = 0.0
     threshold_grouping_df["Numbers"] = [[] for _ in range(len(values_list))]
     squared_errors = []
     error_list = []
+    group_list = []
     for _, row in merged_df.iterrows():
         closest_row = find_closest_row(row, threshold_grouping_df)
         threshold_grouping_df.at[closest_row.name, 'count_column'] += row['count_column']
+        if weight_column == "volume_column":
+            threshold_grouping_df.at[closest_row.name, 'volume_column'] += row['volume_column']
         threshold_grouping_df.at[closest_row.name, 'Numbers'].append(row['Numbers'])
+        group_list.append(closest_row.name)
         # compute the raw error
         error = threshold_grouping_df.at[closest_row.name, 'E_z'] - row['E_z']
         error_list.append(abs(error))
@@ -125,25 +136,20 @@ def process_data(file_name, df_materials_inp, threshold_percentage):
     #print('Mean Grouping Error', mean_error)
     #print('Max Grouping Error', max_error)s
     threshold_grouping_df2 = threshold_grouping_df.reset_index(drop=True)
-    merged_df =merged_df.reset_index(drop=True)
-    
-    report_df2 = pd.DataFrame()
-    report_df2['E_z'] = merged_df['E_z']
-    #report_df2['New E_z'] = threshold_grouping_df['E_z']
-    report_df2['Grouping_error'] = error_list
-    report_df2['Element_ID'] = merged_df['Numbers']
-    report_df2['E_z after Grouping'] = threshold_grouping_df2['E_z']
-    report_df2['Amount of Elements in Group'] = threshold_grouping_df2['count_column']
+    material_df = merged_df.rename_axis('Mat').reset_index()
+    material_df['Group'] = threshold_grouping_df.index.get_indexer(group_list)
     print('Threshold grouping df: \n ', threshold_grouping_df2)
-    print(report_df2)
     print(threshold_grouping_df['count_column'])
-    csv_name = file_name.rstrip('.inp')+'_' +str(threshold_percentage*100)+'Per' +"_MaterialStatistics.csv"
-    report_df2.to_csv(csv_name, index=False)
+    write_material_statistics(file_name.rstrip('.inp')+'_' +str(threshold_percentage*100)+'Per', material_df, threshold_grouping_df2, statistics_format, statistics_csv_on)
     # Write the statistics into a text file
     with open(file_name.rstrip('.inp')+'_' +str(threshold_percentage*100)+'Per' + "_grouping_error_stats.txt", "w") as file:
         file.write(f"RMSE: {rmse}\n")
         file.write(f"Mean Grouping Error: {mean_error}\n")
         file.write(f"Max Grouping Error: {max_error}\n")
+        if weight_column == "volume_column":
+            weighted_rmse, weighted_mean_error = weighted_error_stats(error_list, merged_df[weight_column])
+            file.write(f"Volume Weighted RMSE: {weighted_rmse}\n")
+            file.write(f"Volume Weighted Mean Grouping Error: {weighted_mean_error}\n")
     return threshold_grouping_df
 
 
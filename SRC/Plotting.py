@@ -0,0 +1,86 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Plotting.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Plot backend of the grouping methods. In "show" mode the plots open in a window as before.
+#              In "file" mode the plots are rendered headless with Agg on a background thread and saved as
+#              PNG next to the output, so plots can stay enabled in batch runs. The figure objects are reused
+#              between runs in the same process. Scatter plots with more than plot_max_points points are
+#              drawn as hexbin density of all points with a random subset of the points on top.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Plotting import configure_plotting, wait_for_plots
+#     usage in code:
+#     configure_plotting(plot_mode, plot_max_points)
+#     render_plot('clustering', draw_function, png_name, *arrays)  (in the grouping methods)
+#     wait_for_plots()  (before the program ends)
+# =============================================================================
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+PLOT_MODES = ('show', 'file')
+
+_settings = {'mode': 'show', 'max_points': 200000}
+_figures = {}
+_pending = []
+_executor = None
+
+def configure_plotting(plot_mode="show", plot_max_points=200000):
+    if plot_mode not in PLOT_MODES:
+        raise ValueError(f"Plot mode {plot_mode} is not supported, use one of {PLOT_MODES}")
+    _settings['mode'] = plot_mode
+    _settings['max_points'] = plot_max_points
+    if plot_mode == "file":
+        plt.switch_backend('Agg')
+
+def decimate(max_points, *arrays):
+    # Reproducible random subset of at most max_points points, the order of the points is kept
+    arrays = [np.asarray(array) for array in arrays]
+    if len(arrays[0]) <= max_points:
+        return arrays
+    index = np.sort(np.random.default_rng(0).choice(len(arrays[0]), max_points, replace=False))
+    return [array[index] for array in arrays]
+
+def scatter_points(ax, x, y, c, cmap):
+    x, y, c = np.asarray(x), np.asarray(y), np.asarray(c)
+    max_points = _settings['max_points']
+    if len(x) > max_points:
+        ax.hexbin(x, y, gridsize=200, bins='log', cmap='Greys', mincnt=1)
+        x, y, c = decimate(max_points, x, y, c)
+    return ax.scatter(x, y, c=c, cmap=cmap, s=4 if len(x) >= max_points else None)
+
+def _render_file(name, draw_function, png_name, args):
+    figure = _figures.get(name)
+    if figure is None:
+        figure = Figure(figsize=(8, 6))
+        FigureCanvasAgg(figure)
+        _figures[name] = figure
+    figure.clear()
+    draw_function(figure, *args)
+    figure.savefig(png_name, dpi=150, bbox_inches='tight')
+    print('Plot saved to ', png_name)
+
+def render_plot(name, draw_function, png_name, *args):
+    # draw_function(figure, *args) draws into an empty figure, the arguments must not be modified afterwards
+    global _executor
+    if _settings['mode'] == "show":
+        figure = plt.figure(figsize=(8, 6))
+        draw_function(figure, *args)
+        plt.show()
+        return
+    if _executor is None:
+        # One worker thread, the reused figures are only touched by this thread
+        _executor = ThreadPoolExecutor(max_workers=1)
+    _pending.append(_executor.submit(_render_file, name, draw_function, png_name, args))
+
+def wait_for_plots():
+    while _pending:
+        _pending.pop(0).result()
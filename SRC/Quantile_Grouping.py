@@ -0,0 +1,91 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Quantile_Grouping.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Equal count grouping. The materials are split along the Youngs modulus into groups that hold
+#              the same number of elements (or the same volume), i.e. at the weighted quantiles of E_z. The
+#              modulus of a group is the element (volume) weighted mean of its materials. The material table
+#              is already sorted by descending E_z, so the groups follow from one cumulative sum of the
+#              weights in linear time, without iterations or a nearest level search per material.
+#              The regrouping table has the same layout as the one of the KMeans clustering.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Quantile_Grouping import process_quantile_grouping
+#     usage in code:
+#     process_quantile_grouping(file_name, df, num_quantile_groups, grouping_weight, mesh_parse_workers, elset_df, statistics_format, statistics_csv_on)
+#     labels, levels = quantile_groups(E_z, weights, num_quantile_groups)  (array version)
+# =============================================================================
+import numpy as np
+import pandas as pd
+from Equidistant_Histogram import extract_data_from_file, count_numbers_in_row
+from Element_Volumes import add_volume_column, weighted_error_stats
+from Material_Statistics import write_material_statistics
+
+def quantile_groups(E_z, weights, num_quantile_groups):
+    # Group label of every material (0 = highest modulus) and the weighted mean modulus of the groups
+    E_z = np.asarray(E_z, dtype=float)
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    if weights.sum() <= 0:
+        raise ValueError("The grouping weights of the materials sum up to zero")
+    # Sorting is only needed if the materials are not in descending order already
+    order = np.arange(len(E_z)) if np.all(E_z[1:] <= E_z[:-1]) else np.argsort(-E_z, kind='stable')
+    sorted_weights = weights[order]
+    # A material belongs to the quantile that contains the middle of its weight
+    centers = np.cumsum(sorted_weights) - sorted_weights / 2
+    ranks = np.minimum((centers / sorted_weights.sum() * num_quantile_groups).astype(np.int64), num_quantile_groups - 1)
+    # Quantiles without a material (single materials heavier than a quantile) are dropped
+    used = np.bincount(ranks, minlength=num_quantile_groups) > 0
+    ranks = (np.cumsum(used) - 1)[ranks]
+    labels = np.empty(len(E_z), dtype=np.int64)
+    labels[order] = ranks
+    # Groups of weightless materials (e.g. zero volume) take the unweighted mean instead of 0/0
+    group_weights = np.bincount(labels, weights)
+    weighted = group_weights > 0
+    levels = np.bincount(labels, E_z) / np.bincount(labels)
+    levels[weighted] = np.bincount(labels, E_z * weights)[weighted] / group_weights[weighted]
+    return labels, levels
+
+def process_quantile_grouping(file_name, df_materials_inp, num_quantile_groups, weight_column="count_column", parse_workers=1, elset_df=None, statistics_format="npz", statistics_csv_on=False):
+    # elset_df holds the element sets (and volumes) of materials that are already in memory, e.g. after CT mapping
+    df = extract_data_from_file(file_name) if elset_df is None else elset_df.copy()
+    df['count_column'] = df['Numbers'].apply(count_numbers_in_row)
+    if weight_column == "volume_column" and 'volume_column' not in df:
+        df = add_volume_column(df, file_name, parse_workers)
+    merged_df = pd.concat([df_materials_inp.set_index('Mat'), df.set_index('Solid Section Information')], axis=1)
+    merged_df = merged_df.rename_axis('Mat').reset_index().drop(columns=['Elset Information'])
+    merged_df = merged_df.dropna(subset=['E_z', 'Numbers']).reset_index(drop=True)
+
+    labels, levels = quantile_groups(merged_df['E_z'], merged_df[weight_column], num_quantile_groups)
+    errors = merged_df['E_z'] - levels[labels]
+    mean_error = errors.abs().mean()
+    max_error = errors.abs().max()
+    rmse = np.sqrt((errors ** 2).mean())
+    print(f"MAE: {mean_error:.4f}")
+    print(f"Max AE: {max_error:.4f}")
+    print(f"RMSE: {rmse:.4f}")
+    base_name = file_name.rstrip('.inp') + '_' + str(num_quantile_groups) + 'Q'
+    with open(base_name + "_grouping_error_stats.txt", "w") as file:
+        file.write(f"RMSE: {rmse}\n")
+        file.write(f"Mean Grouping Error: {mean_error}\n")
+        file.write(f"Max Grouping Error: {max_error}\n")
+        if weight_column == "volume_column":
+            weighted_rmse, weighted_mean_error = weighted_error_stats(errors, merged_df[weight_column])
+            file.write(f"Volume Weighted RMSE: {weighted_rmse}\n")
+            file.write(f"Volume Weighted Mean Grouping Error: {weighted_mean_error}\n")
+
+    # Regrouping table in the layout of the KMeans clustering, the labels are already in descending E_z order
+    regrouping_df = pd.DataFrame({'Group': np.arange(len(levels)), 'E_z': levels,
+                                  'Numbers': merged_df.groupby(labels, sort=True)['Numbers'].agg(', '.join).to_numpy(),
+                                  'count_column': np.bincount(labels, merged_df['count_column']).astype(np.int64)})
+    if weight_column == "volume_column":
+        regrouping_df['volume_column'] = np.bincount(labels, np.nan_to_num(merged_df['volume_column'].to_numpy(dtype=float)))
+    regrouping_df['Percentual_diff'] = abs(regrouping_df['E_z'].pct_change() * 100)
+    print(regrouping_df)
+    merged_df['Group'] = labels
+    write_material_statistics(base_name, merged_df, regrouping_df, statistics_format, statistics_csv_on)
+    return regrouping_df
@@ -13,8 +13,11 @@
 #     from Recalculate_HU import process_material_data
 #     usage in code:
 #     df = process_material_data(file_name)
+#     or, for materials that have already been read (columns Mat and E_z):
+#     df = recalculate_material_data(df_materials, config)
 # =============================================================================
 import pandas as pd
+from Material_Core import recalculate_arrays
 
 def process_material_data(file_name,config):
     with open(file_name, 'r') as file:
@@ -26,6 +29,7 @@ def process_material_data(file_name,config):
     process_elastic_data = False
     elastic_values = []
 
+    density_cards = 0
     for line in file_contents:
         if line.startswith('*Material,'):
             if current_material is not None:
@@ -42,6 +46,9 @@ def process_material_data(file_name,config):
                 process_elastic_data = False
             elif line.startswith('*Elastic'):
                 process_elastic_data = True
+            elif line.startswith('*Density'):
+                # Bonemat V4 writes a density card into every material, it is recalculated from HU
+                density_cards += 1
 
     # Add the last material to the list
     if current_material is not None:
@@ -49,48 +56,22 @@ def process_material_data(file_name,config):
             current_material['E'], current_material['Nu'] = elastic_values
         materials.append(current_material)
 
+    print("Bonemat V4 input detected, density cards are skipped" if density_cards else "Bonemat V3 input detected")
     df_materials = pd.DataFrame(materials)
     df_materials.rename(columns={'Name': 'Mat', 'E': 'E_z'}, inplace=True)
     df_materials = df_materials.sort_values(by='E_z', ascending=False)
     df_materials["Mat"] = df_materials["Mat"].str.replace('name=', '')
-    
-    #------------------------------##Recalculate HU based on Youngs Modulus and recalculate E_z##------------------------------
-    HU_series = []
-    for E in df_materials["E_z"]:
-        # Recalculate Hu Cell specific
-        rho_ash_BM = ((E - config.a_Youngs )/ config.b_Youngs) ** (1 / config.c_Youngs)
-        rho_QCT_BM = (rho_ash_BM - config.a_Ash)/ config.b_Ash
-        HU = (rho_QCT_BM - config.a_Qct) / config.b_Qct
-        HU_series.append(HU)
-    HU_data = pd.DataFrame({"HU": HU_series})
-    df_materials['HU'] = HU_series
-
-    # Apparent Densitys [Kg/m^3]:
-    Rho_app_list = []
-    Rho_ash_list = []
-    for HU in df_materials["HU"]:
-        if HU <= 0:
-            Rho_app = config.a_Qct
-        else:
-            Rho_app = config.a_Qct + config.b_Qct * HU
-        Rho_app_list.append(Rho_app)
-        # Ash density is in g/cm^3 to comply with reference calculation method 
-        Rho_ash = (config.c_Ash * Rho_app) 
-        Rho_ash_list.append(Rho_ash)
+    return recalculate_material_data(df_materials, config)
 
-    df_materials_recalculation = pd.DataFrame({"Rho_app [kg/m^3]": Rho_app_list, "Rho_ash [g/cm^3]": Rho_ash_list})
+def recalculate_material_data(df_materials, config):
+    #------------------------------##Recalculate HU based on Youngs Modulus and recalculate E_z##------------------------------
+    # Apparent density [Kg/m^3], ash density [g/cm^3] and the youngs modulus [MPa] are calculated by the NumPy core
+    columns = recalculate_arrays(df_materials["E_z"].to_numpy(), config)
+    df_materials['HU'] = columns['HU']
+    df_materials_recalculation = pd.DataFrame({"Rho_app [kg/m^3]": columns['Rho_app [kg/m^3]'], "Rho_ash [g/cm^3]": columns['Rho_ash [g/cm^3]']})
     df_materials_recalculation["Mat"] = df_materials["Mat"]
-    df_materials_recalculation["HU"] = HU_series
-
-    # Recalculate youngs modulus (E in MPa)
-    E_z_list = []
-    for Rho_app, HU in df_materials_recalculation[["Rho_app [kg/m^3]", "HU"]].values:
-        if HU > 0.0001:
-            E_z = config.a_Youngs + config.b_Youngs  * ((config.a_Ash + config.b_Ash*(config.a_Qct+config.b_Qct *HU) ) ** config.c_Youngs)
-        else:
-            E_z = 1
-        E_z_list.append(E_z)
-    df_materials_recalculation["E_z"] = E_z_list
+    df_materials_recalculation["HU"] = columns['HU']
+    df_materials_recalculation["E_z"] = columns['E_z']
     df_materials_recalculation = df_materials_recalculation.sort_values(by='E_z', ascending=False)
     print("DF Materials recalculation \n", df_materials_recalculation)
-    return df_materials_recalculation
\ No newline at end of file
+    return df_materials_recalculation
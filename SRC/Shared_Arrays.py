@@ -0,0 +1,44 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Shared_Arrays.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Hands NumPy arrays to worker processes without pickling. The arrays are written once as .npy
+#              files into a temporary directory (in /dev/shm where available, so the files stay in memory)
+#              and the workers open them memory mapped and read only. All workers share the same pages,
+#              the memory use does not grow with the number of workers and only the file paths are sent.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import:
+#     from Shared_Arrays import share_arrays, attach_arrays, release_arrays
+#     usage in code:
+#     descriptor = share_arrays({'E_z': E_z, 'element_ids': ids})
+#     arrays = attach_arrays(descriptor)  (in the worker, e.g. in the initializer of the process pool)
+#     release_arrays(descriptor)  (in the parent once the workers are finished)
+# =============================================================================
+import os
+import shutil
+import tempfile
+import numpy as np
+
+SHARED_MEMORY_DIRECTORY = '/dev/shm'
+
+def share_arrays(arrays):
+    directory = tempfile.mkdtemp(prefix='pbmga_', dir=SHARED_MEMORY_DIRECTORY if os.path.isdir(SHARED_MEMORY_DIRECTORY) else None)
+    descriptor = {}
+    for name, array in arrays.items():
+        path = os.path.join(directory, name + '.npy')
+        np.save(path, np.ascontiguousarray(array))
+        descriptor[name] = path
+    return descriptor
+
+def attach_arrays(descriptor):
+    return {name: np.load(path, mmap_mode='r') for name, path in descriptor.items()}
+
+def release_arrays(descriptor):
+    directories = {os.path.dirname(path) for path in descriptor.values()}
+    for directory in directories:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,176 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Stage_Cache.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Content addressed cache for the stages of the pipeline (HU recalculation, grouping,
+#              material calculation and the material section of the written deck). Every stage is stored under
+#              a hash of its inputs (input file hash, grouping parameters, Material_Config values), so a
+#              rerun only executes the stages whose inputs changed. E.g. a changed Scale_G_xy only
+#              recalculates the materials and rewrites the material section of the output, the rest of the
+#              unchanged output deck is copied as a byte stream and never held in memory. Files written by a
+#              stage (statistics and plots of the grouping) are cached with it and restored on a cache hit.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Stage_Cache import cached_call, write_cached_deck, file_hash, config_hash, stage_key
+#     usage in code:
+#     key = stage_key(file_hash(file_name), config_hash(Material_Config, HU_PARAMETERS))
+#     df = cached_call(stage_cache_directory, 'Recalculate_HU', key, process_material_data, file_name, Material_Config)
+# =============================================================================
+import io
+import os
+import json
+import mmap
+import hashlib
+import pickle
+import shutil
+import tempfile
+from Inp_Keywords import MATERIAL_OPTIONS, is_keyword, keyword_name
+from Parallel_Mesh_Parser import scan_keywords
+from Write_Abaqus_Output import write_material_cards
+
+# Material_Config parameters that are used for the recalculation of HU and E_z from the input file
+HU_PARAMETERS = ('a_Qct', 'b_Qct', 'a_Ash', 'b_Ash', 'c_Ash', 'a_Youngs', 'b_Youngs', 'c_Youngs')
+
+def file_hash(file_name, cache_directory=None, chunk_bytes=16 * 1024 * 1024):
+    # The hash of large files is remembered per path, size and modification time
+    stat = os.stat(file_name)
+    path = os.path.abspath(file_name)
+    index_file = os.path.join(cache_directory, 'file_hashes.json') if cache_directory else None
+    index = {}
+    if index_file and os.path.exists(index_file):
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        entry = index.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['hash']
+
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    if index_file:
+        index[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}
+        atomic_write(index_file, json.dumps(index, indent=1).encode())
+    return digest
+
+def config_hash(config, names=None):
+    if names is None:
+        names = sorted(name for name in vars(config) if not name.startswith('_') and not callable(getattr(config, name)))
+    return stage_key(*[(name, getattr(config, name)) for name in names])
+
+def stage_key(*parts):
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+def atomic_write(path, data):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def directory_files(directory='.'):
+    return {entry.name: (entry.stat().st_size, entry.stat().st_mtime_ns) for entry in os.scandir(directory) if entry.is_file()}
+
+def restore_files(files_directory):
+    # Output files of a cached stage are copied back if they are missing or were changed
+    restored = 0
+    for name, signature in directory_files(files_directory).items():
+        if not os.path.exists(name) or (os.path.getsize(name), os.stat(name).st_mtime_ns) != signature:
+            shutil.copy2(os.path.join(files_directory, name), name)
+            restored += 1
+    return restored
+
+def store_files(files_directory, before):
+    # Files of the working directory that the stage created or changed (statistics, plots)
+    shutil.rmtree(files_directory, ignore_errors=True)
+    os.makedirs(files_directory)
+    for name, signature in directory_files().items():
+        if before.get(name) != signature:
+            shutil.copy2(name, os.path.join(files_directory, name))
+
+def cached_call(cache_directory, stage_name, key, function, *args, keep_files=False):
+    # Without a cache directory the stage is always executed
+    # keep_files: the files the stage writes to the working directory are cached with the result and restored on a hit
+    if cache_directory is None:
+        return function(*args)
+    os.makedirs(cache_directory, exist_ok=True)
+    path = os.path.join(cache_directory, f"{stage_name}_{key[:32]}.pkl")
+    files_directory = os.path.join(cache_directory, f"{stage_name}_{key[:32]}_files")
+    if os.path.exists(path) and (not keep_files or os.path.isdir(files_directory)):
+        print(f"Stage {stage_name} loaded from cache")
+        if keep_files:
+            print(f"{restore_files(files_directory)} output files of the stage restored")
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    before = directory_files() if keep_files else None
+    result = function(*args)
+    if keep_files:
+        store_files(files_directory, before)
+    atomic_write(path, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    return result
+
+def material_section(output_file):
+    # Byte range of the material section of a written deck, None if the materials are not contiguous
+    section = None
+    in_material = False
+    with open(output_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for keyword, start, end in scan_keywords(output_file):
+            name = keyword_name(keyword) if is_keyword(keyword) else None
+            if name == '*MATERIAL':
+                if section is not None and not in_material:
+                    return None
+                if section is None:
+                    section = [mm.rfind(b'\n', 0, start - 1) + 1, end]
+                in_material = True
+            elif in_material and name is not None and not name.startswith(MATERIAL_OPTIONS):
+                in_material = False
+            if in_material:
+                section[1] = end
+    return section
+
+def copy_range(source, target, start, end, chunk_bytes=16 * 1024 * 1024):
+    source.seek(start)
+    while start < end:
+        data = source.read(min(chunk_bytes, end - start))
+        if not data:
+            break
+        target.write(data)
+        start += len(data)
+
+def write_cached_deck(cache_directory, key, output_file, write_function, df_materials_aniso, config):
+    # The mesh and element set part of the deck only depends on the grouping. The byte range of the material section
+    # in the written deck is cached, a rerun copies the rest of the unchanged deck and renders the material cards again
+    if cache_directory is None:
+        write_function()
+        return
+    os.makedirs(cache_directory, exist_ok=True)
+    path = os.path.join(cache_directory, f"Deck_{key[:32]}.json")
+    entry = None
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            entry = json.load(f)
+    if entry and entry['output'] == os.path.abspath(output_file) and os.path.exists(output_file) and \
+            [os.path.getsize(output_file), os.stat(output_file).st_mtime_ns] == entry['signature']:
+        print("Mesh and element sets of the output reused, writing material section")
+        cards = io.StringIO()
+        write_material_cards(cards, df_materials_aniso, config)
+        cards = cards.getvalue().encode()
+        start, end = entry['section']
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)))
+        with open(output_file, 'rb') as source, os.fdopen(handle, 'wb') as target:
+            copy_range(source, target, 0, start)
+            target.write(cards)
+            copy_range(source, target, end, entry['signature'][0])
+        os.replace(temp_path, output_file)
+        section = [start, start + len(cards)]
+    else:
+        write_function()
+        section = material_section(output_file)
+    if section is not None:
+        entry = {'output': os.path.abspath(output_file), 'signature': [os.path.getsize(output_file), os.stat(output_file).st_mtime_ns], 'section': section}
+        atomic_write(path, json.dumps(entry).encode())
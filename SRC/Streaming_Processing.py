@@ -0,0 +1,255 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Streaming_Processing.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Out-of-core processing mode for meshes that do not fit into memory. The INP file is read
+#              in chunks of a configurable size, only one aggregate per material (modulus and element
+#              count) is kept in memory and the grouped file is written as a stream. Element IDs of the
+#              new groups are spooled to temporary files until the element sets can be written.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Streaming_Processing import process_streaming
+#     usage in code:
+#     process_streaming(file_name, file_name1, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, stream_chunk_size_mb, Material_Config, num_quantile_groups, kmeans_binned_above, grouping_weight)
+# =============================================================================
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from Recalculate_HU import recalculate_material_data
+from Calculate_Material_Parameters import CalculateMaterial
+from PercentualThresholding import generate_values
+from Equidistant_Histogram import generate_values as generate_equidistant_values
+from Quantile_Grouping import quantile_groups
+from KMeans_Fitting import fit_kmeans
+from Write_Abaqus_Output import write_material_cards, output_name
+from Inp_Keywords import MATERIAL_OPTIONS, iter_line_chunks, keyword_parameters, is_keyword, keyword_name
+
+# Maximum number of group spool files that are kept open at the same time
+MAX_OPEN_SPOOLS = 128
+
+def count_ids_in_line(line, generate=False):
+    line = line.strip()
+    if not line:
+        return 0
+    if generate:
+        values = [int(value) for value in line.rstrip(',').split(',')]
+        step = values[2] if len(values) > 2 else 1
+        return (values[1] - values[0]) // step + 1
+    return line.count(',') + 1 - line.endswith(',')
+
+def expand_generate_line(line):
+    values = [int(value) for value in line.strip().rstrip(',').split(',')]
+    step = values[2] if len(values) > 2 else 1
+    ids = np.arange(values[0], values[1] + 1, step)
+    return [','.join(map(str, ids[i:i + 16])) + '\n' for i in range(0, len(ids), 16)]
+
+def collect_material_aggregates(file_name, chunk_bytes):
+    material_E = {}
+    set_counts = {}
+    set_material = {}
+    current_material = None
+    current_set = None
+    generate = False
+    read_elastic = False
+    for lines in iter_line_chunks(file_name, chunk_bytes):
+        for line in lines:
+            if is_keyword(line):
+                keyword = keyword_name(line)
+                parameters = keyword_parameters(line)
+                current_set = None
+                read_elastic = False
+                if keyword == '*MATERIAL':
+                    current_material = parameters.get('name')
+                elif keyword == '*ELASTIC' and current_material is not None:
+                    read_elastic = True
+                elif keyword == '*ELSET':
+                    current_set = parameters.get('elset')
+                    generate = 'generate' in parameters
+                    set_counts.setdefault(current_set, 0)
+                elif keyword == '*SOLIDSECTION':
+                    set_material[parameters.get('elset')] = parameters.get('material')
+                elif not keyword.startswith(MATERIAL_OPTIONS):
+                    current_material = None
+            elif line.startswith('**'):
+                continue
+            elif read_elastic:
+                material_E[current_material] = float(line.split(',')[0])
+                read_elastic = False
+            elif current_set is not None:
+                set_counts[current_set] += count_ids_in_line(line, generate)
+
+    material_counts = {}
+    for set_name, material in set_material.items():
+        material_counts[material] = material_counts.get(material, 0) + set_counts.get(set_name, 0)
+    df_materials = pd.DataFrame({'Mat': list(material_E.keys()), 'E_z': list(material_E.values())})
+    df_materials['count_column'] = df_materials['Mat'].map(material_counts).fillna(0).astype(np.int64)
+    print(f"Collected {len(df_materials)} materials in {len(set_material)} element sets")
+    return df_materials, set_material
+
+def nearest_level(values, levels):
+    # Index of the closest level for every value, ties resolve to the larger level as in find_closest_row
+    levels = np.asarray(levels, dtype=float)
+    order = np.argsort(levels)
+    sorted_levels = levels[order]
+    upper = np.clip(np.searchsorted(sorted_levels, values), 0, len(levels) - 1)
+    lower = np.clip(upper - 1, 0, len(levels) - 1)
+    take_upper = np.abs(sorted_levels[upper] - values) <= np.abs(values - sorted_levels[lower])
+    return order[np.where(take_upper, upper, lower)]
+
+def assign_groups(df, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, config, num_quantile_groups=None, kmeans_binned_above=0):
+    E_z = df['E_z'].to_numpy()
+    if grouping_method == "None":
+        return np.arange(len(df)), E_z.copy()
+    if grouping_method == "Percentual_Thresholding":
+        levels = generate_values(E_z.max(), E_z[E_z > 0.001].min(), threshold_percentage)
+        levels.append(0.001)
+        levels = np.array(levels)
+    elif grouping_method == "Equidistant":
+        HU_levels = generate_equidistant_values(df['HU'].iloc[0], None, num_equidistant_groups)[::-1]
+        midpoints = (np.array(HU_levels[:-1]) + np.array(HU_levels[1:])) / 2
+        levels = config.a_Youngs + config.b_Youngs * ((config.a_Ash + config.b_Ash * (config.a_Qct + config.b_Qct * midpoints)) ** config.c_Youngs)
+        levels = np.maximum(levels, 1)
+    elif grouping_method == "Kmeans_Clustering":
+        labels, _ = fit_kmeans(df[['count_column', 'E_z']], num_clusters, binned_above=kmeans_binned_above)
+        levels = np.bincount(labels, weights=E_z) / np.bincount(labels)
+        return labels, levels
+    elif grouping_method == "Quantile":
+        return quantile_groups(E_z, df['count_column'], num_quantile_groups)
+    else:
+        raise ValueError(f"Grouping method {grouping_method} is not supported in streaming mode")
+    return nearest_level(E_z, levels), levels
+
+def group_materials(df_materials, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, config, num_quantile_groups=None, kmeans_binned_above=0):
+    df = df_materials[df_materials['count_column'] > 0].reset_index(drop=True)
+    labels, levels = assign_groups(df, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, config, num_quantile_groups, kmeans_binned_above)
+    group_E_z = levels[labels]
+    errors = np.abs(df['E_z'].to_numpy() - group_E_z)
+
+    df_groups = pd.DataFrame({'Label': labels, 'E_z': group_E_z, 'count_column': df['count_column']})
+    df_groups = df_groups.groupby('Label', as_index=False).agg({'E_z': 'first', 'count_column': 'sum'})
+    df_groups = df_groups.sort_values(by='E_z', ascending=False).reset_index(drop=True)
+    group_of_label = dict(zip(df_groups['Label'], df_groups.index))
+    material_group = dict(zip(df['Mat'], (group_of_label[label] for label in labels)))
+    df_groups = df_groups.drop(columns=['Label'])
+    print('Grouped ', len(df), ' materials into ', len(df_groups), ' groups')
+    return df_groups, material_group, errors
+
+def write_grouping_error_stats(stats_name, errors):
+    rmse = np.sqrt(np.mean(errors ** 2))
+    with open(stats_name, "w") as file:
+        file.write(f"RMSE: {rmse}\n")
+        file.write(f"Mean Grouping Error: {errors.mean()}\n")
+        file.write(f"Max Grouping Error: {errors.max()}\n")
+    print(f"RMSE: {rmse:.4f}")
+
+def open_spool(spool_dir, open_spools, group):
+    if group in open_spools:
+        open_spools.move_to_end(group)
+        return open_spools[group]
+    if len(open_spools) >= MAX_OPEN_SPOOLS:
+        open_spools.popitem(last=False)[1].close()
+    open_spools[group] = open(os.path.join(spool_dir, f'group_{group}.inp'), 'a')
+    return open_spools[group]
+
+def write_material_section(file, df_materials_aniso, config, material_include=None):
+    # The material cards, or an include of a shared material library
+    if material_include is None:
+        write_material_cards(file, df_materials_aniso, config)
+    else:
+        file.write(f"*Include, input={material_include}\n")
+
+def write_grouped_stream(input_file, output_file, set_group, df_materials_aniso, config, chunk_bytes, material_include=None):
+    # Groups without elements get no element set, e.g. levels of a shared material library that a file does not use
+    spool_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_file)))
+    open_spools = OrderedDict()
+    tail_path = os.path.join(spool_dir, 'tail.inp')
+    try:
+        with open(output_file, 'w') as output, open(tail_path, 'w') as tail:
+            target = output
+            current_group = None
+            generate = False
+            in_material = False
+            materials_written = False
+            skip_section_data = False
+            for lines in iter_line_chunks(input_file, chunk_bytes):
+                for line in lines:
+                    if is_keyword(line):
+                        keyword = keyword_name(line)
+                        parameters = keyword_parameters(line)
+                        current_group = None
+                        skip_section_data = False
+                        if in_material and keyword.startswith(MATERIAL_OPTIONS):
+                            continue
+                        in_material = False
+                        if keyword == '*ELSET' and parameters.get('elset') in set_group:
+                            # Everything after the first material set is held back until the new sets are written
+                            target = tail
+                            current_group = open_spool(spool_dir, open_spools, set_group[parameters.get('elset')])
+                            generate = 'generate' in parameters
+                            continue
+                        if keyword == '*SOLIDSECTION' and parameters.get('elset') in set_group:
+                            skip_section_data = True
+                            continue
+                        if keyword == '*MATERIAL':
+                            in_material = True
+                            if not materials_written:
+                                write_material_section(target, df_materials_aniso, config, material_include)
+                                materials_written = True
+                            continue
+                    elif current_group is not None:
+                        if line.strip():
+                            current_group.writelines(expand_generate_line(line) if generate else [line.strip().rstrip(',') + '\n'])
+                        continue
+                    elif in_material or (skip_section_data and not line.startswith('**')):
+                        skip_section_data = False
+                        continue
+                    target.write(line)
+            if not materials_written:
+                write_material_section(tail, df_materials_aniso, config, material_include)
+
+        for spool in open_spools.values():
+            spool.close()
+        with open(output_file, 'a') as output:
+            for group, row in df_materials_aniso.iterrows():
+                spool_path = os.path.join(spool_dir, f'group_{group}.inp')
+                if not os.path.exists(spool_path):
+                    continue
+                output.write(f"*Elset, elset={row['Set_Name']}\n")
+                with open(spool_path, 'r') as spool:
+                    shutil.copyfileobj(spool, output, chunk_bytes)
+                output.write(f"*Solid Section, elset={row['Set_Name']}, material={row['Mat']}\n")
+            with open(tail_path, 'r') as tail:
+                shutil.copyfileobj(tail, output, chunk_bytes)
+    finally:
+        for spool in open_spools.values():
+            spool.close()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def process_streaming(file_name, file_name1, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, stream_chunk_size_mb, config, num_quantile_groups=None, kmeans_binned_above=0, grouping_weight="count_column"):
+    if grouping_weight != "count_column":
+        # Only the element counts of the materials are aggregated, the nodes for the element volumes are not read
+        raise ValueError(f"Grouping weight {grouping_weight} is not supported in streaming mode, use count_column")
+    chunk_bytes = int(stream_chunk_size_mb * 1024 * 1024)
+    df_materials, set_material = collect_material_aggregates(file_name, chunk_bytes)
+    counts = dict(zip(df_materials['Mat'], df_materials['count_column']))
+    df_materials = df_materials.sort_values(by='E_z', ascending=False).reset_index(drop=True)
+    df_recalculated = recalculate_material_data(df_materials, config)
+    df_recalculated['count_column'] = df_recalculated['Mat'].map(counts)
+
+    df_groups, material_group, errors = group_materials(df_recalculated, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, config, num_quantile_groups, kmeans_binned_above)
+    df_materials_aniso = CalculateMaterial(df_groups, config)
+
+    set_group = {set_name: material_group[material] for set_name, material in set_material.items() if material in material_group}
+    base_name = output_name(file_name1, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups)
+    write_grouping_error_stats(base_name + "_grouping_error_stats.txt", errors)
+    write_grouped_stream(file_name, base_name + '.inp', set_group, df_materials_aniso, config, chunk_bytes)
+    print('Streamed output written to ', base_name + '.inp')
+    return df_materials_aniso
@@ -0,0 +1,262 @@
+# =============================================================================
+# Project Name: PBMGA Python Bone Modulus Grouping and Anisotropy
+# File Name: Watch_Service.py
+# Author: Daniel Strack
+# E-Mail: dast@mpe.au.dk
+# Description: Service mode that watches an input directory (and its subdirectories) for new INP exports
+#              and runs PBMGA on them. A file is queued once its size and modification time are stable,
+#              changes are detected with inotify (inotify_simple package) or by polling. The jobs run in a
+#              bounded pool of worker processes that keep PBMGA imported between jobs. Options in a
+#              pbmga_config.json file of the input directory override config.py for the files of that
+#              directory. Every job runs in a temporary directory, outputs, log and a JSON run report are
+#              moved to <input directory>/PBMGA_Output when the job has finished. A crashed worker process
+#              restarts the pool, the files of the crashed pool are run again one at a time.
+#
+# License: MIT License Copyright (c) 2024 Daniel Strack
+# (Refer to the LICENSE file for details)
+#
+# Example Usage:
+#     import in main:
+#     from Watch_Service import run_watch_service
+#     usage in code:
+#     run_watch_service(watch_directory, watch_workers, watch_poll_seconds, watch_stable_seconds)
+#     pbmga_config.json e.g.: {"Grouping_Method": "Equidistant", "Material_Config": {"Scale_G_xy": 0.2}}
+# =============================================================================
+import os
+import io
+import json
+import time
+import signal
+import shutil
+import tempfile
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from Stage_Cache import atomic_write
+
+WATCH_CONFIG_NAME = 'pbmga_config.json'
+OUTPUT_DIRECTORY_NAME = 'PBMGA_Output'
+INPUT_EXTENSIONS = ('.inp',)
+# Jobs lost with a crashed worker are queued again, a file that crashes the pool this often is reported as failed
+MAX_WORKER_CRASHES = 2
+
+_defaults = {}
+
+def load_directory_config(directory):
+    path = os.path.join(directory, WATCH_CONFIG_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def find_input_files(watch_directory):
+    for root, directories, files in os.walk(watch_directory):
+        directories[:] = [name for name in directories if name != OUTPUT_DIRECTORY_NAME and not name.startswith('.')]
+        for name in files:
+            if name.lower().endswith(INPUT_EXTENSIONS) and not name.startswith('.'):
+                yield os.path.join(root, name)
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def report_path(input_file):
+    directory, name = os.path.split(input_file)
+    return os.path.join(directory, OUTPUT_DIRECTORY_NAME, os.path.splitext(name)[0] + '_report.json')
+
+def write_failed_report(input_file, error):
+    # Report of a job that failed outside process_job (e.g. a crashed worker), the file is not retried until it changes
+    try:
+        signature = file_signature(input_file)
+    except FileNotFoundError:
+        return
+    report = {'input': input_file, 'input_signature': signature, 'status': 'failed', 'outputs': [],
+              'error': f"{type(error).__name__}: {error}"}
+    os.makedirs(os.path.dirname(report_path(input_file)), exist_ok=True)
+    atomic_write(report_path(input_file), json.dumps(report, indent=1).encode())
+
+def is_processed(input_file):
+    # A file is processed again when it changed after the last run, failed runs are not retried
+    try:
+        with open(report_path(input_file), 'r') as f:
+            return json.load(f).get('input_signature') == file_signature(input_file)
+    except (FileNotFoundError, ValueError):
+        return False
+
+class StableFileTracker:
+    # A file is stable once its size and modification time did not change for stable_seconds
+    def __init__(self, stable_seconds):
+        self.stable_seconds = stable_seconds
+        self.seen = {}
+
+    def stable_files(self, paths, now):
+        stable = []
+        for path in paths:
+            try:
+                signature = file_signature(path)
+            except FileNotFoundError:
+                continue
+            previous = self.seen.get(path)
+            if previous is None or previous[0] != signature:
+                self.seen[path] = (signature, now)
+            elif now - previous[1] >= self.stable_seconds:
+                stable.append(path)
+        return stable
+
+class ChangeWaiter:
+    # Waits for file system events with inotify, without inotify_simple the directory is polled
+    def __init__(self, watch_directory):
+        self.inotify = None
+        self.watched = set()
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            print("inotify_simple is not installed, the watch directory is polled")
+            return
+        self.inotify = INotify()
+        self.mask = flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE
+        self.add_directories(watch_directory)
+
+    def add_directories(self, watch_directory):
+        if self.inotify is None:
+            return
+        for root, directories, _ in os.walk(watch_directory):
+            directories[:] = [name for name in directories if name != OUTPUT_DIRECTORY_NAME and not name.startswith('.')]
+            if root not in self.watched:
+                self.inotify.add_watch(root, self.mask)
+                self.watched.add(root)
+
+    def wait(self, timeout):
+        if self.inotify is None:
+            time.sleep(timeout)
+        else:
+            self.inotify.read(timeout=int(timeout * 1000))
+
+def _init_worker():
+    # PBMGA is imported once per worker process, the config values are restored before every job
+    # Ctrl+C is handled by the service, running jobs are finished before it stops
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import main as pbmga
+    import config
+    for name in dir(config):
+        if not name.startswith('_') and not isinstance(getattr(config, name), type(os)):
+            _defaults[name] = getattr(config, name)
+    pbmga.plot_mode = "file"
+
+def apply_settings(pbmga, overrides):
+    for name, value in _defaults.items():
+        setattr(pbmga, name, value)
+    for name, value in overrides.items():
+        if name not in _defaults:
+            raise ValueError(f"Unknown option {name} in {WATCH_CONFIG_NAME}")
+        if name == 'Material_Config':
+            value = type('Material_Config', (_defaults['Material_Config'],), value)
+        setattr(pbmga, name, value)
+
+def move_outputs(job_directory, output_directory, skip):
+    outputs = []
+    for name in sorted(os.listdir(job_directory)):
+        if name in skip:
+            continue
+        os.replace(os.path.join(job_directory, name), os.path.join(output_directory, name))
+        outputs.append(name)
+    return outputs
+
+def process_job(input_file, overrides):
+    import main as pbmga
+    input_directory, input_name = os.path.split(input_file)
+    output_directory = os.path.join(input_directory, OUTPUT_DIRECTORY_NAME)
+    os.makedirs(output_directory, exist_ok=True)
+    job_directory = tempfile.mkdtemp(prefix='.job_', dir=output_directory)
+    stem = os.path.splitext(input_name)[0]
+    report = {'input': input_file, 'input_signature': file_signature(input_file), 'settings': overrides,
+              'started': time.strftime('%Y-%m-%d %H:%M:%S'), 'status': 'failed', 'outputs': []}
+    start = time.time()
+    log = io.StringIO()
+    try:
+        # The input is linked into the job directory, outputs appear in the output directory only when complete
+        try:
+            os.link(input_file, os.path.join(job_directory, input_name))
+        except OSError:
+            shutil.copy2(input_file, os.path.join(job_directory, input_name))
+        apply_settings(pbmga, overrides)
+        pbmga.directory = job_directory
+        pbmga.file_name = input_name
+        pbmga.file_name1 = stem
+        pbmga.watch_mode_on = False
+        pbmga.plot_mode = "file"
+        if not os.path.isabs(pbmga.stage_cache_directory):
+            pbmga.stage_cache_directory = os.path.join(output_directory, pbmga.stage_cache_directory)
+        with contextlib.redirect_stdout(log):
+            pbmga.main()
+        report['status'] = 'finished'
+    except Exception:
+        report['error'] = traceback.format_exc()
+    finally:
+        os.chdir(output_directory)
+        with open(os.path.join(job_directory, stem + '_run.log'), 'w') as f:
+            f.write(log.getvalue())
+            f.write(report.get('error', ''))
+        report['outputs'] = move_outputs(job_directory, output_directory, {input_name})
+        shutil.rmtree(job_directory, ignore_errors=True)
+        report['duration_seconds'] = round(time.time() - start, 3)
+        atomic_write(report_path(input_file), json.dumps(report, indent=1).encode())
+    return input_file, report['status'], report['duration_seconds']
+
+def run_watch_service(watch_directory, watch_workers=2, watch_poll_seconds=2.0, watch_stable_seconds=5.0):
+    watch_directory = os.path.abspath(watch_directory)
+    print(f"Watching {watch_directory} with {watch_workers} workers, stop with Ctrl+C")
+    tracker = StableFileTracker(watch_stable_seconds)
+    waiter = ChangeWaiter(watch_directory)
+    pending = {}
+    crashes = {}
+    executor = ProcessPoolExecutor(max_workers=watch_workers, initializer=_init_worker)
+    try:
+        while True:
+            waiter.add_directories(watch_directory)
+            for path in tracker.stable_files(find_input_files(watch_directory), time.time()):
+                # At most two jobs per worker are queued, the rest waits for the next scan
+                if len(pending) >= 2 * watch_workers:
+                    break
+                if path in pending or is_processed(path):
+                    continue
+                # Files of a crashed pool run alone, so only the file that crashes the worker is reported as failed
+                if any(queued in crashes for queued in pending) or (path in crashes and pending):
+                    continue
+                pending[path] = executor.submit(process_job, path, load_directory_config(os.path.dirname(path)))
+                print('Queued ', path)
+            broken = False
+            for path, future in list(pending.items()):
+                if future.done():
+                    del pending[path]
+                    try:
+                        input_file, status, duration = future.result()
+                    except BrokenProcessPool as error:
+                        # A crashed or killed worker (e.g. out of memory) breaks the pool for all queued jobs
+                        broken = True
+                        crashes[path] = crashes.get(path, 0) + 1
+                        if crashes[path] >= MAX_WORKER_CRASHES:
+                            del crashes[path]
+                            write_failed_report(path, error)
+                            print(f"Failed {path}: {error}")
+                        else:
+                            print(f"Worker crashed, {path} is queued again")
+                        continue
+                    except Exception as error:
+                        write_failed_report(path, error)
+                        print(f"Failed {path}: {type(error).__name__}: {error}")
+                        continue
+                    crashes.pop(path, None)
+                    print(f"{status.capitalize()} {input_file} in {duration:.1f} s")
+            if broken:
+                # Jobs that were not started yet are queued again with the next scan
+                pending.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=watch_workers, initializer=_init_worker)
+                print("Worker pool restarted")
+            waiter.wait(watch_poll_seconds)
+    except KeyboardInterrupt:
+        print("Watch service stopped")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -18,9 +18,11 @@
 # =============================================================================
 import shutil
 import pandas as pd
+import numpy as np
 import re
 import math
 import os
+from Inp_Keywords import MATERIAL_OPTIONS, iter_line_chunks, keyword_parameters, is_keyword, keyword_name, section_elsets
 
 def copy_file(source, destination):
     shutil.copy(source, destination)
@@ -29,8 +31,14 @@ def prepare_input_lines():
     return ['**', "*Assembly, name=Assembly", '**', "*Instance, name=PART-1-1, part=PART-1", "*End Instance", '**', "*End Assembly", '**', "** MATERIALS", '**']
 
 def update_material_file(df_materials_aniso, input_file, output_file, grouping_method,  config):
-    replacement_lines = ['Replacement Line 1']
-    
+    # The cards of all materials are rendered at once, the *Material lines look them up by name.
+    # Repeated names use their first row for the card and the count, as the row lookup did
+    df_materials = df_materials_aniso.drop_duplicates('Mat')
+    material_cards = dict(zip(df_materials['Mat'], render_material_cards(df_materials, config)))
+    if grouping_method == "Percentual_Thresholding":
+        counts = dict(zip(df_materials['Mat'], df_materials['count_column']))
+        material_cards = {name: card for name, card in material_cards.items() if counts[name] > 0}
+
     with open(input_file, 'r') as file:
         lines = file.readlines()
 
@@ -40,70 +48,43 @@ def update_material_file(df_materials_aniso, input_file, output_file, grouping_m
             line = lines[i].strip()
             if line.startswith('*Material, name='):
                 name = line.split('=')[1]
-                matching_row = df_materials_aniso.loc[df_materials_aniso['Mat'] == name]
-                if grouping_method == "Percentual_Thresholding":
-                    if not matching_row['count_column'].empty:
-                        checker = matching_row['count_column'].iloc[0]
-                        if checker > 0:
-                            write_material_block(file, matching_row, line,  config)
-                else:
-                    write_material_block(file, matching_row, line, config)
-                i += 3  # Skip the original line and the two lines being replaced
+                if name in material_cards:
+                    file.write(line + '\n' + material_cards[name])
+                elif grouping_method != "Percentual_Thresholding":
+                    file.write(line + '\n')
+                # Skip the original material block, Bonemat V4 blocks contain a *Density card in addition to *Elastic
+                i += 1
+                while i < len(lines) and not lines[i].startswith('**') and (not lines[i].startswith('*') or keyword_name(lines[i]).startswith(MATERIAL_OPTIONS)):
+                    i += 1
             else:
                 file.write(line + '\n')
                 i += 1
 
-def write_material_block(file, matching_row, line, config):
-    file.write(line + '\n')
-    for replacement_line in ['Replacement Line 1']:
-        if not matching_row.empty:
-            # Write Density
-            file.write("*Density" + '\n')
-            Density = matching_row['Density [ton/mm^3]'].iloc[0]
-            input_density = f'{Density} \n'
-            file.write(input_density)
-            if config.anisotropy_enabled == True:
-                # Write elastic parameters
-                E_x = matching_row['E_x'].iloc[0]
-                E_y = matching_row['E_y'].iloc[0]
-                E_z = matching_row['E_z'].iloc[0]
-                G_xy = matching_row['G_xy'].iloc[0]
-                G_xz = matching_row['G_xz'].iloc[0]
-                G_yz = matching_row['G_yz'].iloc[0]
-                V_xy = matching_row['V_xy'].iloc[0]
-                V_xz = matching_row['V_xz'].iloc[0]
-                V_yz = matching_row['V_yz'].iloc[0]
-                file.write("*Elastic, type=ENGINEERING CONSTANTS" + '\n')
-                input_line = f' {E_x},{E_y},{E_z},{V_xy},{V_xz},{V_yz},{G_xy},{G_xz},\n {G_yz},\n'
-                file.write(input_line)
-
-            elif config.anisotropy_enabled == False:
-                E_z = matching_row['E_z'].iloc[0]
-                V_xy = matching_row['V_xy'].iloc[0]
-                file.write("*Elastic" + '\n')
-                input_line = f' {E_z}, {V_xy}\n'
-                file.write(input_line)
-
-            if config.plasticity_enabled == True:
-                # Write plastic parameters
-                file.write("*Plastic" + '\n')
-                Yield_1 = matching_row["Yield Stress 1"].iloc[0]
-                Strain_1 = matching_row["Plastic strain 1"].iloc[0]
-                Yield_2 = matching_row["Yield Stress 2"].iloc[0]
-                Strain_2 = matching_row["Plastic strain 2"].iloc[0]
-                Yield_3 = matching_row["Yield Stress 3"].iloc[0]
-                Strain_3 = matching_row["Plastic strain 3"].iloc[0]
-                input_plastic = f' {Yield_1},{Strain_1}\n {Yield_2},{Strain_2}\n {Yield_3},{Strain_3}\n'
-                file.write(input_plastic)
-
-                # Write potential parameters, only necessary if combined with anisotropy
-                if config.anisotropy_enabled == True:
-                    file.write("*Potential" + '\n')
-                    input_potential = f'{"1."},{"1."},{"1."},{"1."},{"1."},{"1."}\n'
-                    file.write(input_potential)
-            elif config.plasticity_enabled == False:
-                file.write("")
-        
+def render_material_cards(df_materials_aniso, config):
+    # *Density, *Elastic, *Plastic and *Potential cards of every material, without the *Material line.
+    # One %-format per material on the plain column values, %r gives the full precision text of f-strings
+    digits = config.card_significant_digits
+    columns = ['Density [ton/mm^3]']
+    template = "*Density\n{} \n"
+    if config.anisotropy_enabled == True:
+        columns += ['E_x', 'E_y', 'E_z', 'V_xy', 'V_xz', 'V_yz', 'G_xy', 'G_xz', 'G_yz']
+        template += "*Elastic, type=ENGINEERING CONSTANTS\n {},{},{},{},{},{},{},{},\n {},\n"
+    else:
+        columns += ['E_z', 'V_xy']
+        template += "*Elastic\n {}, {}\n"
+    if config.plasticity_enabled == True:
+        columns += ["Yield Stress 1", "Plastic strain 1", "Yield Stress 2", "Plastic strain 2", "Yield Stress 3", "Plastic strain 3"]
+        template += "*Plastic\n {},{}\n {},{}\n {},{}\n"
+        # Potential parameters, only necessary if combined with anisotropy
+        if config.anisotropy_enabled == True:
+            template += "*Potential\n1.,1.,1.,1.,1.,1.\n"
+    template = template.format(*(['%r' if digits is None else f'%.{digits}g'] * len(columns)))
+    return [template % row for row in zip(*(df_materials_aniso[column].tolist() for column in columns))]
+
+def write_material_cards(file, df_materials_aniso, config):
+    cards = render_material_cards(df_materials_aniso, config)
+    file.write(''.join('*Material, name=' + name + '\n' + card for name, card in zip(df_materials_aniso['Mat'], cards)))
+
 def remove_lines_between_markers(input_filename, output_filename, start_marker, end_marker):
     with open(input_filename, 'r') as input_file:
         lines = input_file.readlines()
@@ -168,6 +149,69 @@ def modify_string(s):
            s = s[:-1]
     return s
 
+def output_name(file_name1, grouping_method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups=None):
+    if grouping_method == "None":
+        return file_name1 + '_aniso'
+    if grouping_method == "Percentual_Thresholding":
+        return file_name1 + '_' + modify_string(str(threshold_percentage * 100)) + 'per'
+    if grouping_method == "Equidistant":
+        return file_name1 + '_' + str(num_equidistant_groups) + 'EqiGroups'
+    if grouping_method == "Quantile":
+        return file_name1 + '_' + str(num_quantile_groups) + 'Q'
+    return file_name1 + '_' + str(num_clusters) + 'C'
+
+def format_element_lines(numbers):
+    # Element IDs of a set as data lines with 16 entries per line
+    if isinstance(numbers, list):
+        numbers = ','.join(numbers)
+    ids = np.fromstring(numbers.replace(',', ' '), sep=' ', dtype=np.int64)
+    return [','.join(map(str, ids[i:i + 16])) + '\n' for i in range(0, len(ids), 16)]
+
+def write_element_sets(file, df_materials_aniso):
+    for index, row in df_materials_aniso.iterrows():
+        file.write("*Elset, elset={}\n".format(row["Set_Name"]))
+        file.writelines(format_element_lines(row["Numbers"]))
+        file.write("*Solid Section, elset={}, material={}\n".format(row["Set_Name"], row["Mat"]))
+
+def write_model_deck(df_materials_aniso, mesh_file, output_file, config, chunk_bytes=64 * 1024 * 1024):
+    # Uses the mesh file as template: existing material sets, sections and materials are replaced by the
+    # sets and materials in df_materials_aniso, all other lines are written unchanged
+    material_sets = section_elsets(mesh_file, chunk_bytes)
+    sets_written = False
+    materials_written = False
+    skip_block = False
+    in_material = False
+    with open(output_file, 'w') as output:
+        for lines in iter_line_chunks(mesh_file, chunk_bytes):
+            for line in lines:
+                if not is_keyword(line):
+                    if not (skip_block or in_material):
+                        output.write(line)
+                    continue
+                keyword = keyword_name(line)
+                parameters = keyword_parameters(line)
+                if in_material and keyword.startswith(MATERIAL_OPTIONS):
+                    continue
+                in_material = False
+                skip_block = False
+                if keyword in ('*ELSET', '*SOLIDSECTION') and parameters.get('elset') in material_sets:
+                    skip_block = True
+                elif keyword == '*MATERIAL':
+                    in_material = True
+                if (skip_block or keyword in ('*ENDPART', '*ASSEMBLY', '*MATERIAL', '*STEP')) and not sets_written:
+                    write_element_sets(output, df_materials_aniso)
+                    sets_written = True
+                if (in_material or keyword == '*STEP') and not materials_written:
+                    write_material_cards(output, df_materials_aniso, config)
+                    materials_written = True
+                if not (skip_block or in_material):
+                    output.write(line)
+        if not sets_written:
+            write_element_sets(output, df_materials_aniso)
+        if not materials_written:
+            write_material_cards(output, df_materials_aniso, config)
+    print('Output written to ', output_file)
+
 def process_aniso_material_file(df_materials_aniso, file_name, grouping_method,file_name1, num_clusters,threshold_percentage,num_equidistant_groups, config):
     output_file = "mapped_aniso_material.inp"
     copy_file(file_name, output_file)
@@ -22,7 +22,10 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 directory = dir_path.rstrip('\SRC') + '\Tutorial\MaterialMappedMeshes' #Normal String, Change to your own directory where your data is located
 file_name1 = 'L3_Bonemat3_0MPa' #Filename without inp ending
 file_name = file_name1 + '.inp' #Normal String
-#Grouping Methods: "Percentual_Thresholding", "None", "Kmeans_Clustering, "Equidistant"
+#Source of the input file: "Auto" (detected from the file), "Bonemat3", "Bonemat4", "Mimics", "Simpleware"
+#Bonemat files are read directly, Mimics and Simpleware exports are translated in memory, the preprocessor scripts are not needed
+input_format = "Auto" #Normal String
+#Grouping Methods: "Percentual_Thresholding", "None", "Kmeans_Clustering, "Equidistant", "Quantile"
 Grouping_Method = "Kmeans_Clustering" #Normal String
 
 #Options for Adaptive Clustering / KMeans Clustering for Visualization
@@ -30,6 +33,16 @@ plot_cluster_on = False #Boolean
 plot_percentual_diff_on = False
 # Amount of groups for KMeans
 num_clusters = 50  # Adjust as needed
+#KMeans fit: number of initialisations ("auto" = one k-means++ start) and convergence tolerance
+kmeans_n_init = "auto"
+kmeans_tol = 1e-4
+#Stores the fitted centroids per material data and cluster count, later fits start from the stored centroids of the
+#same cluster count (identical groups) or of the closest stored cluster count (e.g. 50 clusters from 45)
+kmeans_warm_start_on = False #Boolean
+kmeans_centroid_directory = '.pbmga_centroids' #Normal String, relative to directory
+#Above this number of materials KMeans clusters the bins of a fine weighted histogram of the materials instead of
+#every material (e.g. one material per element), 0 = always all materials
+kmeans_binned_above = 200000
 
 # Percentual Threshold 
 threshold = 10
@@ -40,6 +53,95 @@ plot_equidistant_histogram_on = False
 # Amount of groups for Equidistant grouping
 num_equidistant_groups = 10
 
+# Amount of groups for Quantile grouping, every group holds the same number of elements (volume with "volume_column")
+num_quantile_groups = 50
+
+#Plot output: "show" opens a window, "file" saves the plots as PNG next to the output (headless, for batch runs)
+plot_mode = "show" #Normal String
+plot_max_points = 200000 #Scatter plots with more points are drawn as hexbin density plus a random subset
+
+#Weight of a material during grouping and in the grouping error statistics
+#"count_column" (number of elements) or "volume_column" (element volume, only C3D4/C3D10 meshes, not in streaming mode)
+grouping_weight = "count_column" #Normal String
+#Worker processes for reading *Node/*Element blocks, 1 = serial, 0 = all available cores
+mesh_parse_workers = 1
+#Decks with several material mapped parts are mapped and grouped per part, the set and material names
+#get the part name as prefix. Worker processes for the parts, 0 = one per part
+multi_part_workers = 0
+
+#Direct mapping of a CT volume onto the mesh elements instead of a Bonemat mapped input file
+ct_mapping_on = False #Boolean
+ct_volume_file = '' #Normal String, .npy, .nrrd or .raw file in directory
+ct_raw_shape = None #(nx, ny, nz), only needed for .raw files
+ct_raw_dtype = 'int16' #Only needed for .raw files
+ct_spacing = (1.0, 1.0, 1.0) #Voxel size in mm (x, y, z), for .npy and .raw files
+ct_origin = (0.0, 0.0, 0.0) #Position of the first voxel in mm, for .npy and .raw files
+ct_samples_per_element = 4 #1 (centroid) or 4 (Gauss points) samples per tetrahedron
+ct_material_gap = 1.0 #Modulus gap in MPa, elements within the gap share one material
+
+#Material statistics of the grouping, columnar tables with the element IDs as integer arrays
+statistics_format = "npz" #"npz", "parquet" or "feather" (parquet/feather require pyarrow)
+statistics_csv_on = False #Boolean, additional CSV summary without element IDs
+
+#Reverse Cuthill-McKee renumbering of the nodes and elements of the written deck for a smaller solver bandwidth,
+#the old IDs are saved to <output>_Renumbering.npz. Decks with steps, surfaces, loads or included mesh data are not renumbered
+renumber_mesh_on = False #Boolean
+
+#Export of the CalculateMaterial columns per element as .npy files (memory mappable with np.load(..., mmap_mode='r'))
+#to <output>_ElementProperties, aligned with element_ids.npy and group_ids.npy
+element_export_on = False #Boolean
+
+#Consistency check of the written deck before the solver: every element in exactly one section, every section with
+#an existing element set and material, valid elastic constants, densities and increasing plastic strains
+deck_check_on = False #Boolean
+#Deck the written deck is compared with per element (changed cards, E_z differences), e.g. the output of another
+#grouping method, '' = no comparison
+deck_diff_reference = '' #Normal String, relative to directory
+
+#Cache of the pipeline stages, reruns only execute stages whose inputs (input file, grouping
+#parameters, Material_Config) changed. Not used in streaming mode
+stage_cache_on = False #Boolean
+stage_cache_directory = '.pbmga_cache' #Normal String, relative to directory
+
+#Out-of-core streaming mode for meshes larger than the available memory
+#Only one aggregate per material is held in memory, element sets are spooled to temporary files
+streaming_mode_on = False #Boolean
+#Size of the chunks read from the INP file in MB, bounds the memory used for mesh data
+stream_chunk_size_mb = 64
+
+#Cohort mode, one shared material library for all INP files of a study (uses the streaming reader)
+#The group levels follow from the merged E_z distributions of all files, every file is then assigned to these
+#levels and includes the material cards from <cohort_name>_materials.inp. Grouping_Method "None" is not supported
+cohort_mode_on = False #Boolean
+cohort_name = 'Cohort' #Normal String, prefix of the material library and suffix of the grouped files
+#List of INP files in directory, outputs of earlier cohort runs are left out
+cohort_files = sorted(name for name in os.listdir(directory) if name.lower().endswith('.inp') and not name.endswith(('_' + cohort_name + '.inp', cohort_name + '_materials.inp'))) if os.path.isdir(directory) else []
+cohort_workers = 0 #Worker processes, 0 = all available cores
+
+#Watch folder service, new INP files in watch_directory and its subdirectories are processed as they arrive
+#A pbmga_config.json in the directory of a file overrides options of this file, e.g. {"num_clusters": 30}
+#Outputs and a JSON run report are written to PBMGA_Output next to the input file
+watch_mode_on = False #Boolean
+watch_directory = directory #Normal String
+watch_workers = 2 #Number of files processed in parallel
+watch_poll_seconds = 2.0 #Interval of the directory scan
+watch_stable_seconds = 5.0 #A file is processed once its size did not change for this time
+
+#Job server for interactive tuning, the mesh is loaded once and kept in memory, requests on localhost HTTP:
+#/group (grouping parameters), /materials (Material_Config values), /write (INP output), /status, /shutdown
+server_mode_on = False #Boolean
+server_port = 8765
+server_workers = 2 #Threads for the requests, interactive requests are started before INP exports
+
+#Grouping sweep, the configurations are evaluated in parallel and summarized in <file_name1>_GroupingSweep.csv
+#The mesh is parsed once, the workers share the material arrays
+sweep_mode_on = False #Boolean
+sweep_num_clusters = [20, 30, 40, 50, 60] #KMeans cluster counts
+sweep_threshold_percentages = [0.05, 0.1, 0.15, 0.2] #Percentual thresholds
+sweep_num_equidistant_groups = [5, 10, 20] #Equidistant group counts
+sweep_num_quantile_groups = [20, 50, 100] #Quantile group counts
+sweep_workers = 0 #Worker processes, 0 = all available cores
+
 class Material_Config:
     # Bonemat HU Calculation Parameters
     a_Qct = 47
@@ -57,6 +159,8 @@ class Material_Config:
     #Material Characterization
     anisotropy_enabled = True
     plasticity_enabled = True
+    #Significant digits of the values in the material cards, None writes the full precision
+    card_significant_digits = None
 
     #Youngs Modulus anisotropy
     Scale_E_x = 0.333 
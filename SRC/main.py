@@ -20,43 +20,157 @@ from config import Material_Config
 from Recalculate_HU import process_material_data
 from PercentualThresholding import process_data 
 from Calculate_Material_Parameters import CalculateMaterial
-from Write_Abaqus_Output import process_aniso_material_file
+from Write_Abaqus_Output import process_aniso_material_file, write_model_deck, output_name
 from KMeans_Clustering import process_clustering
 from Equidistant_Histogram import process_data_equidistant
+from Quantile_Grouping import process_quantile_grouping
+from Streaming_Processing import process_streaming
+from Cohort_Grouping import process_cohort
+from CT_Material_Mapping import process_ct_mapping
+from Plotting import configure_plotting, wait_for_plots
+from Input_Translation import detect_input_format, translate_input
+from Watch_Service import run_watch_service
+from Job_Server import run_job_server
+from Grouping_Sweep import sweep_configurations, run_grouping_sweep
+from Multi_Part import material_parts, process_multi_part
+from Mesh_Renumbering import renumber_deck
+from Deck_Check import check_deck
+from Element_Export import export_element_properties
+from Deck_Diff import diff_decks
+from Stage_Cache import cached_call, write_cached_deck, file_hash, config_hash, stage_key, HU_PARAMETERS
 
-def main():
-   os.chdir(directory)
-   df = process_material_data(file_name,Material_Config)
+def write_output(df_materials_aniso, elset_df):
+   # The quantile grouping is written with the generic deck writer
+   if elset_df is None and Grouping_Method != "Quantile":
+      process_aniso_material_file(df_materials_aniso, file_name, Grouping_Method,file_name1,num_clusters,threshold_percentage,num_equidistant_groups, Material_Config)
+   else:
+      # Materials mapped in memory, the mesh file serves as template for the output
+      write_model_deck(df_materials_aniso, file_name, output_name(file_name1, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups) + '.inp', Material_Config)
+
+def map_materials(config=None):
+   config = Material_Config if config is None else config
+   if ct_mapping_on:
+      print("CT mapping enabled")
+      return process_ct_mapping(file_name, ct_volume_file, ct_raw_shape, ct_raw_dtype, ct_spacing, ct_origin, ct_samples_per_element, ct_material_gap, config)
+   input_source = detect_input_format(file_name) if input_format == "Auto" else input_format
+   print("Input format: ", input_source)
+   # Bonemat V3 and V4 files are read directly, the exports of other tools are translated in memory
+   if input_source not in ("Bonemat3", "Bonemat4"):
+      return translate_input(file_name, config)
+   return process_material_data(file_name,config), None
+
+def finish_output(output_file, df_materials_aniso):
+   # Comparison, renumbering, consistency check and element property export of a written deck
+   # The comparison runs before the renumbering, the element IDs of the reference are the IDs of the input mesh
+   if deck_diff_reference:
+      diff_decks(deck_diff_reference, output_file)
+   if renumber_mesh_on:
+      renumber_deck(output_file, output_file)
+   if deck_check_on:
+      check_deck(output_file)
+   if element_export_on:
+      export_element_properties(output_file, df_materials_aniso)
+
+def grouping_stage(df, elset_df):
+   # The plots are saved before the files of the stage are cached
+   grouping_df = group_materials(df, elset_df)
+   wait_for_plots()
+   return grouping_df
+
+def centroid_directory():
+   return kmeans_centroid_directory if kmeans_warm_start_on else None
+
+def group_materials(df, elset_df):
    if Grouping_Method == "None":
-      df_materials_aniso = CalculateMaterial(df,Material_Config)
-      print(df_materials_aniso)
-      process_aniso_material_file(df_materials_aniso, file_name, Grouping_Method,file_name1,num_clusters,threshold_percentage, Material_Config)
-      print("No reorganizing of material grouping") 
+      print("No reorganizing of material grouping")
+      if elset_df is not None:
+         df = df.merge(elset_df[['Solid Section Information', 'Numbers']].rename(columns={'Solid Section Information': 'Mat'}), on='Mat')
+      return df
    elif Grouping_Method == "Percentual_Thresholding":
       print("Percentual Threshold Grouping Enabled")
-      threshold_grouping_df = process_data(file_name, df, threshold_percentage)
-      df_materials_aniso = CalculateMaterial(threshold_grouping_df,Material_Config)
-      process_aniso_material_file(df_materials_aniso, file_name, Grouping_Method,file_name1,num_clusters,threshold_percentage,num_equidistant_groups, Material_Config)
-
-      print("Grouping Finished")
+      return process_data(file_name, df, threshold_percentage, grouping_weight, mesh_parse_workers, elset_df, statistics_format, statistics_csv_on)
    elif Grouping_Method == "Equidistant":
       print("Equidistant")
-   
-      threshold_grouping_df = process_data_equidistant(file_name, df, num_equidistant_groups,plot_equidistant_histogram_on,Material_Config)
-      df_materials_aniso = CalculateMaterial(threshold_grouping_df,Material_Config)
-      process_aniso_material_file(df_materials_aniso, file_name, Grouping_Method,file_name1,num_clusters,threshold_percentage,num_equidistant_groups, Material_Config)
-
-      print("Grouping Finished")
+      return process_data_equidistant(file_name, df, num_equidistant_groups,plot_equidistant_histogram_on,Material_Config, grouping_weight, mesh_parse_workers, elset_df, statistics_format, statistics_csv_on)
    elif Grouping_Method == "Kmeans_Clustering":
-      Kmeans_clustering_df = process_clustering(file_name, df, num_clusters, plot_cluster_on, plot_percentual_diff_on)
-      df_materials_aniso = CalculateMaterial(Kmeans_clustering_df,Material_Config)
-      print(df_materials_aniso)
-      process_aniso_material_file(df_materials_aniso, file_name, Grouping_Method,file_name1,num_clusters,threshold_percentage,num_equidistant_groups,Material_Config)
-      print("Kmeans Clustering Enabled") 
-   elif Grouping_Method != ("KMeans_Clustering" or "Percentual_Thresholding" or "None"):
+      print("Kmeans Clustering Enabled")
+      return process_clustering(file_name, df, num_clusters, plot_cluster_on, plot_percentual_diff_on, grouping_weight, mesh_parse_workers, elset_df, statistics_format, statistics_csv_on,
+                                kmeans_n_init, kmeans_tol, centroid_directory(), kmeans_binned_above)
+   elif Grouping_Method == "Quantile":
+      print("Quantile Grouping Enabled")
+      return process_quantile_grouping(file_name, df, num_quantile_groups, grouping_weight, mesh_parse_workers, elset_df, statistics_format, statistics_csv_on)
+
+def main():
+   if watch_mode_on:
+      run_watch_service(watch_directory, watch_workers, watch_poll_seconds, watch_stable_seconds)
+      return
+   os.chdir(directory)
+   if cohort_mode_on:
+      print("Cohort mode enabled")
+      output_files, df_library = process_cohort(cohort_files, cohort_name, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups, stream_chunk_size_mb, Material_Config, cohort_workers)
+      for output_file in output_files:
+         finish_output(output_file, df_library)
+      print("Finished")
+      return
+   if streaming_mode_on:
+      print("Streaming mode enabled")
+      df_materials_aniso = process_streaming(file_name, file_name1, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, stream_chunk_size_mb, Material_Config, num_quantile_groups, kmeans_binned_above, grouping_weight)
+      finish_output(output_name(file_name1, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups) + '.inp', df_materials_aniso)
+      print("Finished")
+      return
+   if Grouping_Method not in ("None", "Percentual_Thresholding", "Equidistant", "Kmeans_Clustering", "Quantile"):
       print("Error no/wrong grouping method provided, check spelling in config.py")
-   
-   
+      return
+
+   if sweep_mode_on:
+      print("Grouping sweep enabled")
+      df, elset_df = map_materials()
+      configurations = sweep_configurations(sweep_num_clusters, sweep_threshold_percentages, sweep_num_equidistant_groups, sweep_num_quantile_groups)
+      run_grouping_sweep(file_name, file_name1, df, elset_df, configurations, Material_Config, grouping_weight, mesh_parse_workers, sweep_workers,
+                         kmeans_n_init, kmeans_tol, centroid_directory(), kmeans_binned_above)
+      return
+   if server_mode_on:
+      settings = dict(Grouping_Method=Grouping_Method, num_clusters=num_clusters, threshold_percentage=threshold_percentage,
+                      num_equidistant_groups=num_equidistant_groups, num_quantile_groups=num_quantile_groups, grouping_weight=grouping_weight, mesh_parse_workers=mesh_parse_workers,
+                      plot_cluster_on=plot_cluster_on, plot_percentual_diff_on=plot_percentual_diff_on,
+                      plot_equidistant_histogram_on=plot_equidistant_histogram_on, plot_max_points=plot_max_points,
+                      kmeans_n_init=kmeans_n_init, kmeans_tol=kmeans_tol, kmeans_centroid_directory=centroid_directory(),
+                      kmeans_binned_above=kmeans_binned_above)
+      run_job_server(map_materials, file_name, file_name1, settings, Material_Config, server_port, server_workers)
+      return
+
+   configure_plotting(plot_mode, plot_max_points)
+   # Decks with several material mapped parts are mapped and grouped per part
+   if not ct_mapping_on and len(material_parts(file_name)) > 1:
+      output_file = output_name(file_name1, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups) + '.inp'
+      df_materials_aniso = process_multi_part(file_name, file_name1, output_file, multi_part_workers)
+      finish_output(output_file, df_materials_aniso)
+      wait_for_plots()
+      print("Finished")
+      return
+   # Every stage is cached under a hash of its inputs, reruns only execute the stages whose inputs changed
+   cache_directory = stage_cache_directory if stage_cache_on else None
+   if stage_cache_on:
+      os.makedirs(cache_directory, exist_ok=True)
+      input_key = [file_hash(file_name, cache_directory), input_format]
+      if ct_mapping_on:
+         input_key += [file_hash(ct_volume_file, cache_directory), ct_raw_shape, ct_raw_dtype, ct_spacing, ct_origin, ct_samples_per_element, ct_material_gap]
+      mapping_key = stage_key(input_key, config_hash(Material_Config, HU_PARAMETERS))
+      grouping_key = stage_key(mapping_key, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups, grouping_weight, statistics_format, statistics_csv_on,
+                               kmeans_n_init, kmeans_tol, kmeans_warm_start_on, kmeans_binned_above)
+      material_key = stage_key(grouping_key, config_hash(Material_Config))
+   else:
+      mapping_key = grouping_key = material_key = None
+
+   df, elset_df = cached_call(cache_directory, 'Mapping', mapping_key, map_materials)
+   grouping_df = cached_call(cache_directory, 'Grouping', grouping_key, grouping_stage, df, elset_df, keep_files=True)
+   df_materials_aniso = cached_call(cache_directory, 'CalculateMaterial', material_key, CalculateMaterial, grouping_df, Material_Config)
+   print(df_materials_aniso)
+   output_file = output_name(file_name1, Grouping_Method, num_clusters, threshold_percentage, num_equidistant_groups, num_quantile_groups) + '.inp'
+   write_cached_deck(cache_directory, grouping_key, output_file, lambda: write_output(df_materials_aniso, elset_df), df_materials_aniso, Material_Config)
+   finish_output(output_file, df_materials_aniso)
+   wait_for_plots()
+   print("Grouping Finished")
    print("Finished")
 if __name__ == "__main__":
     main()
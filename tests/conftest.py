@@ -0,0 +1,5 @@
+# The modules of SRC are imported as flat modules like main.py does
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SRC'))
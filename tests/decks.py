@@ -0,0 +1,55 @@
+# Small Bonemat like decks for the tests: a grid of cubes split into six C3D4 elements each, with shuffled
+# node and element IDs, one element set, section and material per layer of cubes along x
+import itertools
+import os
+import numpy as np
+
+def tet_grid(cubes=(4, 2, 2), seed=0):
+    # Node IDs, coordinates, element IDs, connectivity and the x layer of every element
+    nx, ny, nz = cubes
+    grid = np.stack(np.meshgrid(np.arange(nx + 1), np.arange(ny + 1), np.arange(nz + 1), indexing='ij'), axis=-1)
+    coordinates = grid.reshape(-1, 3).astype(float)
+    index = np.arange(len(coordinates)).reshape(nx + 1, ny + 1, nz + 1)
+    connectivity, layers = [], []
+    for x, y, z in itertools.product(range(nx), range(ny), range(nz)):
+        # Kuhn split along the diagonal of the cube, neighbouring cubes share their faces
+        for axes in itertools.permutations(range(3)):
+            corner = np.array([x, y, z])
+            nodes = [index[tuple(corner)]]
+            for axis in axes:
+                corner[axis] += 1
+                nodes.append(index[tuple(corner)])
+            connectivity.append(nodes)
+            layers.append(x)
+    rng = np.random.default_rng(seed)
+    node_ids = rng.permutation(len(coordinates)) + 101
+    element_ids = rng.permutation(len(connectivity)) + 11
+    return node_ids, coordinates, element_ids, node_ids[np.array(connectivity)], np.array(layers)
+
+def material_card(E_z, scale=1.0):
+    return (f"*Density\n{1.2e-09 * scale} \n*Elastic\n {E_z}, 0.3\n"
+            f"*Plastic\n {E_z / 100},0.\n {E_z / 90},0.01\n")
+
+def write_deck(path, mesh, moduli, include=None, material_file=None):
+    # moduli holds the E_z of every layer, with material_file the cards are written there and included
+    node_ids, coordinates, element_ids, connectivity, layers = mesh
+    lines = ["*Heading", "*Node"]
+    order = np.argsort(node_ids)[::-1]
+    lines += [f"{node_id}, {x!r}, {y!r}, {z!r}" for node_id, (x, y, z) in zip(node_ids[order].tolist(), coordinates[order].tolist())]
+    lines.append("*Element, type=C3D4")
+    lines += [f"{element_id}, " + ", ".join(str(node) for node in nodes) for element_id, nodes in zip(element_ids, connectivity)]
+    for layer in range(len(moduli)):
+        members = np.sort(element_ids[layers == layer])
+        lines.append(f"*Elset, elset=Set_{layer + 1}")
+        lines += [", ".join(str(member) for member in members[start:start + 16]) for start in range(0, len(members), 16)]
+        lines.append(f"*Solid Section, elset=Set_{layer + 1}, material=Mat_{layer + 1}")
+    if include:
+        lines.append(f"*Include, input={include}")
+    cards = "".join(f"*Material, name=Mat_{layer + 1}\n" + material_card(E_z) for layer, E_z in enumerate(moduli))
+    if material_file:
+        with open(material_file, 'w') as f:
+            f.write(cards)
+        lines.append(f"*Include, input={os.path.basename(material_file)}")
+        cards = ""
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n" + cards)
@@ -0,0 +1,63 @@
+# NRRD reading of the CT mapping: raw (memory mapped), gzip and detached data, header vectors with spaces
+import gzip
+import numpy as np
+import pytest
+from CT_Material_Mapping import nrrd_vectors, read_nrrd, trilinear_interpolation
+
+VOLUME = np.random.default_rng(0).integers(-1000, 2000, size=(5, 4, 3)).astype(np.int16)
+
+def header(encoding, extra='', endian='little', directions='(1, 0, 0) (0, -2, 0) (0, 0, 0.5)'):
+    return ("NRRD0004\n# comment\ntype: short\ndimension: 3\nsizes: 5 4 3\n"
+            f"space directions: {directions}\nspace origin: (10,20, -30.5)\n"
+            f"encoding: {encoding}\nendian: {endian}\n{extra}\n").encode()
+
+def data(volume=VOLUME, dtype='<i2'):
+    # The first NRRD axis is the fastest
+    return volume.transpose().astype(dtype).tobytes()
+
+def check(volume, directions, origin):
+    np.testing.assert_array_equal(volume, VOLUME)
+    np.testing.assert_array_equal(directions, [[1, 0, 0], [0, -2, 0], [0, 0, 0.5]])
+    np.testing.assert_array_equal(origin, [10, 20, -30.5])
+
+def test_nrrd_vectors():
+    assert nrrd_vectors('(1,0,0) ( 0, -2.5 ,0 )(0,0,1e-1)') == [[1, 0, 0], [0, -2.5, 0], [0, 0, 0.1]]
+
+def test_raw_is_memory_mapped(tmp_path):
+    path = tmp_path / 'ct.nrrd'
+    path.write_bytes(header('raw') + data())
+    volume, directions, origin = read_nrrd(str(path))
+    assert isinstance(volume, np.memmap)
+    check(volume, directions, origin)
+
+def test_big_endian(tmp_path):
+    path = tmp_path / 'ct.nrrd'
+    path.write_bytes(header('raw', endian='big') + data(dtype='>i2'))
+    check(*read_nrrd(str(path)))
+
+def test_gzip(tmp_path):
+    path = tmp_path / 'ct.nrrd'
+    path.write_bytes(header('gzip') + gzip.compress(data()))
+    check(*read_nrrd(str(path)))
+
+def test_detached_data(tmp_path):
+    (tmp_path / 'ct.raw').write_bytes(data())
+    path = tmp_path / 'ct.nhdr'
+    path.write_bytes(header('raw', 'data file: ct.raw\n'))
+    volume, directions, origin = read_nrrd(str(path))
+    assert isinstance(volume, np.memmap)
+    check(volume, directions, origin)
+
+def test_unsupported_files(tmp_path):
+    path = tmp_path / 'ct.nrrd'
+    path.write_bytes(header('bzip2') + data())
+    with pytest.raises(ValueError):
+        read_nrrd(str(path))
+    path.write_bytes(b'P5\n' + data())
+    with pytest.raises(ValueError):
+        read_nrrd(str(path))
+
+def test_interpolation_of_single_voxel_axis():
+    volume = np.arange(20, dtype=np.float32).reshape(5, 4, 1)
+    index = np.array([[1.5, 2.0, 0.0], [0.0, 0.0, 0.3], [3.25, 1.5, -0.2], [4.0, 3.0, 0.0]])
+    np.testing.assert_allclose(trilinear_interpolation(volume, index), [8.0, 0.0, 14.5, 19.0])
@@ -0,0 +1,63 @@
+# Per element comparison of two decks, elements are joined on their IDs
+import numpy as np
+import main
+from decks import tet_grid, write_deck
+from Deck_Diff import diff_decks
+
+MODULI = [15000.0, 9000.0, 4000.0, 800.0]
+
+def test_identical_decks(tmp_path):
+    mesh = tet_grid()
+    file_a, file_b = str(tmp_path / 'a.inp'), str(tmp_path / 'b.inp')
+    write_deck(file_a, mesh, MODULI)
+    write_deck(file_b, mesh, MODULI, material_file=str(tmp_path / 'materials.inp'))
+    summary = diff_decks(file_a, file_b)
+    assert summary['elements'] == len(mesh[2])
+    assert (summary['only_a'], summary['only_b'], summary['changed_cards'], summary['changed_E_z']) == (0, 0, 0, 0)
+    assert summary['max_delta'] == 0 and summary['rmse'] == 0
+    assert summary['changed_materials'] == []
+
+def test_changed_card(tmp_path):
+    mesh = tet_grid()
+    layers = mesh[4]
+    file_a, file_b, output_file = str(tmp_path / 'a.inp'), str(tmp_path / 'b.inp'), str(tmp_path / 'diff.npz')
+    write_deck(file_a, mesh, MODULI)
+    write_deck(file_b, mesh, MODULI[:3] + [1000.0])
+    summary = diff_decks(file_a, file_b, output_file=output_file)
+    changed = int((layers == 3).sum())
+    assert summary['changed_cards'] == changed and summary['changed_E_z'] == changed
+    assert summary['max_delta'] == 200.0
+    assert summary['changed_materials'] == ['MAT_4']
+    saved = np.load(output_file)
+    np.testing.assert_array_equal(np.sort(saved['element_ids'][saved['changed_cards']]), np.sort(mesh[2][layers == 3]))
+    np.testing.assert_array_equal(saved['E_z_b'] - saved['E_z_a'], np.where(np.isin(saved['element_ids'], mesh[2][layers == 3]), 200.0, 0.0))
+
+def test_density_change_keeps_moduli(tmp_path):
+    mesh = tet_grid()
+    file_a, file_b = str(tmp_path / 'a.inp'), str(tmp_path / 'b.inp')
+    write_deck(file_a, mesh, MODULI)
+    write_deck(file_b, mesh, MODULI)
+    with open(file_b) as f:
+        text = f.read()
+    with open(file_b, 'w') as f:
+        f.write(text.replace("*Material, name=Mat_2\n*Density\n1.2e-09", "*Material, name=Mat_2\n*Density\n1.3e-09"))
+    summary = diff_decks(file_a, file_b)
+    assert summary['changed_cards'] == int((mesh[4] == 1).sum())
+    assert summary['changed_E_z'] == 0
+    assert summary['changed_materials'] == ['MAT_2']
+
+def test_finish_output_compares_before_renumbering(tmp_path, monkeypatch):
+    # The reference has the element IDs of the input mesh, the written deck is compared before it is renumbered
+    mesh = tet_grid()
+    reference, output_file = str(tmp_path / 'input.inp'), str(tmp_path / 'output.inp')
+    write_deck(reference, mesh, MODULI)
+    write_deck(output_file, mesh, MODULI)
+    summaries = []
+    monkeypatch.setattr(main, 'diff_decks', lambda file_a, file_b: summaries.append(diff_decks(file_a, file_b)))
+    monkeypatch.setattr(main, 'deck_diff_reference', reference)
+    monkeypatch.setattr(main, 'renumber_mesh_on', True)
+    monkeypatch.setattr(main, 'deck_check_on', False)
+    monkeypatch.setattr(main, 'element_export_on', False)
+    main.finish_output(output_file, None)
+    assert summaries[0]['elements'] == len(mesh[2]) and summaries[0]['changed_cards'] == 0
+    assert (tmp_path / 'output_Renumbering.npz').exists()
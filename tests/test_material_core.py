@@ -0,0 +1,80 @@
+# Material_Core against the per material formulas of Recalculate_HU.py and Calculate_Material_Parameters.py
+# before the NumPy core, the card values have to stay bit identical
+import math
+import numpy as np
+import pytest
+from config import Material_Config
+from Material_Core import MATERIAL_COLUMNS, material_arrays, recalculate_arrays
+
+E_Z = np.array([18250.3, 9876.54321, 4000.0, 1200.5, 250.0, 36.7, 1.0])
+
+class Offset_Config(Material_Config):
+    # E_z = 1 lies below a_Youngs, the base of the HU calculation is negative
+    a_Youngs = 5
+
+def baseline_hu(E, config):
+    rho_ash_BM = ((E - config.a_Youngs) / config.b_Youngs) ** (1 / config.c_Youngs)
+    rho_app_BM = (rho_ash_BM - config.a_Ash) / config.b_Ash
+    return (rho_app_BM - config.a_Qct) / config.b_Qct
+
+def baseline_recalculation(E_z, config):
+    rows = []
+    for E in E_z:
+        HU = baseline_hu(E, config)
+        Rho_app = config.a_Qct if HU <= 0 else config.a_Qct + config.b_Qct * HU
+        if HU > 0.0001:
+            E_recalculated = config.a_Youngs + config.b_Youngs * ((config.a_Ash + config.b_Ash * (config.a_Qct + config.b_Qct * HU)) ** config.c_Youngs)
+        else:
+            E_recalculated = 1
+        rows.append((HU, Rho_app, config.c_Ash * Rho_app, E_recalculated))
+    return {name: np.array(values, dtype=float) for name, values in zip(['HU', 'Rho_app [kg/m^3]', 'Rho_ash [g/cm^3]', 'E_z'], zip(*rows))}
+
+def baseline_material(E_z, config):
+    rows = []
+    for E in E_z:
+        HU = baseline_hu(E, config)
+        Rho_app = config.a_Qct if HU <= 0 else config.a_Qct + config.b_Qct * HU
+        Rho_ash = config.c_Ash * Rho_app
+        Sigma_min = config.a_Min_Stress * (Rho_ash ** config.b_Min_Stress)
+        E_p = config.a_Plastic_E * Rho_ash ** (config.b_Plastic_E)
+        Epsilon_ab = config.a_Plastic_Strain + config.b_Plastic_Strain * Rho_ash if Rho_ash >= config.threshold_Plastic_Strain else 0
+        if Rho_ash <= config.threshold_Plastic_Stress:
+            Sigma = config.a_Plastic_Stress * (Rho_ash ** config.b_Plastic_Stress)
+        else:
+            Sigma = config.c_Plastic_Stress * (Rho_ash ** config.d_Plastic_Stress)
+        Epsilon_a = Sigma / E
+        Epsilon_c = ((Sigma_min - Sigma) / E_p) + (Epsilon_a + Epsilon_ab)
+        x_2 = (-Epsilon_a + (Epsilon_ab + Epsilon_a)) + 1
+        x_3 = (Epsilon_c - Epsilon_a) + 1
+        rows.append({'HU': HU, 'Rho_app [kg/m^3]': Rho_app, 'Rho_ash [g/cm^3]': Rho_ash, 'Density [ton/mm^3]': Rho_app * 0.000000000001,
+                     'E_x': config.Scale_E_x * E, 'E_y': config.Scale_E_y * E, 'E_z': E, 'G_xy': config.Scale_G_xy * E,
+                     'G_xz': config.Scale_G_xz * E, 'G_yz': config.Scale_G_yz * E, 'V_xy': config.Ass_V_xy,
+                     'V_xz': config.Ass_V_xz, 'V_yz': config.Ass_V_yz, 'Sigma_min': Sigma_min, 'E_p': E_p,
+                     'Epsilon_ab': Epsilon_ab, 'Sigma': Sigma, 'Epsilon_a': Epsilon_a, 'Epsilon_c': Epsilon_c,
+                     'Yield Stress 1': (Epsilon_a + 1) * Sigma, 'Plastic strain 1': 0,
+                     'Yield Stress 2': (Epsilon_a + Epsilon_ab + 1) * Sigma, 'Plastic strain 2': math.log(x_2) if x_2 > 0 else np.nan,
+                     'Yield Stress 3': (Epsilon_c + 1) * Sigma_min, 'Plastic strain 3': np.log(x_3) if x_3 > 0 else np.nan})
+    return {name: np.array([row[name] for row in rows], dtype=float) for name in MATERIAL_COLUMNS}
+
+@pytest.mark.parametrize('config', [Material_Config, Offset_Config])
+def test_recalculation_matches_baseline(config):
+    # The baseline iterated over the float64 values of a DataFrame, negative bases gave NaN
+    with np.errstate(invalid='ignore'):
+        expected = baseline_recalculation(E_Z, config)
+    columns = recalculate_arrays(E_Z, config)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(columns[name], values, err_msg=name)
+
+@pytest.mark.parametrize('config', [Material_Config, Offset_Config])
+def test_material_columns_match_baseline(config):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = baseline_material(E_Z, config)
+    columns = material_arrays(E_Z, config)
+    for name in MATERIAL_COLUMNS:
+        np.testing.assert_array_equal(np.asarray(columns[name], dtype=float), expected[name], err_msg=name)
+
+def test_negative_base_gives_nan():
+    columns = material_arrays(E_Z, Offset_Config)
+    assert np.isnan(columns['HU'][-1])
+    assert np.isfinite(columns['HU'][:-1]).all()
+    assert recalculate_arrays(E_Z, Offset_Config)['E_z'][-1] == 1
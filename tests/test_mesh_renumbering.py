@@ -0,0 +1,66 @@
+# Renumbering followed by the deck check, the renumbered deck has to describe the same mesh and assignments
+import numpy as np
+from decks import tet_grid, write_deck
+from Deck_Check import check_deck, read_deck
+from Element_Volumes import read_mesh
+from Mesh_Renumbering import renumber_deck
+
+MODULI = [15000.0, 9000.0, 4000.0, 800.0]
+
+def element_sets(file_name):
+    parts, _, _ = read_deck(file_name)
+    return {name: np.sort(np.concatenate(ids)) for name, ids in parts[None]['elsets'].items()}
+
+def bandwidth(connectivity):
+    return int(np.max(connectivity.max(axis=1) - connectivity.min(axis=1)))
+
+def test_renumbered_deck_passes_check(tmp_path):
+    mesh = tet_grid()
+    input_file, output_file = str(tmp_path / 'grid.inp'), str(tmp_path / 'grid_renumbered.inp')
+    write_deck(input_file, mesh, MODULI)
+    assert check_deck(input_file) == []
+
+    renumbering = renumber_deck(input_file, output_file)
+    assert check_deck(output_file) == []
+    old_nodes, old_elements = renumbering['node_ids'], renumbering['element_ids']
+    saved = np.load(str(tmp_path / 'grid_renumbered_Renumbering.npz'))
+    np.testing.assert_array_equal(saved['node_ids'], old_nodes)
+
+    node_ids, coordinates, element_ids, connectivity = read_mesh(input_file)
+    new_node_ids, new_coordinates, new_element_ids, new_connectivity = read_mesh(output_file)
+    np.testing.assert_array_equal(np.sort(new_node_ids), np.arange(1, len(node_ids) + 1))
+    np.testing.assert_array_equal(np.sort(new_element_ids), np.arange(1, len(element_ids) + 1))
+    # Every new ID takes the coordinates and the nodes of its old ID
+    input_coordinates = dict(zip(node_ids.tolist(), map(tuple, coordinates)))
+    for new_id, point in zip(new_node_ids, new_coordinates):
+        assert input_coordinates[old_nodes[new_id - 1]] == tuple(point)
+    input_connectivity = dict(zip(element_ids.tolist(), map(tuple, connectivity)))
+    for new_id, nodes in zip(new_element_ids, new_connectivity):
+        assert input_connectivity[old_elements[new_id - 1]] == tuple(old_nodes[nodes - 1])
+    # Sets hold the same elements and the node numbering is banded
+    old_sets, new_sets = element_sets(input_file), element_sets(output_file)
+    assert old_sets.keys() == new_sets.keys()
+    for name, ids in new_sets.items():
+        np.testing.assert_array_equal(np.sort(old_elements[ids - 1]), old_sets[name])
+    assert bandwidth(new_connectivity) < bandwidth(connectivity)
+
+def test_renumbering_in_place_with_material_include(tmp_path):
+    input_file = str(tmp_path / 'grid.inp')
+    write_deck(input_file, tet_grid(), MODULI, material_file=str(tmp_path / 'materials.inp'))
+    assert renumber_deck(input_file, input_file) is not None
+    assert check_deck(input_file) == []
+
+def test_deck_with_other_include_is_copied_unchanged(tmp_path):
+    input_file, output_file = str(tmp_path / 'grid.inp'), str(tmp_path / 'grid_renumbered.inp')
+    with open(str(tmp_path / 'loads.inp'), 'w') as f:
+        f.write("*Nset, nset=Fixed\n101, 102\n")
+    write_deck(input_file, tet_grid(), MODULI, include='loads.inp')
+    assert renumber_deck(input_file, output_file) is None
+    with open(input_file, 'rb') as source, open(output_file, 'rb') as target:
+        assert source.read() == target.read()
+    assert not (tmp_path / 'grid_renumbered_Renumbering.npz').exists()
+
+def test_missing_include_is_not_renumbered(tmp_path):
+    input_file = str(tmp_path / 'grid.inp')
+    write_deck(input_file, tet_grid(), MODULI, include='missing.inp')
+    assert renumber_deck(input_file, str(tmp_path / 'out.inp')) is None